@@ -0,0 +1,75 @@
+"""
+Benchmark do arranque a frio de um worker
+
+Lança N processos Python novos e, em cada um, mede:
+  - import: importar src.main (bibliotecas + create_app da instância do módulo)
+  - create_app: criar uma segunda aplicação com a fábrica (custo por worker com --preload)
+  - 1.º pedido: primeiro pedido HTTP servido (GET /api/auth/check, sem sessão)
+  - processo: tempo total do processo, incluindo o arranque do interpretador
+
+Nenhuma destas etapas acede à base de dados; o URL configurado não precisa de estar acessível.
+
+Utilização:
+    python benchmarks/arranque_worker.py [--processos 10] [--alvo-ms 300]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODIGO_WORKER = """
+import json, sys, time
+inicio = time.perf_counter()
+sys.path.insert(0, {raiz!r})
+from src.main import create_app
+depois_import = time.perf_counter()
+app = create_app()
+depois_app = time.perf_counter()
+resposta = app.test_client().get('/api/auth/check')
+fim = time.perf_counter()
+print(json.dumps({{
+    'import': depois_import - inicio,
+    'create_app': depois_app - depois_import,
+    'primeiro_pedido': fim - depois_app,
+    'estado': resposta.status_code
+}}))
+"""
+
+def medir_worker():
+    inicio = time.perf_counter()
+    resultado = subprocess.run(
+        [sys.executable, '-c', CODIGO_WORKER.format(raiz=RAIZ)],
+        capture_output=True, text=True, cwd=RAIZ, check=True
+    )
+    medidas = json.loads(resultado.stdout.strip().splitlines()[-1])
+    medidas['processo'] = time.perf_counter() - inicio
+    return medidas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=10)
+    parser.add_argument('--alvo-ms', type=float, default=300)
+    args = parser.parse_args()
+
+    medidas = [medir_worker() for _ in range(args.processos)]
+
+    print(f"🚀 Arranque a frio em {args.processos} processos (ms)")
+    print(f"   {'etapa':<16}{'mín':>9}{'mediana':>9}{'máx':>9}")
+    for etapa in ('import', 'create_app', 'primeiro_pedido', 'processo'):
+        valores = [m[etapa] * 1000 for m in medidas]
+        print(f"   {etapa:<16}{min(valores):>9.1f}{statistics.median(valores):>9.1f}{max(valores):>9.1f}")
+
+    sem_preload = statistics.median(m['import'] + m['primeiro_pedido'] for m in medidas) * 1000
+    com_preload = statistics.median(m['create_app'] + m['primeiro_pedido'] for m in medidas) * 1000
+    for nome, valor in (('sem --preload', sem_preload), ('com --preload', com_preload)):
+        estado = '✅' if valor <= args.alvo_ms else '⚠️'
+        print(f"{estado} Worker {nome}: {valor:.1f} ms até servir o 1.º pedido (alvo {args.alvo_ms:.0f} ms)")
+
+if __name__ == '__main__':
+    main()
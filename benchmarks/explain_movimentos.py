@@ -0,0 +1,152 @@
+"""
+Benchmark dos índices de movimentos_stock
+
+Cria uma cópia de movimentos_stock no schema 'benchmark' de uma base PostgreSQL,
+preenche-a com N linhas sintéticas (5 milhões por omissão) e mostra os planos
+EXPLAIN (ANALYZE, BUFFERS) das consultas mais frequentes antes e depois de criar
+os índices declarados em MovimentoStock.__table_args__.
+
+Utilização:
+    python benchmarks/explain_movimentos.py [--linhas 5000000] [--manter]
+
+Usa as mesmas variáveis de ambiente que src/main.py (POSTGRES_USER, POSTGRES_PASSWORD,
+POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, text
+from src.models.sistema_models import MovimentoStock
+
+SCHEMA = 'benchmark'
+
+# Consultas representativas dos caminhos críticos (parâmetros fixos para planos comparáveis)
+CONSULTAS = {
+    'movimentos da instituição (listagem paginada)': """
+        SELECT * FROM benchmark.movimentos_stock
+        WHERE instituicao_id = 3 AND data >= now() - interval '30 days'
+        ORDER BY data DESC LIMIT 20
+    """,
+    'movimentos da instituição (página profunda por OFFSET)': """
+        SELECT * FROM benchmark.movimentos_stock
+        WHERE instituicao_id = 3
+        ORDER BY data DESC, id DESC OFFSET 200000 LIMIT 20
+    """,
+    'movimentos da instituição (página profunda por cursor)': """
+        SELECT * FROM benchmark.movimentos_stock
+        WHERE instituicao_id = 3 AND (data, id) < (now() - interval '600 days', 2500000)
+        ORDER BY data DESC, id DESC LIMIT 21
+    """,
+    'histórico de saídas do beneficiário (alertas)': """
+        SELECT sum(quantidade) FROM benchmark.movimentos_stock
+        WHERE beneficiario_nif = 'SV000123' AND item_id = 2
+          AND tipo_movimento = 'saida' AND data >= now() - interval '30 days'
+    """,
+    'ajudas do beneficiário por tipo e data': """
+        SELECT count(*) FROM benchmark.movimentos_stock
+        WHERE beneficiario_nif = 'SV000123' AND tipo_movimento = 'saida'
+          AND data >= now() - interval '7 days'
+    """,
+    'soma de saldo por item (reconciliação)': """
+        SELECT instituicao_id, sum(quantidade) FROM benchmark.movimentos_stock
+        WHERE item_id = 2 AND tipo_movimento = 'entrada'
+        GROUP BY instituicao_id
+    """,
+    'totais da instituição por tipo (dashboard)': """
+        SELECT tipo_movimento, sum(quantidade), count(DISTINCT beneficiario_nif)
+        FROM benchmark.movimentos_stock
+        WHERE instituicao_id = 3
+        GROUP BY tipo_movimento
+    """,
+}
+
+def construir_url():
+    load_dotenv()
+    return (
+        f"postgresql://{os.getenv('POSTGRES_USER', 'postgres')}:{os.getenv('POSTGRES_PASSWORD', '')}"
+        f"@{os.getenv('POSTGRES_HOST', 'localhost')}:{os.getenv('POSTGRES_PORT', '5432')}"
+        f"/{os.getenv('POSTGRES_DB', 'sistema_stock_sv')}"
+    )
+
+def construir_tabela():
+    """Cópia de movimentos_stock sem chaves estrangeiras, com os mesmos índices do modelo"""
+    metadata = MetaData(schema=SCHEMA)
+    origem = MovimentoStock.__table__
+
+    tabela = Table(
+        origem.name, metadata,
+        *[Column(c.name, c.type, primary_key=c.primary_key) for c in origem.columns]
+    )
+
+    indices = [
+        Index(indice.name, *[tabela.c[c.name] for c in indice.columns], **indice.dialect_kwargs)
+        for indice in origem.indexes
+    ]
+
+    return tabela, indices
+
+def semear(conn, linhas):
+    """Preenche a tabela com movimentos sintéticos: 20 instituições, 50 itens, 200 mil beneficiários"""
+    conn.execute(text(f"""
+        INSERT INTO {SCHEMA}.movimentos_stock
+            (id, item_id, instituicao_id, beneficiario_nif, tipo_movimento, quantidade, data, motivo)
+        SELECT
+            g,
+            1 + (g % 50),
+            1 + (g % 20),
+            CASE WHEN g % 3 = 0 THEN NULL ELSE 'SV' || lpad(((g * 7919) % 200000)::text, 6, '0') END,
+            CASE WHEN g % 3 = 0 THEN 'entrada' ELSE 'saida' END,
+            1 + (g % 10),
+            now() - ((g % 730) || ' days')::interval - ((g % 86400) || ' seconds')::interval,
+            'benchmark'
+        FROM generate_series(1, :linhas) AS g
+    """), {'linhas': linhas})
+    conn.execute(text(f"ANALYZE {SCHEMA}.movimentos_stock"))
+
+def mostrar_planos(conn, titulo):
+    print(f"\n{'=' * 20} {titulo} {'=' * 20}")
+    for nome, sql in CONSULTAS.items():
+        plano = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).scalars().all()
+        print(f"\n--- {nome}")
+        for linha in plano:
+            print(f"    {linha}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=5_000_000)
+    parser.add_argument('--manter', action='store_true', help='Não apagar o schema benchmark no fim')
+    args = parser.parse_args()
+
+    engine = create_engine(construir_url())
+    tabela, indices = construir_tabela()
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        tabela.create(conn)
+
+        inicio = time.perf_counter()
+        semear(conn, args.linhas)
+        print(f"📦 {args.linhas} movimentos criados em {time.perf_counter() - inicio:.1f}s")
+
+        mostrar_planos(conn, 'ANTES (apenas chave primária)')
+
+        inicio = time.perf_counter()
+        for indice in indices:
+            indice.create(conn)
+        conn.execute(text(f"ANALYZE {SCHEMA}.movimentos_stock"))
+        print(f"\n🔧 {len(indices)} índices criados em {time.perf_counter() - inicio:.1f}s")
+
+        mostrar_planos(conn, 'DEPOIS (índices de MovimentoStock)')
+
+        if not args.manter:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark da pesquisa de beneficiários (consulta_rapida)
+
+Com PostgreSQL: cria uma tabela beneficiarios no schema 'benchmark' com N linhas
+sintéticas (500 mil por omissão, repartidas por 20 instituições) e compara o tempo da
+pesquisa antiga (ILIKE '%termo%' em quatro colunas) com a pesquisa por trigramas
+(índice GIN pg_trgm + unaccent, as mesmas condições de PesquisaService).
+
+Com --memoria: mede o IndiceTrigramas em memória (usado sem pg_trgm) para o número
+de beneficiários de uma instituição, sem base de dados.
+
+Utilização:
+    python benchmarks/pesquisa_beneficiarios.py [--linhas 500000] [--manter]
+    python benchmarks/pesquisa_beneficiarios.py --memoria [--linhas 25000]
+
+Usa as mesmas variáveis de ambiente que src/main.py (POSTGRES_USER, POSTGRES_PASSWORD,
+POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB).
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from src.services.pesquisa_service import IndiceTrigramas, PesquisaService
+
+SCHEMA = 'benchmark'
+
+PRIMEIROS = ['José', 'Maria', 'António', 'Ana', 'João', 'Manuel', 'Francisca', 'Luís',
+             'Rita', 'Pedro', 'Sofia', 'Carlos', 'Inês', 'Rui', 'Teresa']
+APELIDOS = ['Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rodrigues', 'Martins',
+            'Gonçalves', 'Conceição', 'Sousa', 'Fernandes', 'Lopes', 'Marques', 'Alves', 'Ribeiro',
+            'Pinto', 'Carvalho', 'Teixeira', 'Moreira']
+ZONAS = ['Lisboa', 'Porto', 'Coimbra', 'Viseu', 'Braga', 'Faro', 'Évora', 'Setúbal']
+
+# Termos típicos de quem escreve na caixa de pesquisa (com e sem acentos, com erros)
+TERMOS = ['maria', 'goncalvez', 'conceicao silva', '200123456', 'jo', 'evora']
+
+INSTITUICAO = 3
+
+PESQUISA_ILIKE = f"""
+    SELECT nif, nome FROM {SCHEMA}.beneficiarios
+    WHERE instituicao_registro_id = :instituicao
+      AND (nome ILIKE :padrao OR nif ILIKE :padrao OR zona_residencia ILIKE :padrao OR contacto ILIKE :padrao)
+    LIMIT 10
+"""
+
+PESQUISA_TRIGRAMAS = f"""
+    SELECT nif, nome FROM {SCHEMA}.beneficiarios
+    WHERE instituicao_registro_id = :instituicao
+      AND (texto_pesquisa_beneficiario(nome, nif, zona_residencia, contacto) LIKE :padrao
+           OR texto_pesquisa_beneficiario(nome, nif, zona_residencia, contacto) %> :termo)
+    ORDER BY texto_pesquisa_beneficiario(nome, nif, zona_residencia, contacto) LIKE :padrao DESC,
+             word_similarity(:termo, f_unaccent(lower(nome))) DESC, nome, nif
+    LIMIT 10
+"""
+
+def construir_url():
+    from dotenv import load_dotenv
+    load_dotenv()
+    return (
+        f"postgresql://{os.getenv('POSTGRES_USER', 'postgres')}:{os.getenv('POSTGRES_PASSWORD', '')}"
+        f"@{os.getenv('POSTGRES_HOST', 'localhost')}:{os.getenv('POSTGRES_PORT', '5432')}"
+        f"/{os.getenv('POSTGRES_DB', 'sistema_stock_sv')}"
+    )
+
+def gerar_registos(linhas):
+    aleatorio = random.Random(42)
+    return [
+        (
+            f'{200000000 + i}',
+            f'{aleatorio.choice(PRIMEIROS)} {aleatorio.choice(APELIDOS)} {aleatorio.choice(APELIDOS)}',
+            aleatorio.choice(ZONAS),
+            f'9{aleatorio.randint(10_000_000, 99_999_999)}'
+        )
+        for i in range(linhas)
+    ]
+
+def medir(funcao, repeticoes=20):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000, resultado
+
+def benchmark_memoria(linhas):
+    registos = gerar_registos(linhas)
+    inicio = time.perf_counter()
+    indice = IndiceTrigramas(registos)
+    print(f"📦 Índice em memória de {linhas} beneficiários construído em {time.perf_counter() - inicio:.2f}s")
+
+    for termo in TERMOS:
+        normalizado = PesquisaService.normalizar(termo)
+        ms, nifs = medir(lambda: indice.pesquisar(normalizado, 10))
+        print(f"   {termo:<20}{ms:>8.1f} ms  {len(nifs)} resultados")
+
+def semear(conn, linhas):
+    registos = gerar_registos(linhas)
+    conn.execute(
+        text(f"""
+            INSERT INTO {SCHEMA}.beneficiarios (nif, nome, zona_residencia, contacto, instituicao_registro_id)
+            VALUES (:nif, :nome, :zona, :contacto, :instituicao)
+        """),
+        [
+            {'nif': nif, 'nome': nome, 'zona': zona, 'contacto': contacto, 'instituicao': 1 + i % 20}
+            for i, (nif, nome, zona, contacto) in enumerate(registos)
+        ]
+    )
+    conn.execute(text(f"ANALYZE {SCHEMA}.beneficiarios"))
+
+def benchmark_postgresql(linhas, manter):
+    engine = create_engine(construir_url())
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"""
+            CREATE TABLE {SCHEMA}.beneficiarios (
+                nif varchar(20) PRIMARY KEY, nome varchar(100) NOT NULL,
+                zona_residencia varchar(50), contacto varchar(20), instituicao_registro_id integer
+            )
+        """))
+
+        inicio = time.perf_counter()
+        semear(conn, linhas)
+        print(f"📦 {linhas} beneficiários criados em {time.perf_counter() - inicio:.1f}s")
+
+        # Extensões e funções de PesquisaService; o índice é criado na cópia do schema benchmark
+        for instrucao in PesquisaService.DDL_POSTGRESQL[:-1]:
+            conn.execute(text(instrucao))
+        conn.execute(text(f"""
+            CREATE INDEX ON {SCHEMA}.beneficiarios (instituicao_registro_id, nome, nif)
+        """))
+        conn.execute(text(f"""
+            CREATE INDEX ON {SCHEMA}.beneficiarios
+            USING gin (texto_pesquisa_beneficiario(nome, nif, zona_residencia, contacto) gin_trgm_ops)
+        """))
+        conn.execute(text(f"ANALYZE {SCHEMA}.beneficiarios"))
+
+        print(f"\n{'termo':<20}{'ILIKE':>12}{'trigramas':>12}")
+        for termo in TERMOS:
+            normalizado = PesquisaService.normalizar(termo)
+            parametros = {'instituicao': INSTITUICAO, 'termo': normalizado, 'padrao': f'%{normalizado}%'}
+            ms_ilike, _ = medir(lambda: conn.execute(
+                text(PESQUISA_ILIKE), dict(parametros, padrao=f'%{termo}%')
+            ).all())
+            ms_trigramas, _ = medir(lambda: conn.execute(text(PESQUISA_TRIGRAMAS), parametros).all())
+            print(f"{termo:<20}{ms_ilike:>9.1f} ms{ms_trigramas:>9.1f} ms")
+
+        plano = conn.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS) {PESQUISA_TRIGRAMAS}"),
+            {'instituicao': INSTITUICAO, 'termo': 'goncalvez', 'padrao': '%goncalvez%'}
+        ).scalars().all()
+        print("\n--- plano da pesquisa por trigramas ('goncalvez')")
+        for linha in plano:
+            print(f"    {linha}")
+
+        if not manter:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=None,
+                        help='Beneficiários (500000 em PostgreSQL, 25000 com --memoria)')
+    parser.add_argument('--memoria', action='store_true', help='Medir o índice em memória, sem base de dados')
+    parser.add_argument('--manter', action='store_true', help='Não apagar o schema benchmark no fim')
+    args = parser.parse_args()
+
+    if args.memoria:
+        benchmark_memoria(args.linhas or 25_000)
+    else:
+        benchmark_postgresql(args.linhas or 500_000, args.manter)
+
+if __name__ == '__main__':
+    main()
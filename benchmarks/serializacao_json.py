@@ -0,0 +1,106 @@
+"""
+Benchmark da serialização JSON de um relatório com 10 mil movimentos
+
+Compara o tempo de gerar a resposta jsonify de um relatório de movimentos:
+  - antes: datas pré-formatadas com isoformat() no to_dict + fornecedor JSON predefinido do Flask
+  - json padrão: datas nativas + JSONProviderRapido sem orjson
+  - orjson: datas nativas + JSONProviderRapido com orjson (se instalado)
+
+Não usa base de dados: as linhas são sintéticas, com as colunas de MovimentoStock.consulta_linhas().
+
+Utilização:
+    python benchmarks/serializacao_json.py [--movimentos 10000] [--repeticoes 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from src import json_provider
+from src.json_provider import JSONProviderRapido
+from src.models.sistema_models import MovimentoStock
+
+Linha = namedtuple('Linha', [
+    'id', 'item_id', 'item_nome', 'item_unidade', 'instituicao_id', 'instituicao_nome',
+    'beneficiario_nif', 'beneficiario_nome', 'tipo_movimento', 'quantidade', 'data',
+    'motivo', 'observacoes', 'origem_doacao', 'local_entrega'
+])
+
+def gerar_linhas(total):
+    agora = datetime(2024, 8, 11, 12, 0, 0)
+    return [
+        Linha(
+            i, 1 + i % 14, f'Item {i % 14}', 'kg', 1 + i % 5, f'Instituição {i % 5}',
+            f'SV{i % 2000:06d}', f'Beneficiário {i % 2000}',
+            'saida' if i % 3 else 'entrada', float(1 + i % 10),
+            agora - timedelta(minutes=i * 7, microseconds=i),
+            'Distribuição semanal', '', 'Doação particular', 'Sede'
+        )
+        for i in range(total)
+    ]
+
+def relatorio(movimentos):
+    return {'success': True, 'total': len(movimentos), 'movimentos': movimentos}
+
+def medir(app, construir, repeticoes):
+    tempos = []
+    with app.app_context():
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resposta = app.json.response(construir())
+            resposta.get_data()
+            tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000, len(resposta.get_data())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movimentos', type=int, default=10_000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    linhas = gerar_linhas(args.movimentos)
+
+    def com_isoformat():
+        movimentos = []
+        for linha in linhas:
+            movimento = MovimentoStock.linha_to_dict(linha)
+            movimento['data'] = movimento['data'].isoformat()
+            movimentos.append(movimento)
+        return relatorio(movimentos)
+
+    def nativo():
+        return relatorio([MovimentoStock.linha_to_dict(linha) for linha in linhas])
+
+    app_antes = Flask('antes')
+    app_antes.json = DefaultJSONProvider(app_antes)
+
+    app_rapido = Flask('rapido')
+    app_rapido.json = JSONProviderRapido(app_rapido)
+
+    orjson = json_provider.orjson
+    resultados = [('antes (isoformat + json predefinido)', medir(app_antes, com_isoformat, args.repeticoes))]
+
+    json_provider.orjson = None
+    resultados.append(('JSONProviderRapido (json padrão)', medir(app_rapido, nativo, args.repeticoes)))
+    json_provider.orjson = orjson
+
+    if orjson is not None:
+        resultados.append(('JSONProviderRapido (orjson)', medir(app_rapido, nativo, args.repeticoes)))
+    else:
+        print("⚠️ orjson não instalado: apenas o caminho com json padrão foi medido")
+
+    base = resultados[0][1][0]
+    print(f"📦 Relatório com {args.movimentos} movimentos (mediana de {args.repeticoes} repetições)")
+    for nome, (ms, tamanho) in resultados:
+        print(f"   {nome:<40}{ms:>9.1f} ms  {tamanho / 1024:>8.0f} KiB  x{base / ms:.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Comandos de manutenção do sistema (flask --app src.main <comando>)
+"""
+
+import click
+from src.models.sistema_models import db, Instituicao, init_dados_exemplo
+from src.services.importacao_service import ImportacaoService
+from src.routes.auth import create_admin_user
+from src.services.saldo_service import SaldoService
+from src.services.movimentos_diarios_service import MovimentosDiariosService
+from src.services.estaticos_service import EstaticosService, brotli
+from src.services.pesquisa_service import PesquisaService
+
+def registar_comandos(app):
+    """Regista os comandos de linha de comandos na aplicação"""
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Cria as tabelas em falta e a conta de administrador"""
+        db.create_all()
+        click.echo("✅ Tabelas criadas/verificadas com sucesso!")
+        if not create_admin_user():
+            raise SystemExit(1)
+
+    @app.cli.command('seed')
+    def seed():
+        """Cria as instituições e itens de exemplo se ainda não existirem"""
+        init_dados_exemplo()
+
+    @app.cli.command('reconciliar-saldos')
+    @click.option('--apenas-verificar', is_flag=True,
+                  help='Apenas reporta divergências, sem reconstruir saldos_stock')
+    def reconciliar_saldos(apenas_verificar):
+        """Reconstrói saldos_stock a partir dos movimentos e reporta divergências"""
+        resultado = SaldoService.reconciliar(corrigir=not apenas_verificar)
+
+        if not resultado['sucesso']:
+            click.echo(f"❌ {resultado['erro']}")
+            raise SystemExit(1)
+
+        divergencias = resultado['divergencias']
+        if not divergencias:
+            click.echo("✅ Saldos consistentes com o registo de movimentos")
+        else:
+            click.echo(f"⚠️ {len(divergencias)} saldo(s) divergente(s):")
+            for d in divergencias:
+                click.echo(
+                    f"   Item {d['item_id']} / Instituição {d['instituicao_id']}: "
+                    f"entradas {d['entradas_registadas']} → {d['entradas_movimentos']}, "
+                    f"saídas {d['saidas_registadas']} → {d['saidas_movimentos']}"
+                )
+
+        if resultado['corrigido']:
+            click.echo("✅ Tabela saldos_stock reconstruída")
+
+    @app.cli.command('reconstruir-movimentos-diarios')
+    def reconstruir_movimentos_diarios():
+        """Reconstrói movimentos_diarios (totais diários e esboços de beneficiários) a partir dos movimentos"""
+        resultado = MovimentosDiariosService.reconstruir()
+
+        if not resultado['sucesso']:
+            click.echo(f"❌ {resultado['erro']}")
+            raise SystemExit(1)
+
+        click.echo(f"✅ Tabela movimentos_diarios reconstruída ({resultado['linhas']} linha(s))")
+
+    @app.cli.command('criar-indices')
+    def criar_indices():
+        """Cria os índices declarados nos modelos que ainda não existem na base de dados"""
+        for tabela in db.metadata.sorted_tables:
+            for indice in tabela.indexes:
+                indice.create(bind=db.engine, checkfirst=True)
+                click.echo(f"✅ {tabela.name}.{indice.name}")
+
+        # Pesquisa de beneficiários por trigramas (pg_trgm + unaccent), apenas em PostgreSQL
+        if db.engine.dialect.name == 'postgresql':
+            try:
+                PesquisaService.criar_estrutura_postgresql()
+                click.echo(f"✅ beneficiarios.{PesquisaService.NOME_INDICE} (pg_trgm)")
+            except Exception as e:
+                click.echo(f"⚠️ Pesquisa por trigramas indisponível, será usado o índice em memória: {str(e)}")
+
+    @app.cli.command('criar-admin')
+    def criar_admin():
+        """Cria a conta de administrador se ainda não existir"""
+        if not create_admin_user():
+            raise SystemExit(1)
+        click.echo("✅ Conta de administrador verificada")
+
+    @app.cli.command('importar-entradas')
+    @click.argument('ficheiro', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--instituicao', 'username', required=True,
+                  help='Username da instituição que recebe as doações')
+    @click.option('--parcial', is_flag=True,
+                  help='Regista as linhas válidas mesmo que existam linhas rejeitadas')
+    @click.option('--tamanho-bloco', default=ImportacaoService.TAMANHO_BLOCO, show_default=True,
+                  help='Linhas lidas e inseridas de cada vez')
+    def importar_entradas(ficheiro, username, parcial, tamanho_bloco):
+        """Importa entradas de stock de um ficheiro CSV/XLSX"""
+        formato = ImportacaoService.detetar_formato(ficheiro)
+        if not formato:
+            click.echo("❌ Formato não suportado (use .csv ou .xlsx)")
+            raise SystemExit(1)
+
+        instituicao = Instituicao.query.filter_by(username=username).first()
+        if not instituicao:
+            click.echo(f"❌ Instituição '{username}' não encontrada")
+            raise SystemExit(1)
+
+        resultado = ImportacaoService.importar_entradas(
+            ficheiro, formato, instituicao.id,
+            'parcial' if parcial else 'atomico', tamanho_bloco
+        )
+
+        if 'linhas_lidas' not in resultado:
+            click.echo(f"❌ {resultado['erro']}")
+            raise SystemExit(1)
+
+        for erro in resultado['erros']:
+            click.echo(f"   Linha {erro['linha']}: {erro['erro']}")
+        if resultado['erros_truncados']:
+            click.echo(f"   ... (mostradas {len(resultado['erros'])} de {resultado['rejeitadas']} linhas rejeitadas)")
+
+        if 'erro' in resultado:
+            click.echo(f"❌ {resultado['erro']}")
+            raise SystemExit(1)
+
+        click.echo(
+            f"{'✅' if resultado['sucesso'] else '⚠️'} {resultado['registadas']} de "
+            f"{resultado['linhas_lidas']} entradas registadas ({resultado['rejeitadas']} rejeitadas)"
+        )
+        if not resultado['sucesso']:
+            raise SystemExit(1)
+
+    @app.cli.command('importar-beneficiarios')
+    @click.argument('ficheiro', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--instituicao', 'username', required=True,
+                  help='Username da instituição que regista os beneficiários')
+    @click.option('--atualizar', is_flag=True,
+                  help='Atualiza os beneficiários já registados pela mesma instituição')
+    @click.option('--tamanho-bloco', default=ImportacaoService.TAMANHO_BLOCO, show_default=True,
+                  help='Linhas lidas e gravadas de cada vez')
+    def importar_beneficiarios(ficheiro, username, atualizar, tamanho_bloco):
+        """Importa beneficiários de um ficheiro CSV/XLSX (NIFs repetidos são ignorados)"""
+        formato = ImportacaoService.detetar_formato(ficheiro)
+        if not formato:
+            click.echo("❌ Formato não suportado (use .csv ou .xlsx)")
+            raise SystemExit(1)
+
+        instituicao = Instituicao.query.filter_by(username=username).first()
+        if not instituicao:
+            click.echo(f"❌ Instituição '{username}' não encontrada")
+            raise SystemExit(1)
+
+        resultado = ImportacaoService.importar_beneficiarios(
+            ficheiro, formato, instituicao.id, atualizar, tamanho_bloco
+        )
+
+        if 'linhas_lidas' not in resultado:
+            click.echo(f"❌ {resultado['erro']}")
+            raise SystemExit(1)
+
+        for linha in resultado['linhas']:
+            if linha['erro']:
+                click.echo(f"   Linha {linha['linha']} ({linha['nif'] or 'sem NIF'}): {linha['erro']}")
+
+        click.echo(f"📋 {resultado['linhas_lidas']} linhas lidas:")
+        for estado, total in resultado['totais'].items():
+            if total:
+                click.echo(f"   {estado}: {total}")
+
+        if 'erro' in resultado:
+            click.echo(f"❌ {resultado['erro']}")
+            raise SystemExit(1)
+
+    @app.cli.command('comprimir-estaticos')
+    def comprimir_estaticos():
+        """Pré-comprime os ficheiros da interface (gzip e, se disponível, brotli) para o arranque"""
+        if brotli is None:
+            click.echo("⚠️ Módulo brotli não instalado: apenas variantes gzip")
+
+        manifesto = EstaticosService.construir_manifesto(app.static_folder, comprimir_brotli=True)
+        gravados = EstaticosService.escrever_variantes(manifesto)
+
+        for entrada in manifesto['ficheiros'].values():
+            tamanhos = ', '.join(f"{c} {len(d)}" for c, d in entrada['variantes'].items())
+            click.echo(f"   {entrada['nome_hash']}: {len(entrada['conteudo'] or b'')} bytes" + (f" ({tamanhos})" if tamanhos else ''))
+        click.echo(f"✅ {gravados} variantes comprimidas gravadas em {EstaticosService.PASTA_COMPRIMIDOS}/")
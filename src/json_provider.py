@@ -0,0 +1,77 @@
+"""
+Fornecedor JSON da aplicação (app.json, usado por jsonify)
+Usa orjson quando instalado; caso contrário recorre ao módulo json da biblioteca padrão
+"""
+
+import dataclasses
+import decimal
+import enum
+import uuid
+from datetime import date, datetime, time
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional: sem ele usa-se o json da biblioteca padrão
+    orjson = None
+
+def converter_valor(valor):
+    """
+    Converte valores que o JSON não representa diretamente
+
+    Datas em ISO 8601 (o mesmo formato que os to_dict usavam com isoformat()),
+    Decimal como número, Enum pelo seu valor.
+    """
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return float(valor)
+    if isinstance(valor, enum.Enum):
+        return valor.value
+    if isinstance(valor, uuid.UUID):
+        return str(valor)
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    if dataclasses.is_dataclass(valor) and not isinstance(valor, type):
+        return dataclasses.asdict(valor)
+    if hasattr(valor, '__html__'):
+        return str(valor.__html__())
+    raise TypeError(f'Objeto do tipo {type(valor).__name__} não é serializável em JSON')
+
+class JSONProviderRapido(DefaultJSONProvider):
+    """
+    Fornecedor JSON com serialização nativa de datetime, Decimal e Enum
+
+    Mantém o comportamento do fornecedor predefinido (chaves ordenadas, indentação em
+    modo debug, newline final), mas gera os bytes da resposta diretamente com orjson.
+    """
+
+    default = staticmethod(converter_valor)
+
+    def _opcoes_orjson(self, indentar=False):
+        opcoes = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            opcoes |= orjson.OPT_SORT_KEYS
+        if indentar:
+            opcoes |= orjson.OPT_INDENT_2
+        return opcoes
+
+    def dumps(self, obj, **kwargs):
+        # Argumentos específicos do json padrão (indent, separators...) usam o caminho original
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=converter_valor, option=self._opcoes_orjson()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = self.compact is False or (self.compact is None and self._app.debug)
+        dados = orjson.dumps(obj, default=converter_valor, option=self._opcoes_orjson(indentar))
+        return self._app.response_class(dados + b'\n', mimetype=self.mimetype)
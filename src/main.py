@@ -2,27 +2,24 @@ import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from src.models.sistema_models import db, init_dados_exemplo
-from src.routes.auth import auth_bp
+from src.routes.auth import auth_bp, create_admin_user
 from src.routes.beneficiarios import beneficiarios_bp
 from src.routes.stock import stock_bp
 from src.routes.dashboard import dashboard_bp
 from src.routes.relatorios import relatorios_bp
 from src.routes.alertas import alertas_bp
+from src.cli import registar_comandos
+from src.services.estaticos_service import EstaticosService
+from src.services.compressao_service import CompressaoService
+from src.json_provider import JSONProviderRapido
 from dotenv import load_dotenv
 
 # ========== CARREGAR VARIÁVEIS DO .ENV ==========
 # Procura o arquivo .env na raiz do projeto
 load_dotenv()
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-
-# ========== CONFIGURAÇÕES DO SISTEMA ==========
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
-app.config['FLASK_ENV'] = os.getenv('FLASK_ENV', 'production')
-app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
-
 # ========== CONFIGURAÇÃO POSTGRESQL LOCAL ==========
 # Lê as variáveis do arquivo .env
 POSTGRES_USER = os.getenv('POSTGRES_USER', 'postgres')
@@ -33,63 +30,112 @@ POSTGRES_DB = os.getenv('POSTGRES_DB', 'sistema_stock_sv')
 
 # Monta a string de conexão
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-
-# Configurações adicionais
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_size': 10,
-    'pool_recycle': 3600,
-    'pool_pre_ping': True,
-}
-
-# ==================================================
-
-db.init_app(app)
-
-# Registar blueprints
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(beneficiarios_bp, url_prefix='/api/beneficiarios')
-app.register_blueprint(stock_bp, url_prefix='/api/stock')
-app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
-app.register_blueprint(alertas_bp, url_prefix='/api/alertas')
-app.register_blueprint(relatorios_bp, url_prefix='/api/relatorios')
 
-# Inicializar a base de dados
-with app.app_context():
-    try:
-        db.create_all()
-        print("✅ Tabelas criadas/verificadas com sucesso!")
-        
-        # Inicializar dados de exemplo
-        init_dados_exemplo()
-        print("✅ Dados de exemplo verificados/criados!")
-        
-        # Mostrar info da conexão (sem a password)
-        print(f"📊 Conectado ao PostgreSQL: {POSTGRES_USER}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
-        
-    except Exception as e:
-        print(f"❌ Erro ao conectar ao PostgreSQL: {e}")
-        print("💡 Verifica se:")
-        print("   1. O PostgreSQL está rodando (services.msc → PostgreSQL)")
-        print("   2. As credenciais no .env estão corretas")
-        print("   3. A base de dados 'sistema_stock_sv' existe (cria no pgAdmin)")
+def create_app(config=None):
+    """
+    Cria e configura a aplicação Flask
+    
+    Não faz qualquer acesso à base de dados: as tabelas, os dados de exemplo e a
+    conta admin são preparados com 'flask init-db' e 'flask seed'.
+    
+    Args:
+        config (dict): Configurações que substituem as predefinidas (opcional)
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    
+    # jsonify com orjson (se instalado) e datas/Decimal/Enum serializados nativamente
+    app.json = JSONProviderRapido(app)
+    
+    # ========== CONFIGURAÇÕES DO SISTEMA ==========
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
+    app.config['FLASK_ENV'] = os.getenv('FLASK_ENV', 'production')
+    app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    
+    # Tamanho mínimo (bytes) das respostas da API a comprimir
+    app.config['COMPRESSAO_LIMIAR_BYTES'] = int(os.getenv('COMPRESSAO_LIMIAR_BYTES', '1024'))
+    
+    # Segundos que as linhas das instituições ficam em cache no processo (0 desativa)
+    app.config['CACHE_INSTITUICOES_TTL'] = int(os.getenv('CACHE_INSTITUICOES_TTL', '30'))
+    
+    # Segundos de validade dos totais em cache das listagens de beneficiários e históricos (0 desativa)
+    app.config['CACHE_CONTAGENS_TTL'] = int(os.getenv('CACHE_CONTAGENS_TTL', '300'))
+    
+    # Segundos de validade do catálogo de itens em memória (alterações feitas noutros processos; 0 desativa)
+    app.config['CACHE_CATALOGO_TTL'] = int(os.getenv('CACHE_CATALOGO_TTL', '300'))
+    
+    # Segundos entre atualizações das fotografias do dashboard em segundo plano (0: calcular no pedido)
+    app.config['DASHBOARD_INTERVALO_ATUALIZACAO'] = int(os.getenv('DASHBOARD_INTERVALO_ATUALIZACAO', '30'))
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    
+    # Configurações adicionais
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': 10,
+        'pool_recycle': 3600,
+        'pool_pre_ping': True,
+    }
+    
+    if config:
+        app.config.update(config)
+    
+    # ==================================================
+    
+    db.init_app(app)
+    
+    # Registar blueprints
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(beneficiarios_bp, url_prefix='/api/beneficiarios')
+    app.register_blueprint(stock_bp, url_prefix='/api/stock')
+    app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
+    app.register_blueprint(alertas_bp, url_prefix='/api/alertas')
+    app.register_blueprint(relatorios_bp, url_prefix='/api/relatorios')
+    
+    # Compressão gzip/brotli das respostas JSON da API (acima de COMPRESSAO_LIMIAR_BYTES)
+    CompressaoService.registar(app)
+    
+    # Comandos de manutenção (flask --app src.main <comando>)
+    registar_comandos(app)
+    
+    # Manifesto dos ficheiros da interface (nomes com hash, gzip/br, ETags)
+    app.extensions['estaticos'] = EstaticosService.construir_manifesto(app.static_folder)
+    
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        # Em modo debug reconstrói o manifesto para refletir ficheiros alterados
+        if app.debug:
+            app.extensions['estaticos'] = EstaticosService.construir_manifesto(app.static_folder)
+        return EstaticosService.servir(app.extensions['estaticos'], path)
+    
+    return app
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
+def inicializar_base_dados(app):
+    """Cria as tabelas, os dados de exemplo e a conta admin (desenvolvimento: python src/main.py)"""
+    with app.app_context():
+        try:
+            db.create_all()
+            print("✅ Tabelas criadas/verificadas com sucesso!")
+            
+            # Inicializar dados de exemplo
+            init_dados_exemplo()
+            print("✅ Dados de exemplo verificados/criados!")
+            
+            create_admin_user()
+            
+            # Mostrar info da conexão (sem a password)
+            print(f"📊 Conectado ao PostgreSQL: {POSTGRES_USER}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+            
+        except Exception as e:
+            print(f"❌ Erro ao conectar ao PostgreSQL: {e}")
+            print("💡 Verifica se:")
+            print("   1. O PostgreSQL está rodando (services.msc → PostgreSQL)")
+            print("   2. As credenciais no .env estão corretas")
+            print("   3. A base de dados 'sistema_stock_sv' existe (cria no pgAdmin)")
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+# Instância usada por 'flask --app src.main' e por servidores WSGI (src.main:app)
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=app.config['DEBUG'])
\ No newline at end of file
+    inicializar_base_dados(app)
+    app.run(host='0.0.0.0', port=5000, debug=app.config['DEBUG'])
@@ -76,17 +76,14 @@ class AlertasSistema:
                 resultado['alertas'].append('Item ou beneficiário não encontrado')
                 return resultado
             
-            # Verificar categoria do item
-            categoria = item.categoria.lower()
-            nome_item = item.nome.lower()
-            
             # Buscar configurações para esta categoria
-            config_categoria = AlertasSistema.LIMITES_CATEGORIA.get(categoria)
-            if not config_categoria:
+            limites = AlertasSistema.obter_limites_item(item.categoria, item.nome)
+            if not limites:
                 # Se não há limites definidos, permitir
                 return resultado
             
-            periodo_dias = config_categoria['periodo_dias']
+            categoria = item.categoria.lower()
+            periodo_dias = limites['periodo_dias']
             data_limite = datetime.utcnow() - timedelta(days=periodo_dias)
             
             # Buscar histórico recente do beneficiário para este item
@@ -99,39 +96,6 @@ class AlertasSistema:
             
             # Calcular quantidade já recebida
             quantidade_recebida = sum(mov.quantidade for mov in historico_item)
-            quantidade_total = quantidade_recebida + quantidade_nova
-            
-            # Verificar limites específicos do item
-            limites_item = config_categoria.get('quantidade_maxima', {})
-            
-            # Procurar limite para este item específico
-            limite_especifico = None
-            for nome_limite, valor_limite in limites_item.items():
-                if nome_limite in nome_item:
-                    limite_especifico = valor_limite
-                    break
-            
-            if limite_especifico and quantidade_total > limite_especifico:
-                resultado['alertas'].append(
-                    f'⚠️ ALERTA: {beneficiario.nome} já recebeu {quantidade_recebida}{item.unidade} '
-                    f'de {item.nome} nos últimos {periodo_dias} dias. '
-                    f'Com esta distribuição ({quantidade_nova}{item.unidade}), '
-                    f'totalizará {quantidade_total}{item.unidade}, '
-                    f'excedendo o limite recomendado de {limite_especifico}{item.unidade}.'
-                )
-                
-                # Sugerir quantidade alternativa
-                quantidade_sugerida = max(0, limite_especifico - quantidade_recebida)
-                if quantidade_sugerida > 0:
-                    resultado['sugestoes'].append(
-                        f'💡 Sugestão: Distribuir apenas {quantidade_sugerida}{item.unidade} '
-                        f'de {item.nome} para não exceder o limite.'
-                    )
-                else:
-                    resultado['sugestoes'].append(
-                        f'💡 Sugestão: Considerar distribuir outro item da categoria {categoria} '
-                        f'ou aguardar alguns dias antes de nova distribuição.'
-                    )
             
             # Verificar distribuições muito frequentes (mesmo item em poucos dias)
             historico_recente = MovimentoStock.query.filter(
@@ -141,12 +105,6 @@ class AlertasSistema:
                 MovimentoStock.data >= datetime.utcnow() - timedelta(days=7)
             ).count()
             
-            if historico_recente > 0:
-                resultado['alertas'].append(
-                    f'📅 ATENÇÃO: {beneficiario.nome} já recebeu {item.nome} '
-                    f'nos últimos 7 dias. Verificar se é realmente necessário.'
-                )
-            
             # Verificar se beneficiário recebeu muitos itens recentemente
             total_recente = MovimentoStock.query.filter(
                 MovimentoStock.beneficiario_nif == beneficiario_nif,
@@ -154,21 +112,17 @@ class AlertasSistema:
                 MovimentoStock.data >= datetime.utcnow() - timedelta(days=7)
             ).count()
             
-            if total_recente >= 5:
-                resultado['alertas'].append(
-                    f'📊 DISTRIBUIÇÃO FREQUENTE: {beneficiario.nome} já recebeu '
-                    f'{total_recente} itens nos últimos 7 dias. '
-                    f'Considerar priorizar outros beneficiários.'
-                )
+            alertas, sugestoes = AlertasSistema.gerar_alertas(
+                beneficiario.nome, item, limites, quantidade_nova,
+                quantidade_recebida, historico_recente, total_recente
+            )
+            resultado['alertas'].extend(alertas)
+            resultado['sugestoes'].extend(sugestoes)
             
             # Buscar beneficiários com menos ajuda para sugerir
-            beneficiarios_menos_ajuda = AlertasSistema.buscar_beneficiarios_menos_ajuda(categoria, 5)
-            if beneficiarios_menos_ajuda:
-                nomes = [b['nome'] for b in beneficiarios_menos_ajuda[:3]]
-                resultado['sugestoes'].append(
-                    f'🎯 Considerar priorizar: {", ".join(nomes)} '
-                    f'(receberam menos itens de {categoria} recentemente)'
-                )
+            sugestao = AlertasSistema.sugestao_priorizar(categoria)
+            if sugestao:
+                resultado['sugestoes'].append(sugestao)
             
             return resultado
             
@@ -177,6 +131,110 @@ class AlertasSistema:
             resultado['alertas'].append(f'Erro ao verificar distribuição: {str(e)}')
             return resultado
     
+    @staticmethod
+    def obter_limites_item(categoria, nome_item):
+        """
+        Obtém o período e o limite configurados para um item
+        
+        Returns:
+            dict: {'periodo_dias': int, 'limite': float ou None} ou None se a categoria não tem limites
+        """
+        if not categoria:
+            return None
+        
+        config_categoria = AlertasSistema.LIMITES_CATEGORIA.get(categoria.lower())
+        if not config_categoria:
+            return None
+        
+        # Procurar limite para este item específico
+        limite_especifico = None
+        nome_item = (nome_item or '').lower()
+        for nome_limite, valor_limite in config_categoria.get('quantidade_maxima', {}).items():
+            if nome_limite in nome_item:
+                limite_especifico = valor_limite
+                break
+        
+        return {
+            'periodo_dias': config_categoria['periodo_dias'],
+            'limite': limite_especifico
+        }
+    
+    @staticmethod
+    def gerar_alertas(beneficiario_nome, item, limites, quantidade_nova,
+                      quantidade_recebida, historico_recente, total_recente):
+        """
+        Gera alertas e sugestões a partir de contagens já calculadas
+        
+        Args:
+            beneficiario_nome (str): Nome do beneficiário
+            item: Objeto com nome, unidade e categoria do item
+            limites (dict): Resultado de obter_limites_item
+            quantidade_nova (float): Quantidade a distribuir
+            quantidade_recebida (float): Quantidade do item recebida no período do limite
+            historico_recente (int): Saídas do mesmo item nos últimos 7 dias
+            total_recente (int): Saídas de qualquer item nos últimos 7 dias
+            
+        Returns:
+            tuple: (alertas, sugestoes)
+        """
+        alertas = []
+        sugestoes = []
+        
+        categoria = item.categoria.lower()
+        periodo_dias = limites['periodo_dias']
+        limite_especifico = limites['limite']
+        quantidade_total = quantidade_recebida + quantidade_nova
+        
+        if limite_especifico and quantidade_total > limite_especifico:
+            alertas.append(
+                f'⚠️ ALERTA: {beneficiario_nome} já recebeu {quantidade_recebida}{item.unidade} '
+                f'de {item.nome} nos últimos {periodo_dias} dias. '
+                f'Com esta distribuição ({quantidade_nova}{item.unidade}), '
+                f'totalizará {quantidade_total}{item.unidade}, '
+                f'excedendo o limite recomendado de {limite_especifico}{item.unidade}.'
+            )
+            
+            # Sugerir quantidade alternativa
+            quantidade_sugerida = max(0, limite_especifico - quantidade_recebida)
+            if quantidade_sugerida > 0:
+                sugestoes.append(
+                    f'💡 Sugestão: Distribuir apenas {quantidade_sugerida}{item.unidade} '
+                    f'de {item.nome} para não exceder o limite.'
+                )
+            else:
+                sugestoes.append(
+                    f'💡 Sugestão: Considerar distribuir outro item da categoria {categoria} '
+                    f'ou aguardar alguns dias antes de nova distribuição.'
+                )
+        
+        if historico_recente > 0:
+            alertas.append(
+                f'📅 ATENÇÃO: {beneficiario_nome} já recebeu {item.nome} '
+                f'nos últimos 7 dias. Verificar se é realmente necessário.'
+            )
+        
+        if total_recente >= 5:
+            alertas.append(
+                f'📊 DISTRIBUIÇÃO FREQUENTE: {beneficiario_nome} já recebeu '
+                f'{total_recente} itens nos últimos 7 dias. '
+                f'Considerar priorizar outros beneficiários.'
+            )
+        
+        return alertas, sugestoes
+    
+    @staticmethod
+    def sugestao_priorizar(categoria):
+        """Sugestão com beneficiários que receberam menos itens da categoria"""
+        beneficiarios_menos_ajuda = AlertasSistema.buscar_beneficiarios_menos_ajuda(categoria, 5)
+        if not beneficiarios_menos_ajuda:
+            return None
+        
+        nomes = [b['nome'] for b in beneficiarios_menos_ajuda[:3]]
+        return (
+            f'🎯 Considerar priorizar: {", ".join(nomes)} '
+            f'(receberam menos itens de {categoria} recentemente)'
+        )
+    
     @staticmethod
     def buscar_beneficiarios_menos_ajuda(categoria=None, limite=10):
         """
@@ -1,6 +1,11 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, literal_column
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.orm import attributes, joinedload
 from werkzeug.security import generate_password_hash, check_password_hash
+from src.models.esboco_distintos import EsbocoDistintos
 import enum
 
 db = SQLAlchemy()
@@ -63,8 +68,8 @@ class Instituicao(db.Model):
             'aprovada': self.aprovada,
             'ativa': self.ativa,
             'primeira_password': self.primeira_password,
-            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
-            'data_aprovacao': self.data_aprovacao.isoformat() if self.data_aprovacao else None
+            'data_criacao': self.data_criacao,
+            'data_aprovacao': self.data_aprovacao
         }
 
 class Beneficiario(db.Model):
@@ -85,6 +90,11 @@ class Beneficiario(db.Model):
     
     instituicao_registro = db.relationship('Instituicao', backref='beneficiarios_registrados')
     
+    __table_args__ = (
+        # Listagem por instituição ordenada por nome (paginação por cursor em (nome, nif))
+        db.Index('ix_beneficiarios_instituicao_nome', 'instituicao_registro_id', 'nome', 'nif'),
+    )
+    
     def to_dict(self):
         return {
             'nif': self.nif,
@@ -98,24 +108,24 @@ class Beneficiario(db.Model):
             'zona_residencia': self.zona_residencia,
             'perdas_pedidos': self.perdas_pedidos,
             'instituicao_registro_id': self.instituicao_registro_id,
-            'data_registro': self.data_registro.isoformat() if self.data_registro else None
+            'data_registro': self.data_registro
         }
     
     def get_historico_ajuda(self):
-        movimentos = MovimentoStock.query.filter_by(
-            beneficiario_nif=self.nif,
-            tipo_movimento='saida'
+        movimentos = MovimentoStock.consulta_linhas().filter(
+            MovimentoStock.beneficiario_nif == self.nif,
+            MovimentoStock.tipo_movimento == 'saida'
         ).order_by(MovimentoStock.data.desc()).all()
         
         historico = []
         for movimento in movimentos:
             historico.append({
                 'id': movimento.id,
-                'data': movimento.data.isoformat(),
-                'item_nome': movimento.item.nome,
+                'data': movimento.data,
+                'item_nome': movimento.item_nome,
                 'quantidade': movimento.quantidade,
-                'item_unidade': movimento.item.unidade,
-                'instituicao_nome': movimento.instituicao_movimento.nome,
+                'item_unidade': movimento.item_unidade,
+                'instituicao_nome': movimento.instituicao_nome,
                 'motivo': movimento.motivo
             })
         
@@ -140,44 +150,46 @@ class ItemStock(db.Model):
             'unidade': self.unidade,
             'categoria': self.categoria,
             'ativo': self.ativo,
-            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None
+            'data_criacao': self.data_criacao
         }
     
     def get_stock_total(self):
-        entradas = db.session.query(db.func.sum(MovimentoStock.quantidade)).filter_by(
-            item_id=self.id, tipo_movimento='entrada'
-        ).scalar() or 0
+        total = db.session.query(
+            db.func.sum(SaldoStock.entradas - SaldoStock.saidas)
+        ).filter_by(item_id=self.id).scalar()
         
-        saidas = db.session.query(db.func.sum(MovimentoStock.quantidade)).filter_by(
-            item_id=self.id, tipo_movimento='saida'
-        ).scalar() or 0
-        
-        return entradas - saidas
+        return total or 0
     
     def get_stock_por_instituicao(self, instituicao_id):
-        entradas = db.session.query(db.func.sum(MovimentoStock.quantidade)).filter_by(
-            item_id=self.id, instituicao_id=instituicao_id, tipo_movimento='entrada'
-        ).scalar() or 0
-        
-        saidas = db.session.query(db.func.sum(MovimentoStock.quantidade)).filter_by(
-            item_id=self.id, instituicao_id=instituicao_id, tipo_movimento='saida'
-        ).scalar() or 0
+        saldo = SaldoStock.query.filter_by(
+            item_id=self.id, instituicao_id=instituicao_id
+        ).first()
         
-        return entradas - saidas
+        return saldo.saldo if saldo else 0
 
 class MovimentoStock(db.Model):
     __tablename__ = 'movimentos_stock'
     
+    # Campos que afetam saldos_stock e movimentos_diarios usam active_history para que o
+    # valor anterior esteja disponível no flush mesmo quando o atributo estava expirado
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('itens_stock.id'), nullable=False)
-    instituicao_id = db.Column(db.Integer, db.ForeignKey('instituicoes.id'), nullable=True)
-    beneficiario_nif = db.Column(db.String(20), db.ForeignKey('beneficiarios.nif'))
+    item_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('itens_stock.id'), nullable=False), active_history=True
+    )
+    instituicao_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('instituicoes.id'), nullable=True), active_history=True
+    )
+    beneficiario_nif = db.column_property(
+        db.Column(db.String(20), db.ForeignKey('beneficiarios.nif')), active_history=True
+    )
     
     # Isso evita problemas com ENUMs no PostgreSQL
-    tipo_movimento = db.Column(db.String(10), nullable=False)  # 'entrada' ou 'saida'
+    tipo_movimento = db.column_property(
+        db.Column(db.String(10), nullable=False), active_history=True
+    )  # 'entrada' ou 'saida'
     
-    quantidade = db.Column(db.Float, nullable=False)
-    data = db.Column(db.DateTime, default=datetime.utcnow)
+    quantidade = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
+    data = db.column_property(db.Column(db.DateTime, default=datetime.utcnow), active_history=True)
     motivo = db.Column(db.Text)
     observacoes = db.Column(db.Text)
     origem_doacao = db.Column(db.String(100))  # Para entradas
@@ -188,6 +200,29 @@ class MovimentoStock(db.Model):
     instituicao_movimento = db.relationship('Instituicao', backref='movimentos_stock')  
     beneficiario = db.relationship('Beneficiario', backref='movimentos_stock') 
     
+    # Índices para os padrões de acesso reais (listagens, alertas, saldos e dashboards)
+    __table_args__ = (
+        # Listagens, movimentos recentes e relatórios mensais por instituição
+        db.Index('ix_movimentos_instituicao_data', 'instituicao_id', 'data'),
+        # Histórico e alertas por beneficiário
+        db.Index('ix_movimentos_beneficiario_tipo_data', 'beneficiario_nif', 'tipo_movimento', 'data'),
+        # Índice de cobertura para somas de saldo por item (reconciliação de saldos_stock)
+        db.Index(
+            'ix_movimentos_item_tipo_instituicao', 'item_id', 'tipo_movimento', 'instituicao_id',
+            postgresql_include=['quantidade']
+        ),
+        # Totais de entradas/saídas e beneficiários atendidos por instituição
+        db.Index(
+            'ix_movimentos_instituicao_tipo', 'instituicao_id', 'tipo_movimento',
+            postgresql_include=['quantidade', 'beneficiario_nif']
+        ),
+        # Índice parcial para as verificações de distribuição (apenas saídas)
+        db.Index(
+            'ix_movimentos_saidas_beneficiario_item_data', 'beneficiario_nif', 'item_id', 'data',
+            postgresql_where=db.text("tipo_movimento = 'saida'")
+        ),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -200,12 +235,368 @@ class MovimentoStock(db.Model):
             'beneficiario_nome': self.beneficiario.nome if self.beneficiario else None,
             'tipo_movimento': self.tipo_movimento,
             'quantidade': self.quantidade,
-            'data': self.data.isoformat() if self.data else None,
+            'data': self.data,
             'motivo': self.motivo,
             'observacoes': self.observacoes,
             'origem_doacao': self.origem_doacao,
             'local_entrega': self.local_entrega
         }
+    
+    @staticmethod
+    def inserir_em_lote(linhas):
+        """
+        Insere vários movimentos com um único executemany e atualiza saldos_stock
+        e movimentos_diarios
+        
+        Não passa pelo flush do ORM, por isso aplica os deltas de saldo e dos agregados
+        diários explicitamente e avisa as funções de OBSERVADORES_INSERCAO_EM_LOTE.
+        O commit fica a cargo de quem chama.
+        
+        Args:
+            linhas (list): Dicionários com as colunas de movimentos_stock (mesmas chaves em todas)
+            
+        Returns:
+            list: IDs dos movimentos criados, pela ordem das linhas
+        """
+        if not linhas:
+            return []
+        
+        # A data é fixada aqui para que o dia dos agregados seja o mesmo que fica gravado
+        agora = datetime.utcnow()
+        linhas = [dict(linha, data=linha.get('data') or agora) for linha in linhas]
+        
+        tabela = MovimentoStock.__table__
+        ids = db.session.execute(
+            tabela.insert().returning(tabela.c.id, sort_by_parameter_order=True),
+            linhas
+        ).scalars().all()
+        
+        alteracoes = [
+            (None, {campo: linha.get(campo) for campo in CAMPOS_AGREGADOS_MOVIMENTO}) for linha in linhas
+        ]
+        aplicar_deltas_saldo(db.session.connection(), alteracoes)
+        aplicar_deltas_diarios(db.session.connection(), alteracoes)
+        
+        for observador in OBSERVADORES_INSERCAO_EM_LOTE:
+            observador(db.session, linhas, ids)
+        
+        return ids
+    
+    @staticmethod
+    def opcoes_carregamento():
+        """Opções de carregamento para listas serializadas com to_dict (evita N+1)"""
+        return (
+            joinedload(MovimentoStock.item),
+            joinedload(MovimentoStock.instituicao_movimento),
+            joinedload(MovimentoStock.beneficiario)
+        )
+    
+    @staticmethod
+    def consulta_linhas():
+        """
+        Consulta de colunas já juntas (item, instituição e beneficiário) para listagens
+        
+        Devolve tuplos em vez de objetos ORM; usar com linha_to_dict.
+        """
+        return db.session.query(
+            MovimentoStock.id,
+            MovimentoStock.item_id,
+            ItemStock.nome.label('item_nome'),
+            ItemStock.unidade.label('item_unidade'),
+            MovimentoStock.instituicao_id,
+            Instituicao.nome.label('instituicao_nome'),
+            MovimentoStock.beneficiario_nif,
+            Beneficiario.nome.label('beneficiario_nome'),
+            MovimentoStock.tipo_movimento,
+            MovimentoStock.quantidade,
+            MovimentoStock.data,
+            MovimentoStock.motivo,
+            MovimentoStock.observacoes,
+            MovimentoStock.origem_doacao,
+            MovimentoStock.local_entrega
+        ).outerjoin(
+            ItemStock, ItemStock.id == MovimentoStock.item_id
+        ).outerjoin(
+            Instituicao, Instituicao.id == MovimentoStock.instituicao_id
+        ).outerjoin(
+            Beneficiario, Beneficiario.nif == MovimentoStock.beneficiario_nif
+        )
+    
+    @staticmethod
+    def linha_to_dict(linha):
+        """Equivalente a to_dict para uma linha de consulta_linhas"""
+        return {
+            'id': linha.id,
+            'item_id': linha.item_id,
+            'item_nome': linha.item_nome,
+            'item_unidade': linha.item_unidade,
+            'instituicao_id': linha.instituicao_id,
+            'instituicao_nome': linha.instituicao_nome,
+            'beneficiario_nif': linha.beneficiario_nif,
+            'beneficiario_nome': linha.beneficiario_nome,
+            'tipo_movimento': linha.tipo_movimento,
+            'quantidade': linha.quantidade,
+            'data': linha.data,
+            'motivo': linha.motivo,
+            'observacoes': linha.observacoes,
+            'origem_doacao': linha.origem_doacao,
+            'local_entrega': linha.local_entrega
+        }
+
+def instituicao_ou_zero(coluna):
+    """
+    COALESCE(coluna, 0) das chaves únicas de saldos e agregados
+    
+    Uma restrição UNIQUE não considera NULLs iguais: sem a expressão, os movimentos sem
+    instituição (de instituições eliminadas) podiam criar várias linhas para a mesma chave.
+    O 0 é literal para que o alvo do ON CONFLICT seja igual à expressão do índice.
+    """
+    return func.coalesce(coluna, literal_column('0'))
+
+class SaldoStock(db.Model):
+    """Saldo materializado por item/instituição, mantido a cada movimento"""
+    __tablename__ = 'saldos_stock'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('itens_stock.id'), nullable=False)
+    # NULL: movimentos de instituições eliminadas, que continuam a contar para o stock total
+    instituicao_id = db.Column(db.Integer, db.ForeignKey('instituicoes.id', ondelete='CASCADE'), nullable=True)
+    entradas = db.Column(db.Float, nullable=False, default=0)
+    saidas = db.Column(db.Float, nullable=False, default=0)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def saldo(self):
+        return (self.entradas or 0) - (self.saidas or 0)
+    
+    def to_dict(self):
+        return {
+            'item_id': self.item_id,
+            'instituicao_id': self.instituicao_id,
+            'entradas': self.entradas,
+            'saidas': self.saidas,
+            'saldo': self.saldo,
+            'data_atualizacao': self.data_atualizacao
+        }
+
+# Um saldo por item e instituição, com um único saldo "sem instituição" por item
+db.Index(
+    'ux_saldos_item_instituicao', SaldoStock.item_id, instituicao_ou_zero(SaldoStock.instituicao_id), unique=True
+)
+
+class MovimentoDiario(db.Model):
+    """
+    Agregado diário dos movimentos por instituição, item e tipo, mantido a cada movimento
+    
+    Relatórios e estatísticas somam estas linhas (uma por dia e item) em vez de
+    percorrer o registo de movimentos. 'beneficiarios' é um EsbocoDistintos com os
+    NIFs das saídas, para contar beneficiários distintos de qualquer período.
+    """
+    __tablename__ = 'movimentos_diarios'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # NULL: movimentos de instituições eliminadas
+    instituicao_id = db.Column(db.Integer, db.ForeignKey('instituicoes.id', ondelete='CASCADE'), nullable=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('itens_stock.id'), nullable=False)
+    dia = db.Column(db.Date, nullable=False)
+    tipo_movimento = db.Column(db.String(10), nullable=False)
+    quantidade = db.Column(db.Float, nullable=False, default=0)
+    movimentos = db.Column(db.Integer, nullable=False, default=0)
+    beneficiarios = db.Column(db.LargeBinary)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Séries temporais e totais por instituição (todos os itens de um período)
+        db.Index('ix_movimentos_diarios_instituicao_dia', 'instituicao_id', 'dia'),
+    )
+    
+    def contar_beneficiarios(self):
+        return EsbocoDistintos.carregar(self.beneficiarios).contar()
+
+# Uma linha por instituição, item, dia e tipo, com uma única linha "sem instituição" por chave
+db.Index(
+    'ux_movimentos_diarios_chave', instituicao_ou_zero(MovimentoDiario.instituicao_id),
+    MovimentoDiario.item_id, MovimentoDiario.dia, MovimentoDiario.tipo_movimento, unique=True
+)
+
+# ===== MANUTENÇÃO DOS SALDOS E AGREGADOS DIÁRIOS NA MESMA TRANSAÇÃO DOS MOVIMENTOS =====
+CAMPOS_SALDO_MOVIMENTO = ('item_id', 'instituicao_id', 'tipo_movimento', 'quantidade')
+CAMPOS_AGREGADOS_MOVIMENTO = CAMPOS_SALDO_MOVIMENTO + ('data', 'beneficiario_nif')
+
+# Funções (session, linhas, ids) chamadas por MovimentoStock.inserir_em_lote, cujas inserções
+# não aparecem nos eventos de flush da sessão (ex.: eventos em tempo real do dashboard)
+OBSERVADORES_INSERCAO_EM_LOTE = []
+
+def _valores_movimento(movimento, anteriores=False):
+    """Extrai os campos que afetam saldos e agregados (valores atuais ou anteriores ao flush)"""
+    valores = {}
+    for campo in CAMPOS_AGREGADOS_MOVIMENTO:
+        valor = getattr(movimento, campo)
+        if anteriores:
+            historico = attributes.get_history(movimento, campo)
+            if historico.deleted:
+                valor = historico.deleted[0]
+        valores[campo] = valor
+    return valores
+
+def _insert_com_conflito(connection, tabela):
+    """INSERT do dialeto da ligação, com suporte a ON CONFLICT (PostgreSQL ou SQLite)"""
+    if connection.dialect.name == 'postgresql':
+        return insert_postgresql(tabela)
+    return insert_sqlite(tabela)
+
+def aplicar_deltas_saldo(connection, alteracoes):
+    """
+    Atualiza saldos_stock a partir de uma lista de alterações de movimentos
+    
+    Usa INSERT ... ON CONFLICT DO UPDATE: duas transações com o primeiro movimento do
+    mesmo item/instituição somam ambas ao mesmo saldo em vez de falharem na restrição única.
+    As linhas são ordenadas para que transações concorrentes bloqueiem os saldos pela mesma ordem.
+    Movimentos sem instituição (instituição eliminada) somam ao saldo sem instituição do item.
+    
+    Args:
+        connection: Ligação da transação em curso
+        alteracoes (list): Pares (antes, depois) com os campos de CAMPOS_SALDO_MOVIMENTO;
+            'antes' é None para inserções e 'depois' é None para remoções
+    """
+    deltas = {}
+    for antes, depois in alteracoes:
+        for valores, sinal in ((antes, -1), (depois, 1)):
+            if not valores:
+                continue
+            chave = (valores['item_id'], valores['instituicao_id'])
+            delta = deltas.setdefault(chave, [0, 0])
+            indice = 0 if valores['tipo_movimento'] == 'entrada' else 1
+            delta[indice] += sinal * (valores['quantidade'] or 0)
+    
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            'item_id': item_id,
+            'instituicao_id': instituicao_id,
+            'entradas': delta_entradas,
+            'saidas': delta_saidas,
+            'data_atualizacao': agora
+        }
+        for (item_id, instituicao_id), (delta_entradas, delta_saidas) in sorted(
+            deltas.items(), key=lambda delta: (delta[0][0], delta[0][1] or 0)
+        )
+        if delta_entradas or delta_saidas
+    ]
+    if not linhas:
+        return
+    
+    tabela = SaldoStock.__table__
+    insercao = _insert_com_conflito(connection, tabela)
+    connection.execute(
+        insercao.on_conflict_do_update(
+            index_elements=[tabela.c.item_id, instituicao_ou_zero(tabela.c.instituicao_id)],
+            set_={
+                'entradas': tabela.c.entradas + insercao.excluded.entradas,
+                'saidas': tabela.c.saidas + insercao.excluded.saidas,
+                'data_atualizacao': insercao.excluded.data_atualizacao
+            }
+        ),
+        linhas
+    )
+
+def aplicar_deltas_diarios(connection, alteracoes):
+    """
+    Atualiza movimentos_diarios a partir de uma lista de alterações de movimentos
+    
+    Somas e contagens são aplicadas com INSERT ... ON CONFLICT DO UPDATE, como em
+    aplicar_deltas_saldo. O esboço de beneficiários é devolvido pelo RETURNING do
+    upsert, que deixa a linha bloqueada até ao fim da transação, e só é regravado
+    se ganhar NIFs. Movimentos sem instituição (instituição eliminada) somam às linhas
+    sem instituição, como em saldos_stock.
+    
+    Args:
+        connection: Ligação da transação em curso
+        alteracoes (list): Pares (antes, depois) com os campos de CAMPOS_AGREGADOS_MOVIMENTO;
+            'antes' é None para inserções e 'depois' é None para remoções
+    """
+    agora = datetime.utcnow()
+    deltas = {}
+    for antes, depois in alteracoes:
+        for valores, sinal in ((antes, -1), (depois, 1)):
+            if not valores:
+                continue
+            dia = (valores['data'] or agora).date()
+            chave = (valores['instituicao_id'], valores['item_id'], dia, valores['tipo_movimento'])
+            delta = deltas.setdefault(chave, [0, 0, set()])
+            delta[0] += sinal * (valores['quantidade'] or 0)
+            delta[1] += sinal
+            if sinal > 0 and valores['tipo_movimento'] == 'saida' and valores['beneficiario_nif']:
+                delta[2].add(valores['beneficiario_nif'])
+    
+    tabela = MovimentoDiario.__table__
+    insercao = _insert_com_conflito(connection, tabela)
+    upsert = insercao.on_conflict_do_update(
+        index_elements=[
+            instituicao_ou_zero(tabela.c.instituicao_id), tabela.c.item_id, tabela.c.dia, tabela.c.tipo_movimento
+        ],
+        set_={
+            'quantidade': tabela.c.quantidade + insercao.excluded.quantidade,
+            'movimentos': tabela.c.movimentos + insercao.excluded.movimentos,
+            'data_atualizacao': insercao.excluded.data_atualizacao
+        }
+    )
+    
+    # Ordenadas para que transações concorrentes bloqueiem as linhas pela mesma ordem
+    for chave, (delta_quantidade, delta_movimentos, nifs) in sorted(
+        deltas.items(), key=lambda delta: (delta[0][0] or 0,) + delta[0][1:]
+    ):
+        if not delta_quantidade and not delta_movimentos and not nifs:
+            continue
+        
+        instituicao_id, item_id, dia, tipo = chave
+        novos = EsbocoDistintos.de_valores(nifs)
+        linha = {
+            'instituicao_id': instituicao_id,
+            'item_id': item_id,
+            'dia': dia,
+            'tipo_movimento': tipo,
+            'quantidade': delta_quantidade,
+            'movimentos': delta_movimentos,
+            'beneficiarios': novos.serializar() if nifs else None,
+            'data_atualizacao': agora
+        }
+        
+        if not nifs:
+            connection.execute(upsert, linha)
+            continue
+        
+        # Numa linha nova o esboço devolvido já é o inserido; numa existente juntam-se os NIFs
+        atual = connection.execute(upsert.returning(tabela.c.id, tabela.c.beneficiarios), linha).one()
+        esboco = EsbocoDistintos.carregar(atual.beneficiarios)
+        if esboco.juntar(novos):
+            connection.execute(
+                tabela.update().where(tabela.c.id == atual.id).values(beneficiarios=esboco.serializar())
+            )
+
+@event.listens_for(db.session, 'after_flush')
+def _atualizar_saldos_apos_flush(session, flush_context):
+    """Propaga inserções, alterações e remoções de movimentos para saldos_stock e movimentos_diarios"""
+    alteracoes = []
+    
+    for obj in session.new:
+        if isinstance(obj, MovimentoStock):
+            alteracoes.append((None, _valores_movimento(obj)))
+    
+    for obj in session.dirty:
+        if isinstance(obj, MovimentoStock) and session.is_modified(obj):
+            antes = _valores_movimento(obj, anteriores=True)
+            depois = _valores_movimento(obj)
+            if antes != depois:
+                alteracoes.append((antes, depois))
+    
+    for obj in session.deleted:
+        if isinstance(obj, MovimentoStock):
+            alteracoes.append((_valores_movimento(obj, anteriores=True), None))
+    
+    if alteracoes:
+        aplicar_deltas_saldo(session.connection(), alteracoes)
+        aplicar_deltas_diarios(session.connection(), alteracoes)
 
 class RelatorioMensal(db.Model):
     __tablename__ = 'relatorios_mensais'
@@ -240,7 +631,7 @@ class RelatorioMensal(db.Model):
             'ano': self.ano,
             'mes': self.mes,
             'mes_nome': self.get_mes_nome(),
-            'data_geracao': self.data_geracao.isoformat() if self.data_geracao else None,
+            'data_geracao': self.data_geracao,
             'total_entradas': self.total_entradas,
             'total_saidas': self.total_saidas,
             'saldo_mensal': self.saldo_mensal,
@@ -287,19 +678,20 @@ def init_dados_exemplo():
         bombeiros.set_password('Bombeiros@2024')
         db.session.add(bombeiros)
         
-        # Admin
-        admin = Instituicao(
-            nome='Administrador do Sistema',
-            username='admin',
-            email='admin@sistema.com',
-            responsavel='Administrador',
-            tipo_instituicao='governo',
-            aprovada=True,
-            ativa=True,
-            primeira_password=False
-        )
-        admin.set_password('Admin@2024')
-        db.session.add(admin)
+        # Admin (pode já ter sido criado por 'flask init-db')
+        if not Instituicao.query.filter_by(username='admin').first():
+            admin = Instituicao(
+                nome='Administrador do Sistema',
+                username='admin',
+                email='admin@sistema.com',
+                responsavel='Administrador',
+                tipo_instituicao='governo',
+                aprovada=True,
+                ativa=True,
+                primeira_password=False
+            )
+            admin.set_password('Admin@2024')
+            db.session.add(admin)
         
         # Criar itens de stock de exemplo
         itens_exemplo = [
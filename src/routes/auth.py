@@ -1,6 +1,8 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, g, current_app
 from src.models.sistema_models import db, Instituicao, MovimentoStock, Beneficiario
 from src.services.registro_service import RegistroService
+from src.services.cache_service import CacheService
+from src.services.compressao_service import CompressaoService
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__)
@@ -29,14 +31,40 @@ def admin_required(f):
     return decorated_function
 
 def get_current_instituicao():
-    """Retorna a instituição atualmente logada"""
+    """
+    Retorna a instituição atualmente logada
+    
+    Carregada uma vez por pedido (guardada em flask.g); com CACHE_INSTITUICOES_TTL > 0
+    as linhas das instituições ficam também em cache no processo durante esse tempo.
+    """
     if 'instituicao_id' not in session:
         return None
-    return Instituicao.query.get(session['instituicao_id'])
+    
+    instituicao_id = session['instituicao_id']
+    if g.get('instituicao_atual_id') != instituicao_id:
+        g.instituicao_atual = CacheService.obter_instituicao(
+            instituicao_id, current_app.config.get('CACHE_INSTITUICOES_TTL', 0)
+        )
+        g.instituicao_atual_id = instituicao_id
+    return g.instituicao_atual
+
+# Indica se a conta admin já foi verificada/criada neste processo
+_admin_verificado = False
 
-@auth_bp.before_app_request
 def create_admin_user():
-    """Cria usuário admin se não existir"""
+    """
+    Cria usuário admin se não existir
+    
+    Executado no arranque da aplicação (ou com 'flask criar-admin'), e não em cada pedido;
+    depois de uma verificação bem-sucedida não volta a consultar a base de dados.
+    
+    Returns:
+        bool: True se a conta admin existe
+    """
+    global _admin_verificado
+    if _admin_verificado:
+        return True
+    
     try:
         admin = Instituicao.query.filter_by(username='admin').first()
         if not admin:
@@ -53,8 +81,11 @@ def create_admin_user():
             db.session.add(admin)
             db.session.commit()
             print("✅ Usuário admin criado com sucesso")
+        _admin_verificado = True
     except Exception as e:
+        db.session.rollback()
         print(f"❌ Erro ao criar usuário admin: {e}")
+    return _admin_verificado
 
 # ==================== ROTAS PÚBLICAS ====================
 
@@ -547,6 +578,22 @@ def get_estatisticas_admin():
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@auth_bp.route('/admin/compressao', methods=['GET'])
+@admin_required
+def get_estatisticas_compressao():
+    """Endpoint para obter estatísticas de compressão das respostas da API (por endpoint)"""
+    try:
+        if request.args.get('limpar', '').lower() in ('1', 'true'):
+            CompressaoService.limpar_estatisticas()
+        
+        return jsonify({
+            'success': True,
+            'endpoints': CompressaoService.obter_estatisticas()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @auth_bp.route('/admin/info', methods=['GET'])
 @admin_required
 def get_admin_info():
@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from src.models.sistema_models import db, Beneficiario, MovimentoStock
 from src.routes.auth import login_required, get_current_instituicao
 from src.services.consulta_service import ConsultaService
-from sqlalchemy import or_
+from src.services.importacao_service import ImportacaoService
+from src.services.cache_service import CacheService
+from src.services.paginacao_service import PaginacaoService
+from src.services.pesquisa_service import PesquisaService
 
 beneficiarios_bp = Blueprint('beneficiarios', __name__)
 
@@ -51,30 +54,20 @@ def consulta_rapida():
         
         instituicao = get_current_instituicao()
         
-        # Buscar beneficiários que correspondam ao termo de pesquisa
-        beneficiarios = Beneficiario.query.filter(
-            Beneficiario.instituicao_registro_id == instituicao.id
-        ).filter(
-            or_(
-                Beneficiario.nome.ilike(f'%{search_term}%'),
-                Beneficiario.nif.ilike(f'%{search_term}%'),
-                Beneficiario.zona_residencia.ilike(f'%{search_term}%'),
-                Beneficiario.contacto.ilike(f'%{search_term}%')
-            )
-        ).limit(10).all()
+        # Buscar beneficiários que correspondam ao termo de pesquisa (por relevância, sem acentos)
+        beneficiarios = PesquisaService.pesquisar(instituicao.id, search_term, limite=10)
+        
+        # Adicionar estatísticas rápidas (contagem agrupada para todos os resultados)
+        total_ajudas = ConsultaService.contar_ajudas(
+            [beneficiario.nif for beneficiario in beneficiarios],
+            instituicao.id,
+            current_app.config.get('CACHE_CONTAGENS_TTL', 0)
+        )
         
         resultados = []
         for beneficiario in beneficiarios:
             beneficiario_data = beneficiario.to_dict()
-            
-            # Adicionar estatísticas rápidas
-            total_ajudas = MovimentoStock.query.filter_by(
-                beneficiario_nif=beneficiario.nif,
-                instituicao_id=instituicao.id,
-                tipo_movimento='saida'
-            ).count()
-            
-            beneficiario_data['total_ajudas'] = total_ajudas
+            beneficiario_data['total_ajudas'] = total_ajudas[beneficiario.nif]
             resultados.append(beneficiario_data)
         
         return jsonify({
@@ -90,57 +83,85 @@ def consulta_rapida():
 @beneficiarios_bp.route('/', methods=['GET'])
 @login_required
 def get_beneficiarios():
-    """Endpoint para obter a lista de beneficiários da instituição atual"""
+    """
+    Endpoint para obter a lista de beneficiários da instituição atual
+    
+    Paginação por cursor em (nome, nif): passar pagination.next_cursor no parâmetro
+    'cursor' para obter a página seguinte. O parâmetro 'page' mantém a paginação antiga.
+    """
     try:
         instituicao = get_current_instituicao()
         search = request.args.get('search', '').strip()
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
+        contar = request.args.get('contar', '').strip().lower()
+        
+        if contar not in PaginacaoService.MODOS_CONTAGEM:
+            return jsonify({'error': 'Parâmetro contar inválido (use exato ou estimado)'}), 400
         
         # Buscar apenas beneficiários registrados pela instituição atual
         query = Beneficiario.query.filter_by(instituicao_registro_id=instituicao.id)
         
         # Aplicar filtro de pesquisa se fornecido
         if search:
-            query = query.filter(
-                or_(
-                    Beneficiario.nome.ilike(f'%{search}%'),
-                    Beneficiario.nif.ilike(f'%{search}%'),
-                    Beneficiario.zona_residencia.ilike(f'%{search}%'),
-                    Beneficiario.contacto.ilike(f'%{search}%')
-                )
+            query = PesquisaService.filtrar(query, instituicao.id, search)
+        
+        # Total sem pesquisa: contador em cache, invalidado quando a instituição regista beneficiários
+        def total_sem_pesquisa():
+            return CacheService.contar(
+                CacheService.chave_beneficiarios(instituicao.id),
+                query,
+                current_app.config.get('CACHE_CONTAGENS_TTL', 0)
             )
         
-        # Paginação
-        beneficiarios_paginated = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        if 'page' in request.args:
+            # Paginação por OFFSET (compatibilidade), sem COUNT(*) quando não há pesquisa
+            pagina = PaginacaoService.paginar_offset(
+                query.order_by(Beneficiario.nome, Beneficiario.nif),
+                int(request.args.get('page', 1)),
+                per_page,
+                query.order_by(None).count() if search else total_sem_pesquisa()
+            )
+            paginacao = {chave: valor for chave, valor in pagina.items() if chave != 'linhas'}
+        else:
+            try:
+                pagina = PaginacaoService.paginar(
+                    query,
+                    (Beneficiario.nome, Beneficiario.nif),
+                    lambda beneficiario: (beneficiario.nome, beneficiario.nif),
+                    request.args.get('cursor'),
+                    per_page,
+                    descendente=False
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            paginacao = {
+                'per_page': pagina['per_page'],
+                'next_cursor': pagina['next_cursor'],
+                'has_next': pagina['has_next']
+            }
+            if not search:
+                paginacao.update({'total': total_sem_pesquisa(), 'total_estimado': False})
+            else:
+                paginacao.update(PaginacaoService.contar(query, contar))
+        
+        # Contagem de ajudas recebidas (apenas da instituição atual) para toda a página de uma vez
+        total_ajudas = ConsultaService.contar_ajudas(
+            [beneficiario.nif for beneficiario in pagina['linhas']],
+            instituicao.id,
+            current_app.config.get('CACHE_CONTAGENS_TTL', 0)
         )
         
         beneficiarios_list = []
-        for beneficiario in beneficiarios_paginated.items:
+        for beneficiario in pagina['linhas']:
             beneficiario_dict = beneficiario.to_dict()
-            # Adicionar contagem de ajudas recebidas (apenas da instituição atual)
-            total_ajudas = MovimentoStock.query.filter_by(
-                beneficiario_nif=beneficiario.nif,
-                instituicao_id=instituicao.id,
-                tipo_movimento='saida'
-            ).count()
-            beneficiario_dict['total_ajudas'] = total_ajudas
+            beneficiario_dict['total_ajudas'] = total_ajudas[beneficiario.nif]
             beneficiarios_list.append(beneficiario_dict)
         
         return jsonify({
             'success': True,
             'beneficiarios': beneficiarios_list,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': beneficiarios_paginated.total,
-                'pages': beneficiarios_paginated.pages,
-                'has_next': beneficiarios_paginated.has_next,
-                'has_prev': beneficiarios_paginated.has_prev
-            }
+            'pagination': paginacao
         }), 200
         
     except Exception as e:
@@ -184,13 +205,13 @@ def get_beneficiario(nif):
             return jsonify({'error': 'Beneficiário não encontrado'}), 404
         
         # Obter histórico de ajuda apenas da instituição atual
-        historico = MovimentoStock.query.filter_by(
-            beneficiario_nif=nif,
-            instituicao_id=instituicao.id,
-            tipo_movimento='saida'
+        historico = MovimentoStock.consulta_linhas().filter(
+            MovimentoStock.beneficiario_nif == nif,
+            MovimentoStock.instituicao_id == instituicao.id,
+            MovimentoStock.tipo_movimento == 'saida'
         ).order_by(MovimentoStock.data.desc()).all()
         
-        historico_dict = [movimento.to_dict() for movimento in historico]
+        historico_dict = [MovimentoStock.linha_to_dict(linha) for linha in historico]
         
         beneficiario_dict = beneficiario.to_dict()
         beneficiario_dict['historico_ajuda'] = historico_dict
@@ -229,6 +250,62 @@ def create_beneficiario():
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@beneficiarios_bp.route('/importar', methods=['POST'])
+@login_required
+def importar_beneficiarios():
+    """
+    Endpoint para registar beneficiários em massa
+    
+    Aceita um ficheiro CSV/XLSX (campo 'ficheiro') ou JSON {'beneficiarios': [...]}.
+    Com 'atualizar', os beneficiários já registados pela instituição são atualizados.
+    """
+    try:
+        instituicao = get_current_instituicao()
+        tamanho_bloco = ImportacaoService.TAMANHO_BLOCO
+        
+        ficheiro = request.files.get('ficheiro')
+        if ficheiro and ficheiro.filename:
+            formato = ImportacaoService.detetar_formato(ficheiro.filename)
+            if not formato:
+                return jsonify({'error': 'Formato não suportado (use .csv ou .xlsx)'}), 400
+            
+            atualizar = request.form.get('atualizar', '').lower() in ('1', 'true', 'sim')
+            resultado = ImportacaoService.importar_beneficiarios(
+                ficheiro.stream, formato, instituicao.id, atualizar, tamanho_bloco
+            )
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get('beneficiarios'), list):
+                return jsonify({'error': 'Ficheiro ou lista de beneficiários é obrigatório'}), 400
+            
+            if not all(isinstance(b, dict) for b in data['beneficiarios']):
+                return jsonify({'error': 'Cada beneficiário deve ser um objeto'}), 400
+            
+            registos = list(enumerate(data['beneficiarios'], start=1))
+            blocos = (registos[i:i + tamanho_bloco] for i in range(0, len(registos), tamanho_bloco))
+            resultado = ImportacaoService.importar_beneficiarios_blocos(
+                blocos, instituicao.id, bool(data.get('atualizar', False))
+            )
+        
+        if 'linhas_lidas' not in resultado:
+            return jsonify({'error': resultado['erro']}), 400
+        
+        gravados = resultado['totais']['criado'] + resultado['totais']['atualizado']
+        resposta = {
+            'success': resultado['sucesso'],
+            'message': f"{gravados} de {resultado['linhas_lidas']} beneficiários gravados",
+            **{chave: valor for chave, valor in resultado.items() if chave != 'sucesso'}
+        }
+        if 'erro' in resultado:
+            resposta['error'] = resposta.pop('erro')
+            return jsonify(resposta), 500
+        
+        return jsonify(resposta), 201 if gravados else 400
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @beneficiarios_bp.route('/<nif>', methods=['PUT'])
 @login_required
 def update_beneficiario(nif):
@@ -297,35 +374,55 @@ def get_historico_beneficiario(nif):
             return jsonify({'error': 'Beneficiário não encontrado'}), 404
         
         # Parâmetros de paginação
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
         
         # Query dos movimentos de saída para este beneficiário (apenas da instituição atual)
-        movimentos_query = MovimentoStock.query.filter_by(
-            beneficiario_nif=nif,
-            instituicao_id=instituicao.id,
-            tipo_movimento='saida'
-        ).order_by(MovimentoStock.data.desc())
-        
-        movimentos_paginated = movimentos_query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        movimentos_query = MovimentoStock.consulta_linhas().filter(
+            MovimentoStock.beneficiario_nif == nif,
+            MovimentoStock.instituicao_id == instituicao.id,
+            MovimentoStock.tipo_movimento == 'saida'
         )
         
-        historico = [movimento.to_dict() for movimento in movimentos_paginated.items]
+        # Total de ajudas: contador em cache, invalidado a cada nova saída para o beneficiário
+        total = ConsultaService.contar_ajudas(
+            [nif], instituicao.id, current_app.config.get('CACHE_CONTAGENS_TTL', 0)
+        )[nif]
+        
+        if 'page' in request.args:
+            # Paginação por OFFSET (compatibilidade)
+            pagina = PaginacaoService.paginar_offset(
+                movimentos_query.order_by(MovimentoStock.data.desc(), MovimentoStock.id.desc()),
+                int(request.args.get('page', 1)),
+                per_page,
+                total
+            )
+            paginacao = {chave: valor for chave, valor in pagina.items() if chave != 'linhas'}
+        else:
+            # Paginação por cursor: ajudas mais recentes primeiro, desempate por id
+            try:
+                pagina = PaginacaoService.paginar(
+                    movimentos_query,
+                    (MovimentoStock.data, MovimentoStock.id),
+                    lambda linha: (linha.data, linha.id),
+                    request.args.get('cursor'),
+                    per_page
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            paginacao = {
+                'per_page': pagina['per_page'],
+                'next_cursor': pagina['next_cursor'],
+                'has_next': pagina['has_next'],
+                'total': total
+            }
+        
+        historico = [MovimentoStock.linha_to_dict(linha) for linha in pagina['linhas']]
         
         return jsonify({
             'success': True,
             'historico': historico,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': movimentos_paginated.total,
-                'pages': movimentos_paginated.pages,
-                'has_next': movimentos_paginated.has_next,
-                'has_prev': movimentos_paginated.has_prev
-            }
+            'pagination': paginacao
         }), 200
         
     except Exception as e:
@@ -338,85 +435,14 @@ def get_beneficiarios_stats():
     try:
         instituicao = get_current_instituicao()
         
-        # Total de beneficiários da instituição atual
-        total_beneficiarios = Beneficiario.query.filter_by(
-            instituicao_registro_id=instituicao.id
-        ).count()
-        
-        # Beneficiários que já receberam ajuda da instituição atual
-        beneficiarios_com_ajuda = db.session.query(Beneficiario.nif).join(
-            MovimentoStock, 
-            (Beneficiario.nif == MovimentoStock.beneficiario_nif) &
-            (MovimentoStock.instituicao_id == instituicao.id)
-        ).filter(
-            MovimentoStock.tipo_movimento == 'saida'
-        ).distinct().count()
-        
-        # Beneficiários por zona de residência (apenas da instituição atual)
-        zonas_query = db.session.query(
-            Beneficiario.zona_residencia,
-            db.func.count(Beneficiario.nif).label('count')
-        ).filter(
-            Beneficiario.instituicao_registro_id == instituicao.id
-        ).group_by(Beneficiario.zona_residencia).all()
-        
-        zonas_stats = [{'zona': zona or 'Não especificada', 'count': count} for zona, count in zonas_query]
-        
-        # Distribuição por faixa etária (apenas da instituição atual)
-        faixas_etarias = [
-            {
-                'faixa': '0-17', 
-                'count': Beneficiario.query.filter(
-                    Beneficiario.instituicao_registro_id == instituicao.id,
-                    Beneficiario.idade.between(0, 17)
-                ).count()
-            },
-            {
-                'faixa': '18-35', 
-                'count': Beneficiario.query.filter(
-                    Beneficiario.instituicao_registro_id == instituicao.id,
-                    Beneficiario.idade.between(18, 35)
-                ).count()
-            },
-            {
-                'faixa': '36-60', 
-                'count': Beneficiario.query.filter(
-                    Beneficiario.instituicao_registro_id == instituicao.id,
-                    Beneficiario.idade.between(36, 60)
-                ).count()
-            },
-            {
-                'faixa': '60+', 
-                'count': Beneficiario.query.filter(
-                    Beneficiario.instituicao_registro_id == instituicao.id,
-                    Beneficiario.idade > 60
-                ).count()
-            },
-            {
-                'faixa': 'Não informada', 
-                'count': Beneficiario.query.filter(
-                    Beneficiario.instituicao_registro_id == instituicao.id,
-                    Beneficiario.idade.is_(None)
-                ).count()
-            }
-        ]
-        
-        # Estatísticas de ajuda da instituição atual
-        total_ajudas_instituicao = MovimentoStock.query.filter_by(
-            instituicao_id=instituicao.id,
-            tipo_movimento='saida'
-        ).count()
+        # Faixas etárias, zonas e cobertura de ajudas numa única consulta (em cache por instituição)
+        stats = ConsultaService.estatisticas_beneficiarios(
+            instituicao.id, current_app.config.get('CACHE_CONTAGENS_TTL', 0)
+        )
         
         return jsonify({
             'success': True,
-            'stats': {
-                'total_beneficiarios': total_beneficiarios,
-                'beneficiarios_com_ajuda': beneficiarios_com_ajuda,
-                'beneficiarios_sem_ajuda': total_beneficiarios - beneficiarios_com_ajuda,
-                'total_ajudas_instituicao': total_ajudas_instituicao,
-                'zonas_residencia': zonas_stats,
-                'faixas_etarias': faixas_etarias
-            }
+            'stats': stats
         }), 200
         
     except Exception as e:
@@ -1,78 +1,67 @@
-from flask import Blueprint, request, jsonify
-from src.models.sistema_models import db, ItemStock, MovimentoStock, Beneficiario, Instituicao
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.models.sistema_models import db, MovimentoStock, Instituicao
 from src.routes.auth import login_required, get_current_instituicao
+from src.services.saldo_service import SaldoService
+from src.services.catalogo_service import CatalogoService
+from src.services.dashboard_service import DashboardService
+from src.services.eventos_service import EventosService
+from src.services.movimentos_diarios_service import MovimentosDiariosService
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_
+from sqlalchemy import and_
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/stats', methods=['GET'])
 @login_required
 def get_dashboard_stats():
-    """Endpoint para obter estatísticas gerais do dashboard"""
+    """
+    Endpoint para obter estatísticas gerais do dashboard
+    
+    Devolve a fotografia calculada em segundo plano (gerado_em indica quando);
+    ?fresh=1 recalcula no pedido.
+    """
     try:
         instituicao = get_current_instituicao()
+        fresco = request.args.get('fresh', '').lower() in ('1', 'true')
         
-        # Estatísticas gerais do sistema (visíveis para todas as instituições)
-        total_beneficiarios = Beneficiario.query.count()
-        total_itens_stock = ItemStock.query.filter_by(ativo=True).count()
-        
-        # Beneficiários que receberam ajuda
-        beneficiarios_com_ajuda = db.session.query(Beneficiario.nif).join(
-            MovimentoStock, Beneficiario.nif == MovimentoStock.beneficiario_nif
-        ).filter(MovimentoStock.tipo_movimento == 'saida').distinct().count()
-        
-        # Estatísticas específicas da instituição
-        total_movimentos_instituicao = MovimentoStock.query.filter_by(
-            instituicao_id=instituicao.id
-        ).count()
-        
-        total_entradas_instituicao = db.session.query(func.sum(MovimentoStock.quantidade)).filter_by(
-            instituicao_id=instituicao.id,
-            tipo_movimento='entrada'
-        ).scalar() or 0
-        
-        total_saidas_instituicao = db.session.query(func.sum(MovimentoStock.quantidade)).filter_by(
-            instituicao_id=instituicao.id,
-            tipo_movimento='saida'
-        ).scalar() or 0
-        
-        # Beneficiários únicos atendidos por esta instituição
-        beneficiarios_atendidos_instituicao = db.session.query(MovimentoStock.beneficiario_nif).filter_by(
-            instituicao_id=instituicao.id,
-            tipo_movimento='saida'
-        ).distinct().count()
-        
-        # Movimentos recentes (últimos 7 dias)
-        data_limite = datetime.utcnow() - timedelta(days=7)
-        movimentos_recentes = MovimentoStock.query.filter(
-            MovimentoStock.instituicao_id == instituicao.id,
-            MovimentoStock.data >= data_limite
-        ).count()
+        fotografia = DashboardService.obter(instituicao, fresco=fresco)
         
         return jsonify({
             'success': True,
-            'stats': {
-                'sistema': {
-                    'total_beneficiarios': total_beneficiarios,
-                    'beneficiarios_com_ajuda': beneficiarios_com_ajuda,
-                    'beneficiarios_sem_ajuda': total_beneficiarios - beneficiarios_com_ajuda,
-                    'total_itens_stock': total_itens_stock
-                },
-                'instituicao': {
-                    'nome': instituicao.nome,
-                    'total_movimentos': total_movimentos_instituicao,
-                    'total_entradas': total_entradas_instituicao,
-                    'total_saidas': total_saidas_instituicao,
-                    'beneficiarios_atendidos': beneficiarios_atendidos_instituicao,
-                    'movimentos_recentes': movimentos_recentes
-                }
-            }
+            'stats': fotografia['stats'],
+            'gerado_em': fotografia['gerado_em']
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@dashboard_bp.route('/eventos', methods=['GET'])
+@login_required
+def get_eventos():
+    """
+    Endpoint de eventos em tempo real (Server-Sent Events) da instituição
+    
+    Envia 'movimento', 'movimentos', 'saldo', 'alerta', 'estatisticas' e 'ressincronizar'
+    à medida que os movimentos são confirmados, em vez de o cliente repetir os pedidos.
+    """
+    try:
+        instituicao = get_current_instituicao()
+        subscricao = EventosService.subscrever(instituicao.id)
+        # Os eventos 'estatisticas' vêm das atualizações das fotografias do dashboard
+        DashboardService.iniciar_atualizador()
+        
+        # A ligação fica aberta: não reter uma ligação à base de dados durante a transmissão
+        db.session.remove()
+        
+        return Response(
+            stream_with_context(EventosService.transmitir(subscricao)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @dashboard_bp.route('/atividade-recente', methods=['GET'])
 @login_required
 def get_atividade_recente():
@@ -82,8 +71,8 @@ def get_atividade_recente():
         limit = int(request.args.get('limit', 10))
         
         # Últimos movimentos da instituição
-        movimentos_recentes = MovimentoStock.query.filter_by(
-            instituicao_id=instituicao.id
+        movimentos_recentes = MovimentoStock.consulta_linhas().filter(
+            MovimentoStock.instituicao_id == instituicao.id
         ).order_by(MovimentoStock.data.desc()).limit(limit).all()
         
         atividades = []
@@ -91,15 +80,15 @@ def get_atividade_recente():
             atividade = {
                 'id': movimento.id,
                 'tipo': movimento.tipo_movimento,
-                'item_nome': movimento.item.nome,
+                'item_nome': movimento.item_nome,
                 'quantidade': movimento.quantidade,
-                'unidade': movimento.item.unidade,
+                'unidade': movimento.item_unidade,
                 'data': movimento.data.isoformat(),
                 'motivo': movimento.motivo
             }
             
-            if movimento.tipo_movimento == 'saida' and movimento.beneficiario:
-                atividade['beneficiario_nome'] = movimento.beneficiario.nome
+            if movimento.tipo_movimento == 'saida' and movimento.beneficiario_nome is not None:
+                atividade['beneficiario_nome'] = movimento.beneficiario_nome
                 atividade['beneficiario_nif'] = movimento.beneficiario_nif
             elif movimento.tipo_movimento == 'entrada':
                 atividade['origem_doacao'] = movimento.origem_doacao
@@ -121,17 +110,18 @@ def get_stock_resumo():
     try:
         # Obter itens com stock disponível
         itens_com_stock = []
-        itens = ItemStock.query.filter_by(ativo=True).all()
+        itens = CatalogoService.obter().itens_ativos()
+        saldos = SaldoService.obter_saldos([item['id'] for item in itens])
         
         for item in itens:
-            stock_total = item.get_stock_total()
+            stock_total = saldos.get(item['id'], SaldoService.saldo_vazio())['stock_total']
             if stock_total > 0:
                 itens_com_stock.append({
-                    'id': item.id,
-                    'nome': item.nome,
-                    'categoria': item.categoria,
+                    'id': item['id'],
+                    'nome': item['nome'],
+                    'categoria': item['categoria'],
                     'stock_total': stock_total,
-                    'unidade': item.unidade
+                    'unidade': item['unidade']
                 })
         
         # Ordenar por categoria e nome
@@ -166,24 +156,13 @@ def get_graficos_movimentos_tempo():
         
         data_inicio = datetime.utcnow() - timedelta(days=dias)
         
-        # Query para obter movimentos agrupados por data
-        movimentos_por_data = db.session.query(
-            func.date(MovimentoStock.data).label('data'),
-            MovimentoStock.tipo_movimento,
-            func.sum(MovimentoStock.quantidade).label('total_quantidade'),
-            func.count(MovimentoStock.id).label('total_movimentos')
-        ).filter(
-            MovimentoStock.instituicao_id == instituicao.id,
-            MovimentoStock.data >= data_inicio
-        ).group_by(
-            func.date(MovimentoStock.data),
-            MovimentoStock.tipo_movimento
-        ).all()
+        # Totais por dia a partir de movimentos_diarios
+        movimentos_por_data = MovimentosDiariosService.totais_por_dia(instituicao.id, data_inicio.date())
         
         # Organizar dados para o gráfico
         dados_grafico = {}
         for movimento in movimentos_por_data:
-            data_str = movimento.data.strftime('%Y-%m-%d')
+            data_str = movimento['dia'].strftime('%Y-%m-%d')
             if data_str not in dados_grafico:
                 dados_grafico[data_str] = {
                     'data': data_str,
@@ -193,12 +172,12 @@ def get_graficos_movimentos_tempo():
                     'saidas_count': 0
                 }
             
-            if movimento.tipo_movimento == 'entrada':
-                dados_grafico[data_str]['entradas'] = movimento.total_quantidade
-                dados_grafico[data_str]['entradas_count'] = movimento.total_movimentos
+            if movimento['tipo_movimento'] == 'entrada':
+                dados_grafico[data_str]['entradas'] = movimento['quantidade']
+                dados_grafico[data_str]['entradas_count'] = movimento['movimentos']
             else:
-                dados_grafico[data_str]['saidas'] = movimento.total_quantidade
-                dados_grafico[data_str]['saidas_count'] = movimento.total_movimentos
+                dados_grafico[data_str]['saidas'] = movimento['quantidade']
+                dados_grafico[data_str]['saidas_count'] = movimento['movimentos']
         
         # Converter para lista ordenada
         dados_lista = list(dados_grafico.values())
@@ -219,24 +198,24 @@ def get_graficos_categorias():
     try:
         instituicao = get_current_instituicao()
         
-        # Movimentos por categoria (apenas saídas para ver o que foi distribuído)
-        categorias_query = db.session.query(
-            ItemStock.categoria,
-            func.sum(MovimentoStock.quantidade).label('total_quantidade'),
-            func.count(MovimentoStock.id).label('total_movimentos')
-        ).join(
-            MovimentoStock, ItemStock.id == MovimentoStock.item_id
-        ).filter(
-            MovimentoStock.instituicao_id == instituicao.id,
-            MovimentoStock.tipo_movimento == 'saida'
-        ).group_by(ItemStock.categoria).all()
+        # Movimentos por categoria (apenas saídas para ver o que foi distribuído),
+        # somando os totais por item de movimentos_diarios
+        catalogo = CatalogoService.obter()
+        por_categoria = {}
+        totais = MovimentosDiariosService.totais_por_item(instituicao.id, tipo_movimento='saida')
+        for (_, item_id), total in totais.items():
+            item = catalogo.item(item_id)
+            categoria = item['categoria'] if item else None
+            dados = por_categoria.setdefault(categoria, {'quantidade': 0, 'movimentos': 0})
+            dados['quantidade'] += total['quantidade']
+            dados['movimentos'] += total['movimentos']
         
         dados_categorias = []
-        for categoria_data in categorias_query:
+        for categoria, dados in por_categoria.items():
             dados_categorias.append({
-                'categoria': categoria_data.categoria or 'Outros',
-                'quantidade': categoria_data.total_quantidade,
-                'movimentos': categoria_data.total_movimentos
+                'categoria': categoria or 'Outros',
+                'quantidade': dados['quantidade'],
+                'movimentos': dados['movimentos']
             })
         
         # Ordenar por quantidade (maior para menor)
@@ -268,32 +247,40 @@ def get_relatorio_mensal():
         else:
             data_fim = datetime(ano, mes + 1, 1)
         
-        # Movimentos do mês
-        movimentos_mes = MovimentoStock.query.filter(
-            MovimentoStock.instituicao_id == instituicao.id,
-            MovimentoStock.data >= data_inicio,
-            MovimentoStock.data < data_fim
-        ).all()
-        
-        # Estatísticas do mês
-        total_entradas = sum(m.quantidade for m in movimentos_mes if m.tipo_movimento == 'entrada')
-        total_saidas = sum(m.quantidade for m in movimentos_mes if m.tipo_movimento == 'saida')
+        # Totais do mês por tipo e item, a partir de movimentos_diarios
+        totais = MovimentosDiariosService.totais_por_item(instituicao.id, data_inicio.date(), data_fim.date())
+        total_movimentos = sum(total['movimentos'] for total in totais.values())
+        total_entradas = sum(total['quantidade'] for (tipo, _), total in totais.items() if tipo == 'entrada')
+        total_saidas = sum(total['quantidade'] for (tipo, _), total in totais.items() if tipo == 'saida')
         
-        # Beneficiários únicos atendidos no mês
-        beneficiarios_mes = set(m.beneficiario_nif for m in movimentos_mes 
-                               if m.tipo_movimento == 'saida' and m.beneficiario_nif)
+        # Beneficiários únicos atendidos no mês (união dos esboços diários)
+        beneficiarios_mes = MovimentosDiariosService.beneficiarios_distintos(
+            instituicao.id, data_inicio.date(), data_fim.date()
+        )
         
         # Itens mais movimentados
+        catalogo = CatalogoService.obter()
         itens_movimentados = {}
-        for movimento in movimentos_mes:
-            item_nome = movimento.item.nome
+        for (tipo, item_id), total in totais.items():
+            # Itens criados noutro worker podem ainda não estar no catálogo deste processo
+            item = catalogo.item(item_id)
+            item_nome = item['nome'] if item else f'Item {item_id}'
             if item_nome not in itens_movimentados:
                 itens_movimentados[item_nome] = {'entradas': 0, 'saidas': 0}
             
-            if movimento.tipo_movimento == 'entrada':
-                itens_movimentados[item_nome]['entradas'] += movimento.quantidade
+            if tipo == 'entrada':
+                itens_movimentados[item_nome]['entradas'] += total['quantidade']
             else:
-                itens_movimentados[item_nome]['saidas'] += movimento.quantidade
+                itens_movimentados[item_nome]['saidas'] += total['quantidade']
+        
+        # Movimentos detalhados do mês
+        movimentos_mes = MovimentoStock.query.options(
+            *MovimentoStock.opcoes_carregamento()
+        ).filter(
+            MovimentoStock.instituicao_id == instituicao.id,
+            MovimentoStock.data >= data_inicio,
+            MovimentoStock.data < data_fim
+        ).all()
         
         # Converter para lista ordenada
         itens_lista = []
@@ -317,10 +304,10 @@ def get_relatorio_mensal():
                     'data_fim': data_fim.isoformat()
                 },
                 'estatisticas': {
-                    'total_movimentos': len(movimentos_mes),
+                    'total_movimentos': total_movimentos,
                     'total_entradas': total_entradas,
                     'total_saidas': total_saidas,
-                    'beneficiarios_atendidos': len(beneficiarios_mes)
+                    'beneficiarios_atendidos': beneficiarios_mes
                 },
                 'itens_movimentados': itens_lista[:10],  # Top 10
                 'movimentos_detalhados': [m.to_dict() for m in movimentos_mes]
@@ -337,17 +324,21 @@ def get_alertas():
     try:
         alertas = []
         
-        # Verificar itens com stock baixo (menos de 10 unidades)
+        # Verificar itens com stock baixo (até EventosService.LIMIAR_STOCK_BAIXO unidades)
         itens_stock_baixo = []
-        itens = ItemStock.query.filter_by(ativo=True).all()
+        itens = CatalogoService.obter().itens_ativos()
+        saldos = SaldoService.obter_saldos([item['id'] for item in itens])
+        stock_por_item = {
+            item['id']: saldos.get(item['id'], SaldoService.saldo_vazio())['stock_total'] for item in itens
+        }
         
         for item in itens:
-            stock_total = item.get_stock_total()
-            if 0 < stock_total <= 10:
+            stock_total = stock_por_item[item['id']]
+            if 0 < stock_total <= EventosService.LIMIAR_STOCK_BAIXO:
                 itens_stock_baixo.append({
-                    'item': item.nome,
+                    'item': item['nome'],
                     'stock': stock_total,
-                    'unidade': item.unidade
+                    'unidade': item['unidade']
                 })
         
         if itens_stock_baixo:
@@ -361,9 +352,9 @@ def get_alertas():
         # Verificar itens sem stock
         itens_sem_stock = []
         for item in itens:
-            stock_total = item.get_stock_total()
+            stock_total = stock_por_item[item['id']]
             if stock_total <= 0:
-                itens_sem_stock.append(item.nome)
+                itens_sem_stock.append(item['nome'])
         
         if itens_sem_stock:
             alertas.append({
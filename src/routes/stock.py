@@ -2,11 +2,22 @@ from flask import Blueprint, request, jsonify
 from src.models.sistema_models import db, ItemStock, MovimentoStock, Beneficiario
 from src.routes.auth import login_required, get_current_instituicao
 from src.services.consulta_service import ConsultaService
-from sqlalchemy import and_, or_
+from src.services.saldo_service import SaldoService
+from src.services.stock_service import StockService
+from src.services.distribuicao_service import DistribuicaoService
+from src.services.importacao_service import ImportacaoService
+from src.services.paginacao_service import PaginacaoService
+from src.services.cache_service import CacheService
+from src.services.dashboard_service import DashboardService
+from src.services.catalogo_service import CatalogoService
+from sqlalchemy import and_
 from datetime import datetime, timedelta
 
 stock_bp = Blueprint('stock', __name__)
 
+# Número máximo de linhas aceites num pedido de saídas em lote
+MAX_DISTRIBUICOES_LOTE = 5000
+
 @stock_bp.route('/itens', methods=['GET'])
 @login_required
 def get_itens_stock():
@@ -15,30 +26,21 @@ def get_itens_stock():
         search = request.args.get('search', '').strip()
         categoria = request.args.get('categoria', '').strip()
         
-        query = ItemStock.query.filter_by(ativo=True)
-        
-        # Aplicar filtros
-        if search:
-            query = query.filter(
-                or_(
-                    ItemStock.nome.ilike(f'%{search}%'),
-                    ItemStock.descricao.ilike(f'%{search}%')
-                )
-            )
-        
-        if categoria:
-            query = query.filter(ItemStock.categoria == categoria)
-        
-        itens = query.order_by(ItemStock.categoria, ItemStock.nome).all()
+        # Itens ativos do catálogo em memória, filtrados por nome/descrição e categoria
+        itens = CatalogoService.obter().itens_ativos(search, categoria)
         
         itens_list = []
         instituicao = get_current_instituicao()
         
+        # Saldos de todos os itens numa única consulta
+        saldos = SaldoService.obter_saldos([item['id'] for item in itens], instituicao.id)
+        
         for item in itens:
-            item_dict = item.to_dict()
             # Adicionar stock movimentado por esta instituição
-            item_dict['stock_instituicao'] = item.get_stock_por_instituicao(instituicao.id)
-            itens_list.append(item_dict)
+            itens_list.append({
+                **item,
+                'stock_instituicao': saldos.get(item['id'], SaldoService.saldo_vazio())['stock_instituicao']
+            })
         
         return jsonify({
             'success': True,
@@ -87,17 +89,10 @@ def create_item_stock():
 def get_categorias():
     """Endpoint para obter as categorias de itens disponíveis"""
     try:
-        categorias_query = db.session.query(ItemStock.categoria).filter(
-            ItemStock.categoria.isnot(None),
-            ItemStock.ativo == True
-        ).distinct().all()
-        
-        categorias = [cat[0] for cat in categorias_query if cat[0]]
-        categorias.sort()
-        
+        # Categorias dos itens ativos, já ordenadas no catálogo em memória
         return jsonify({
             'success': True,
-            'categorias': categorias
+            'categorias': CatalogoService.obter().categorias
         }), 200
         
     except Exception as e:
@@ -106,7 +101,13 @@ def get_categorias():
 @stock_bp.route('/movimentos', methods=['GET'])
 @login_required
 def get_movimentos():
-    """Endpoint para obter os movimentos de stock da instituição atual"""
+    """
+    Endpoint para obter os movimentos de stock da instituição atual
+    
+    Paginação por cursor (data, id): usar o 'next_cursor' devolvido no parâmetro 'cursor'.
+    O total só é calculado com contar=exato ou contar=estimado. O parâmetro 'page'
+    mantém a paginação antiga por OFFSET para clientes existentes.
+    """
     try:
         instituicao = get_current_instituicao()
         
@@ -115,11 +116,14 @@ def get_movimentos():
         item_id = request.args.get('item_id', '')
         data_inicio = request.args.get('data_inicio', '')
         data_fim = request.args.get('data_fim', '')
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
+        contar = request.args.get('contar', '')
         
-        # Query base - apenas movimentos desta instituição
-        query = MovimentoStock.query.filter_by(instituicao_id=instituicao.id)
+        if contar not in PaginacaoService.MODOS_CONTAGEM:
+            return jsonify({'error': "contar inválido (use 'exato' ou 'estimado')"}), 400
+        
+        # Query base - apenas movimentos desta instituição (colunas já juntas, sem N+1)
+        query = MovimentoStock.consulta_linhas().filter(MovimentoStock.instituicao_id == instituicao.id)
         
         # Aplicar filtros
         if tipo_movimento:
@@ -136,28 +140,51 @@ def get_movimentos():
             data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
             query = query.filter(MovimentoStock.data < data_fim_dt)
         
-        # Ordenar por data (mais recentes primeiro)
-        query = query.order_by(MovimentoStock.data.desc())
-        
-        # Paginação
-        movimentos_paginated = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        if 'page' in request.args:
+            page = int(request.args.get('page', 1))
+            
+            # Paginação por OFFSET (compatibilidade)
+            movimentos_paginated = query.order_by(
+                MovimentoStock.data.desc(), MovimentoStock.id.desc()
+            ).paginate(
+                page=page,
+                per_page=per_page,
+                error_out=False
+            )
+            
+            return jsonify({
+                'success': True,
+                'movimentos': [MovimentoStock.linha_to_dict(linha) for linha in movimentos_paginated.items],
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': movimentos_paginated.total,
+                    'pages': movimentos_paginated.pages,
+                    'has_next': movimentos_paginated.has_next,
+                    'has_prev': movimentos_paginated.has_prev
+                }
+            }), 200
         
-        movimentos_list = [movimento.to_dict() for movimento in movimentos_paginated.items]
+        # Paginação por cursor: mais recentes primeiro, desempate por id
+        try:
+            pagina = PaginacaoService.paginar(
+                query,
+                (MovimentoStock.data, MovimentoStock.id),
+                lambda linha: (linha.data, linha.id),
+                request.args.get('cursor'),
+                per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'movimentos': movimentos_list,
+            'movimentos': [MovimentoStock.linha_to_dict(linha) for linha in pagina['linhas']],
             'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': movimentos_paginated.total,
-                'pages': movimentos_paginated.pages,
-                'has_next': movimentos_paginated.has_next,
-                'has_prev': movimentos_paginated.has_prev
+                'per_page': pagina['per_page'],
+                'next_cursor': pagina['next_cursor'],
+                'has_next': pagina['has_next'],
+                **PaginacaoService.contar(query, contar)
             }
         }), 200
         
@@ -211,6 +238,51 @@ def registar_entrada():
         db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@stock_bp.route('/entrada/importar', methods=['POST'])
+@login_required
+def importar_entradas():
+    """Endpoint para importar entradas de stock de um ficheiro CSV/XLSX (campo 'ficheiro')"""
+    try:
+        ficheiro = request.files.get('ficheiro')
+        if not ficheiro or not ficheiro.filename:
+            return jsonify({'error': 'Ficheiro é obrigatório'}), 400
+
+        formato = ImportacaoService.detetar_formato(ficheiro.filename)
+        if not formato:
+            return jsonify({'error': 'Formato não suportado (use .csv ou .xlsx)'}), 400
+
+        modo = request.form.get('modo', 'atomico')
+        if modo not in ('atomico', 'parcial'):
+            return jsonify({'error': "Modo inválido (use 'atomico' ou 'parcial')"}), 400
+
+        tamanho_bloco = int(request.form.get('tamanho_bloco', ImportacaoService.TAMANHO_BLOCO))
+        if tamanho_bloco <= 0:
+            return jsonify({'error': 'tamanho_bloco deve ser maior que zero'}), 400
+
+        instituicao = get_current_instituicao()
+
+        resultado = ImportacaoService.importar_entradas(
+            ficheiro.stream, formato, instituicao.id, modo, tamanho_bloco
+        )
+
+        if 'linhas_lidas' not in resultado:
+            return jsonify({'error': resultado['erro']}), 400
+
+        resposta = {
+            'success': resultado['sucesso'],
+            'message': f"{resultado['registadas']} de {resultado['linhas_lidas']} entradas registadas",
+            **{chave: valor for chave, valor in resultado.items() if chave != 'sucesso'}
+        }
+        if 'erro' in resultado:
+            resposta['error'] = resposta.pop('erro')
+            return jsonify(resposta), 500
+
+        return jsonify(resposta), 201 if resultado['registadas'] else 400
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @stock_bp.route('/saida', methods=['POST'])
 @login_required
 def registar_saida():
@@ -231,61 +303,64 @@ def registar_saida():
         if quantidade <= 0:
             return jsonify({'error': 'Quantidade deve ser maior que zero'}), 400
         
-        # Verificar se o item existe
-        item = ItemStock.query.get(item_id)
-        if not item:
-            return jsonify({'error': 'Item não encontrado'}), 404
-        
-        # CONSULTA CRUZADA: Verificar beneficiário no sistema completo
         instituicao = get_current_instituicao()
         
-        consulta = ConsultaService.consultar_beneficiario_por_nif(
-            beneficiario_nif, instituicao.id
+        # Item, beneficiário, stock disponível e histórico agregado numa única consulta
+        verificacao = DistribuicaoService.verificar_saida(
+            beneficiario_nif, item_id, quantidade, instituicao.id
         )
         
-        if not consulta['encontrado']:
+        item = verificacao['item']
+        if not item:
+            return jsonify({'error': 'Item não encontrado'}), 404
+        
+        beneficiario = verificacao['beneficiario']
+        if not beneficiario:
             return jsonify({
                 'error': 'Beneficiário não encontrado no sistema. Registre-o primeiro.'
             }), 404
         
         # Verificar se há stock suficiente (stock total, não apenas da instituição)
-        stock_total = item.get_stock_total()
+        stock_total = verificacao['stock_total']
         if stock_total < quantidade:
             return jsonify({
                 'error': f'Stock insuficiente. Disponível: {stock_total} {item.unidade}'
             }), 400
         
-        # SISTEMA DE ALERTAS - Verificar antes da distribuição
-        from src.models.alertas_sistema import AlertasSistema
+        # Alertas do sistema seguidos dos avisos da consulta cruzada
+        alertas = verificacao['alertas'] + verificacao['avisos']
+        sugestoes = verificacao['sugestoes']
         
-        verificacao = AlertasSistema.verificar_antes_distribuicao(
-            beneficiario_nif, item_id, quantidade
+        beneficiario_dict = beneficiario.to_dict()
+        total_ajudas_geral = (
+            verificacao['total_ajudas_instituicao_atual'] + verificacao['total_ajudas_outras_instituicoes']
         )
         
-        # Adicionar alertas da consulta cruzada aos alertas do sistema
-        if consulta['avisos']:
-            if 'alertas' not in verificacao:
-                verificacao['alertas'] = []
-            verificacao['alertas'].extend(consulta['avisos'])
-        
         # Se há alertas e não foi forçada a distribuição, retornar alertas
-        if verificacao.get('alertas') and not forcar_distribuicao:
+        if alertas and not forcar_distribuicao:
+            # Sugestão de priorização só é calculada quando é pedida confirmação
+            from src.models.alertas_sistema import AlertasSistema
+            if verificacao['alertas'] and item.categoria:
+                sugestao = AlertasSistema.sugestao_priorizar(item.categoria.lower())
+                if sugestao:
+                    sugestoes = sugestoes + [sugestao]
+            
             # Informações da consulta cruzada para o frontend
             info_consulta = {
-                'beneficiario': consulta['beneficiario'],
-                'total_ajudas_geral': consulta['total_ajudas_instituicao_atual'] + consulta['total_ajudas_outras_instituicoes'],
-                'instituicoes_que_ajudaram': consulta['instituicoes_que_ajudaram'],
-                'total_ajudas_outras_instituicoes': consulta['total_ajudas_outras_instituicoes']
+                'beneficiario': beneficiario_dict,
+                'total_ajudas_geral': total_ajudas_geral,
+                'instituicoes_que_ajudaram': verificacao['instituicoes_que_ajudaram'],
+                'total_ajudas_outras_instituicoes': verificacao['total_ajudas_outras_instituicoes']
             }
             
             return jsonify({
                 'requer_confirmacao': True,
-                'alertas': verificacao['alertas'],
-                'sugestoes': verificacao.get('sugestoes', []),
+                'alertas': alertas,
+                'sugestoes': sugestoes,
                 'beneficiario': {
-                    'nome': consulta['beneficiario']['nome'],
-                    'nif': consulta['beneficiario']['nif'],
-                    'zona': consulta['beneficiario'].get('zona_residencia', '')
+                    'nome': beneficiario.nome,
+                    'nif': beneficiario.nif,
+                    'zona': beneficiario.zona_residencia or ''
                 },
                 'item': {
                     'nome': item.nome,
@@ -309,26 +384,30 @@ def registar_saida():
         )
         
         db.session.add(movimento)
+        db.session.flush()
+        
+        # Serializar antes do commit: item, instituição e beneficiário já estão carregados
+        movimento_dict = movimento.to_dict()
         db.session.commit()
         
         # Preparar resposta com informações adicionais
         resposta = {
             'success': True,
             'message': 'Saída registada com sucesso',
-            'movimento': movimento.to_dict(),
+            'movimento': movimento_dict,
             'info_consulta': {
-                'beneficiario': consulta['beneficiario'],
-                'total_ajudas_geral': consulta['total_ajudas_instituicao_atual'] + consulta['total_ajudas_outras_instituicoes'],
-                'instituicoes_que_ajudaram': consulta['instituicoes_que_ajudaram']
+                'beneficiario': beneficiario_dict,
+                'total_ajudas_geral': total_ajudas_geral,
+                'instituicoes_que_ajudaram': verificacao['instituicoes_que_ajudaram']
             }
         }
         
         # Adicionar alertas informativos se existirem (mesmo após distribuição)
-        if verificacao.get('alertas'):
-            resposta['alertas_informativos'] = verificacao['alertas']
+        if alertas:
+            resposta['alertas_informativos'] = alertas
         
-        if verificacao.get('sugestoes'):
-            resposta['sugestoes'] = verificacao['sugestoes']
+        if sugestoes:
+            resposta['sugestoes'] = sugestoes
         
         return jsonify(resposta), 201
         
@@ -336,6 +415,93 @@ def registar_saida():
         db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@stock_bp.route('/saida/lote', methods=['POST'])
+@login_required
+def registar_saidas_lote():
+    """Endpoint para registar várias saídas de uma vez (distribuições em fila)"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('distribuicoes'), list) or not data['distribuicoes']:
+            return jsonify({'error': 'Lista de distribuições é obrigatória'}), 400
+        
+        distribuicoes = data['distribuicoes']
+        if len(distribuicoes) > MAX_DISTRIBUICOES_LOTE:
+            return jsonify({'error': f'Máximo de {MAX_DISTRIBUICOES_LOTE} distribuições por lote'}), 400
+        
+        if not all(isinstance(d, dict) for d in distribuicoes):
+            return jsonify({'error': 'Cada distribuição deve ser um objeto'}), 400
+        
+        # 'atomico': todo o lote é registado ou nada é; 'parcial': regista as linhas válidas
+        modo = data.get('modo', 'atomico')
+        if modo not in ('atomico', 'parcial'):
+            return jsonify({'error': "Modo inválido (use 'atomico' ou 'parcial')"}), 400
+        
+        tamanho_bloco = int(data.get('tamanho_bloco', 500))
+        if tamanho_bloco <= 0:
+            return jsonify({'error': 'tamanho_bloco deve ser maior que zero'}), 400
+        
+        instituicao = get_current_instituicao()
+        
+        resultados = DistribuicaoService.verificar_lote(
+            distribuicoes, instituicao.id, data.get('forcar_distribuicao', False)
+        )
+        validas = [r for r in resultados if r['estado'] == 'valida']
+        
+        if modo == 'atomico' and len(validas) != len(resultados):
+            for resultado in validas:
+                resultado['estado'] = 'nao_registada'
+            for resultado in resultados:
+                resultado.pop('movimento')
+            
+            return jsonify({
+                'success': False,
+                'error': 'Lote não registado: existem linhas rejeitadas ou a requerer confirmação',
+                'modo': modo,
+                'registadas': 0,
+                'resultados': resultados
+            }), 400
+        
+        # Inserção por blocos; no modo atómico só há commit no fim
+        registadas = 0
+        for inicio in range(0, len(validas), tamanho_bloco):
+            bloco = validas[inicio:inicio + tamanho_bloco]
+            ids = MovimentoStock.inserir_em_lote([r['movimento'] for r in bloco])
+            
+            for resultado, movimento_id in zip(bloco, ids):
+                resultado['estado'] = 'registada'
+                resultado['movimento_id'] = movimento_id
+            
+            if modo == 'parcial':
+                db.session.commit()
+                registadas += len(bloco)
+        
+        if modo == 'atomico':
+            db.session.commit()
+            registadas = len(validas)
+        
+        # inserir_em_lote não passa pelo flush do ORM: invalidar os totais de ajudas em cache
+        for nif in {r['movimento']['beneficiario_nif'] for r in validas}:
+            CacheService.invalidar_contagem(CacheService.chave_ajudas(instituicao.id, nif))
+        CacheService.invalidar_contagem(CacheService.chave_estatisticas_beneficiarios(instituicao.id))
+        if registadas:
+            DashboardService.marcar_alteradas([instituicao.id])
+        
+        for resultado in resultados:
+            resultado.pop('movimento')
+        
+        return jsonify({
+            'success': registadas > 0,
+            'message': f'{registadas} de {len(resultados)} saídas registadas',
+            'modo': modo,
+            'registadas': registadas,
+            'resultados': resultados
+        }), 201 if registadas else 400
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @stock_bp.route('/resumo', methods=['GET'])
 @login_required
 def get_resumo_stock():
@@ -343,57 +509,30 @@ def get_resumo_stock():
     try:
         instituicao = get_current_instituicao()
         
-        # Obter todos os itens ativos
-        itens = ItemStock.query.filter_by(ativo=True).all()
+        # Itens ativos com saldos (total e desta instituição) numa única consulta agrupada
+        itens_saldos = StockService.resumo_itens(instituicao.id)
         
         resumo_itens = []
         total_entradas_instituicao = 0
         total_saidas_instituicao = 0
         
-        for item in itens:
-            stock_total = item.get_stock_total()
-            stock_instituicao = item.get_stock_por_instituicao(instituicao.id)
-            
-            # Calcular entradas e saídas desta instituição
-            entradas = db.session.query(db.func.sum(MovimentoStock.quantidade)).filter_by(
-                item_id=item.id,
-                instituicao_id=instituicao.id,
-                tipo_movimento='entrada'
-            ).scalar() or 0
-            
-            saidas = db.session.query(db.func.sum(MovimentoStock.quantidade)).filter_by(
-                item_id=item.id,
-                instituicao_id=instituicao.id,
-                tipo_movimento='saida'
-            ).scalar() or 0
+        for item, stock_total, entradas, saidas in itens_saldos:
+            stock_instituicao = entradas - saidas
             
             total_entradas_instituicao += entradas
             total_saidas_instituicao += saidas
             
             if stock_total > 0 or stock_instituicao != 0:  # Mostrar apenas itens com movimento
                 resumo_itens.append({
-                    'item': item.to_dict(),
+                    'item': item,
                     'stock_total': stock_total,
                     'stock_instituicao': stock_instituicao,
                     'entradas_instituicao': entradas,
                     'saidas_instituicao': saidas
                 })
         
-        # Estatísticas gerais da instituição
-        total_movimentos = MovimentoStock.query.filter_by(instituicao_id=instituicao.id).count()
-        
-        # Movimentos recentes (últimos 7 dias)
-        data_limite = datetime.utcnow() - timedelta(days=7)
-        movimentos_recentes = MovimentoStock.query.filter(
-            MovimentoStock.instituicao_id == instituicao.id,
-            MovimentoStock.data >= data_limite
-        ).count()
-        
-        # Beneficiários únicos atendidos por esta instituição
-        beneficiarios_unicos = db.session.query(MovimentoStock.beneficiario_nif).filter_by(
-            instituicao_id=instituicao.id,
-            tipo_movimento='saida'
-        ).distinct().count()
+        # Total, movimentos recentes (7 dias) e beneficiários únicos numa única passagem
+        estatisticas = StockService.estatisticas_movimentos(instituicao.id)
         
         return jsonify({
             'success': True,
@@ -402,9 +541,9 @@ def get_resumo_stock():
                 'estatisticas': {
                     'total_entradas': total_entradas_instituicao,
                     'total_saidas': total_saidas_instituicao,
-                    'total_movimentos': total_movimentos,
-                    'movimentos_recentes': movimentos_recentes,
-                    'beneficiarios_unicos_atendidos': beneficiarios_unicos
+                    'total_movimentos': estatisticas['total_movimentos'],
+                    'movimentos_recentes': estatisticas['movimentos_recentes'],
+                    'beneficiarios_unicos_atendidos': estatisticas['beneficiarios_unicos_atendidos']
                 }
             }
         }), 200
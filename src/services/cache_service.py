@@ -0,0 +1,194 @@
+"""
+Serviço de cache em memória do processo
+Cache com expiração (TTL), cache das linhas de instituições usada na autenticação
+e contadores em cache para os totais das listagens paginadas
+"""
+
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import attributes, make_transient_to_detached
+from src.models.sistema_models import db, Beneficiario, Instituicao, MovimentoStock
+
+class CacheTTL:
+    """Dicionário partilhado entre threads cujas entradas expiram ao fim de ttl segundos"""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entradas = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        """Devolve o valor guardado, ou None se não existir ou tiver expirado"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            expira_em, valor = entrada
+            if expira_em < time.monotonic():
+                del self._entradas[chave]
+                return None
+            return valor
+
+    def guardar(self, chave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entradas[chave] = (time.monotonic() + ttl, valor)
+
+    def invalidar(self, chave=None):
+        """Remove uma entrada (ou todas, sem chave)"""
+        with self._lock:
+            if chave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(chave, None)
+
+class CacheService:
+    """
+    Cache das linhas de instituições, para identificar o utilizador sem ida à base de dados,
+    e dos totais usados na paginação (evita um COUNT(*) por página)
+    """
+
+    instituicoes = CacheTTL()
+    contagens = CacheTTL(ttl=300)
+
+    @staticmethod
+    def obter_instituicao(instituicao_id, ttl):
+        """
+        Obtém uma instituição, usando a cache do processo quando ttl > 0
+
+        A cache guarda apenas os valores das colunas; em cada pedido o objeto é
+        reconstruído e associado à sessão sem SELECT (merge com load=False).
+
+        Args:
+            instituicao_id (int): ID da instituição
+            ttl (int): Segundos de validade da cache (0 desativa)
+
+        Returns:
+            Instituicao ou None
+        """
+        if ttl <= 0:
+            return Instituicao.query.get(instituicao_id)
+
+        dados = CacheService.instituicoes.obter(instituicao_id)
+        if dados is not None:
+            instituicao = Instituicao(**dados)
+            make_transient_to_detached(instituicao)
+            return db.session.merge(instituicao, load=False)
+
+        instituicao = Instituicao.query.get(instituicao_id)
+        if instituicao is not None:
+            dados = {
+                atributo.key: getattr(instituicao, atributo.key)
+                for atributo in db.inspect(Instituicao).column_attrs
+            }
+            CacheService.instituicoes.guardar(instituicao_id, dados, ttl)
+        return instituicao
+
+    @staticmethod
+    def invalidar_instituicao(instituicao_id=None):
+        CacheService.instituicoes.invalidar(instituicao_id)
+
+    @staticmethod
+    def chave_beneficiarios(instituicao_id):
+        """Chave do total de beneficiários registados por uma instituição"""
+        return ('beneficiarios', instituicao_id)
+
+    @staticmethod
+    def chave_ajudas(instituicao_id, nif):
+        """Chave do total de saídas (ajudas) de uma instituição a um beneficiário"""
+        return ('ajudas', instituicao_id, nif)
+
+    @staticmethod
+    def chave_estatisticas_beneficiarios(instituicao_id):
+        """Chave das estatísticas de beneficiários de uma instituição (faixas etárias, zonas, ajudas)"""
+        return ('estatisticas_beneficiarios', instituicao_id)
+
+    @staticmethod
+    def contar(chave, query, ttl):
+        """
+        Total de linhas de uma consulta, guardado em cache até ser invalidado ou expirar
+
+        As alterações feitas pelo ORM invalidam a chave no flush/commit; as escritas em lote
+        (Core) chamam invalidar_contagem. O TTL limita o desvio de escritas feitas noutros
+        processos.
+
+        Args:
+            chave (tuple): Chave do contador (chave_beneficiarios, chave_ajudas)
+            query: Consulta cujo total é contado quando não está em cache
+            ttl (int): Segundos de validade (0 desativa a cache)
+
+        Returns:
+            int: Total de linhas
+        """
+        if ttl <= 0:
+            return query.order_by(None).count()
+
+        total = CacheService.contagens.obter(chave)
+        if total is None:
+            total = query.order_by(None).count()
+            CacheService.contagens.guardar(chave, total, ttl)
+        return total
+
+    @staticmethod
+    def invalidar_contagem(chave=None):
+        CacheService.contagens.invalidar(chave)
+
+@event.listens_for(db.session, 'after_flush')
+def _registar_instituicoes_alteradas(session, flush_context):
+    """Invalida a cache das instituições alteradas ou eliminadas (aprovação, rejeição, password...)"""
+    alteradas = {
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Instituicao) and obj.id is not None
+    }
+    if alteradas:
+        for instituicao_id in alteradas:
+            CacheService.invalidar_instituicao(instituicao_id)
+        session.info.setdefault('instituicoes_alteradas', set()).update(alteradas)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_instituicoes_apos_commit(session):
+    # Invalida de novo: outro pedido pode ter lido a linha antiga antes do commit
+    for instituicao_id in session.info.pop('instituicoes_alteradas', ()):
+        CacheService.invalidar_instituicao(instituicao_id)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _descartar_instituicoes_alteradas(session, previous_transaction):
+    session.info.pop('instituicoes_alteradas', None)
+
+def _valores_atuais_e_anteriores(obj, campo):
+    # Sem carregar atributos expirados: basta o que a sessão já conhece
+    historico = attributes.get_history(obj, campo, passive=attributes.PASSIVE_NO_INITIALIZE)
+    return set(historico.added or ()) | set(historico.unchanged or ()) | set(historico.deleted or ())
+
+@event.listens_for(db.session, 'after_flush')
+def _registar_contagens_alteradas(session, flush_context):
+    """Invalida os contadores e estatísticas de beneficiários e ajudas afetados pelo flush"""
+    chaves = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Beneficiario):
+            for instituicao_id in _valores_atuais_e_anteriores(obj, 'instituicao_registro_id'):
+                chaves.add(CacheService.chave_beneficiarios(instituicao_id))
+                chaves.add(CacheService.chave_estatisticas_beneficiarios(instituicao_id))
+        elif isinstance(obj, MovimentoStock):
+            for instituicao_id in _valores_atuais_e_anteriores(obj, 'instituicao_id'):
+                chaves.add(CacheService.chave_estatisticas_beneficiarios(instituicao_id))
+                for nif in _valores_atuais_e_anteriores(obj, 'beneficiario_nif'):
+                    if nif:
+                        chaves.add(CacheService.chave_ajudas(instituicao_id, nif))
+
+    if chaves:
+        for chave in chaves:
+            CacheService.invalidar_contagem(chave)
+        session.info.setdefault('contagens_alteradas', set()).update(chaves)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_contagens_apos_commit(session):
+    for chave in session.info.pop('contagens_alteradas', ()):
+        CacheService.invalidar_contagem(chave)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _descartar_contagens_alteradas(session, previous_transaction):
+    session.info.pop('contagens_alteradas', None)
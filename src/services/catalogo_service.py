@@ -0,0 +1,134 @@
+"""
+Serviço do catálogo de itens de stock em memória
+O catálogo (itens, categorias e índice de pesquisa) é lido uma vez e reutilizado até mudar
+"""
+
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from src.models.sistema_models import db, ItemStock
+from src.services.pesquisa_service import PesquisaService
+
+class Catalogo:
+    """
+    Fotografia imutável dos itens de stock numa versão do catálogo
+
+    Os dicionários dos itens são partilhados entre pedidos: quem precisar de
+    acrescentar campos deve criar uma cópia ({**item, ...}).
+    """
+
+    def __init__(self, versao, itens):
+        """
+        Args:
+            versao (int): Versão do catálogo a que a fotografia corresponde
+            itens (list): Dicionários ItemStock.to_dict() de todos os itens
+        """
+        self.versao = versao
+        self.criado_em = time.monotonic()
+        self.por_id = {item['id']: item for item in itens}
+
+        # Itens ativos por categoria e nome, como o ORDER BY do PostgreSQL (sem distinção de
+        # maiúsculas/acentos e categorias vazias no fim)
+        normalizar = PesquisaService.normalizar
+        self.ativos = sorted(
+            (item for item in itens if item['ativo']),
+            key=lambda item: (item['categoria'] is None, normalizar(item['categoria']), normalizar(item['nome']))
+        )
+
+        self.por_categoria = {}
+        for item in self.ativos:
+            self.por_categoria.setdefault(item['categoria'], []).append(item)
+        self.categorias = sorted(categoria for categoria in self.por_categoria if categoria)
+
+        # Índice de pesquisa: nome e descrição normalizados (sem acentos nem maiúsculas)
+        self.textos = {
+            item['id']: PesquisaService.normalizar(f"{item['nome']} {item['descricao'] or ''}")
+            for item in self.ativos
+        }
+        self.ids_por_nome = {item['nome'].strip().lower(): item['id'] for item in self.ativos}
+
+    def item(self, item_id):
+        """Dicionário do item (ativo ou não), ou None se não existir"""
+        return self.por_id.get(item_id)
+
+    def itens_ativos(self, search='', categoria=''):
+        """
+        Itens ativos ordenados por categoria e nome, opcionalmente filtrados
+
+        Args:
+            search (str): Texto contido no nome ou na descrição (sem distinção de acentos)
+            categoria (str): Categoria exata
+        """
+        itens = self.por_categoria.get(categoria, []) if categoria else self.ativos
+        termo = PesquisaService.normalizar(search)
+        if termo:
+            itens = [item for item in itens if termo in self.textos[item['id']]]
+        return itens
+
+class CatalogoService:
+    """Serviço do catálogo de itens versionado, partilhado pelos pedidos do processo"""
+
+    # Segundos de validade por omissão (alterações feitas noutros processos)
+    TTL = 300
+
+    _catalogo = None
+    _versao = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def obter():
+        """
+        Catálogo atual; só consulta a base de dados quando a versão mudou ou expirou
+
+        A versão é incrementada quando um item é criado ou alterado neste processo;
+        CACHE_CATALOGO_TTL limita o tempo até ver alterações feitas noutros processos
+        (0 desativa a cache).
+
+        Returns:
+            Catalogo
+        """
+        ttl = current_app.config.get('CACHE_CATALOGO_TTL', CatalogoService.TTL)
+
+        with CatalogoService._lock:
+            catalogo = CatalogoService._catalogo
+            versao = CatalogoService._versao
+
+        if (
+            catalogo is not None
+            and catalogo.versao == versao
+            and time.monotonic() - catalogo.criado_em < ttl
+        ):
+            return catalogo
+
+        catalogo = Catalogo(versao, [item.to_dict() for item in ItemStock.query.all()])
+
+        with CatalogoService._lock:
+            # Não guardar uma fotografia já ultrapassada por uma alteração entretanto confirmada
+            if CatalogoService._versao == versao:
+                CatalogoService._catalogo = catalogo
+        return catalogo
+
+    @staticmethod
+    def invalidar():
+        """Incrementa a versão do catálogo; a próxima leitura volta a carregar os itens"""
+        with CatalogoService._lock:
+            CatalogoService._versao += 1
+            CatalogoService._catalogo = None
+
+@event.listens_for(db.session, 'after_flush')
+def _registar_itens_alterados(session, flush_context):
+    if any(
+        isinstance(obj, ItemStock)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+    ):
+        session.info['catalogo_alterado'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_catalogo_apos_commit(session):
+    if session.info.pop('catalogo_alterado', False):
+        CatalogoService.invalidar()
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _descartar_itens_alterados(session, previous_transaction):
+    session.info.pop('catalogo_alterado', None)
@@ -0,0 +1,172 @@
+"""
+Serviço de compressão das respostas da API
+Comprime respostas JSON grandes em streaming (gzip/brotli) e recolhe estatísticas por endpoint
+"""
+
+import threading
+import time
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele usa-se apenas gzip
+    brotli = None
+
+class CompressaoService:
+    """Serviço de compressão negociada (Accept-Encoding) das respostas dos blueprints da API"""
+
+    # Respostas mais pequenas do que isto não compensam o custo de comprimir
+    LIMIAR_BYTES = 1024
+
+    # Níveis adequados a conteúdo dinâmico (compromisso tamanho/CPU)
+    NIVEL_GZIP = 6
+    QUALIDADE_BROTLI = 4
+
+    # Tamanho das fatias entregues ao compressor
+    TAMANHO_FATIA = 64 * 1024
+
+    TIPOS_COMPRIMIVEIS = ('application/json', 'text/')
+
+    # Fluxos de eventos (SSE) têm de chegar ao cliente sem o atraso do buffer do compressor
+    TIPOS_NAO_COMPRIMIVEIS = ('text/event-stream',)
+
+    _estatisticas = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def registar(app):
+        """Ativa a compressão das respostas da API na aplicação"""
+        app.after_request(CompressaoService.comprimir_resposta)
+
+    @staticmethod
+    def _codificacao_aceite():
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _novo_compressor(codificacao, config):
+        if codificacao == 'br':
+            compressor = brotli.Compressor(
+                quality=config.get('COMPRESSAO_QUALIDADE_BROTLI', CompressaoService.QUALIDADE_BROTLI)
+            )
+            return compressor.process, compressor.finish
+        compressor = zlib.compressobj(
+            config.get('COMPRESSAO_NIVEL_GZIP', CompressaoService.NIVEL_GZIP), zlib.DEFLATED, 31
+        )
+        return compressor.compress, compressor.flush
+
+    @staticmethod
+    def comprimir_resposta(resposta):
+        """
+        Hook after_request: substitui o corpo por um gerador que o comprime em fatias
+
+        O corpo original não é copiado para um segundo buffer completo: cada fatia é
+        comprimida e entregue ao servidor WSGI à medida que é produzida.
+        """
+        if (
+            request.blueprint is None
+            or request.method == 'HEAD'
+            or resposta.status_code < 200 or resposta.status_code in (204, 304)
+            or resposta.direct_passthrough
+            or 'Content-Encoding' in resposta.headers
+            or not (resposta.mimetype or '').startswith(CompressaoService.TIPOS_COMPRIMIVEIS)
+            or resposta.mimetype in CompressaoService.TIPOS_NAO_COMPRIMIVEIS
+        ):
+            return resposta
+
+        resposta.vary.add('Accept-Encoding')
+
+        limiar = current_app.config.get('COMPRESSAO_LIMIAR_BYTES', CompressaoService.LIMIAR_BYTES)
+        if not resposta.is_streamed and (resposta.calculate_content_length() or 0) < limiar:
+            return resposta
+
+        codificacao = CompressaoService._codificacao_aceite()
+        if codificacao is None:
+            return resposta
+
+        comprimir, terminar = CompressaoService._novo_compressor(codificacao, current_app.config)
+        corpo = resposta.iter_encoded()
+        endpoint = request.endpoint
+        tamanho_fatia = CompressaoService.TAMANHO_FATIA
+
+        def gerar():
+            bytes_originais = 0
+            bytes_comprimidos = 0
+            cpu = 0.0
+            try:
+                for bloco in corpo:
+                    vista = memoryview(bloco)
+                    for inicio in range(0, len(vista), tamanho_fatia):
+                        fatia = vista[inicio:inicio + tamanho_fatia]
+                        bytes_originais += len(fatia)
+                        antes = time.thread_time()
+                        saida = comprimir(fatia)
+                        cpu += time.thread_time() - antes
+                        if saida:
+                            bytes_comprimidos += len(saida)
+                            yield saida
+                antes = time.thread_time()
+                saida = terminar()
+                cpu += time.thread_time() - antes
+                bytes_comprimidos += len(saida)
+                yield saida
+            finally:
+                CompressaoService._registar_estatistica(
+                    endpoint, codificacao, bytes_originais, bytes_comprimidos, cpu
+                )
+
+        resposta.response = gerar()
+        resposta.headers['Content-Encoding'] = codificacao
+        resposta.headers.pop('Content-Length', None)
+        return resposta
+
+    @staticmethod
+    def _registar_estatistica(endpoint, codificacao, bytes_originais, bytes_comprimidos, cpu):
+        with CompressaoService._lock:
+            estatistica = CompressaoService._estatisticas.setdefault(endpoint, {
+                'respostas': 0, 'bytes_originais': 0, 'bytes_comprimidos': 0,
+                'cpu_segundos': 0.0, 'codificacoes': {}
+            })
+            estatistica['respostas'] += 1
+            estatistica['bytes_originais'] += bytes_originais
+            estatistica['bytes_comprimidos'] += bytes_comprimidos
+            estatistica['cpu_segundos'] += cpu
+            estatistica['codificacoes'][codificacao] = estatistica['codificacoes'].get(codificacao, 0) + 1
+
+    @staticmethod
+    def obter_estatisticas():
+        """
+        Estatísticas de compressão por endpoint desde o arranque do processo
+
+        Returns:
+            list: [{'endpoint', 'respostas', 'bytes_originais', 'bytes_comprimidos',
+                    'taxa_compressao', 'cpu_ms_total', 'cpu_ms_por_resposta', 'codificacoes'}]
+        """
+        with CompressaoService._lock:
+            copia = {e: dict(v, codificacoes=dict(v['codificacoes'])) for e, v in CompressaoService._estatisticas.items()}
+
+        resultado = []
+        for endpoint, estatistica in copia.items():
+            resultado.append({
+                'endpoint': endpoint,
+                'respostas': estatistica['respostas'],
+                'bytes_originais': estatistica['bytes_originais'],
+                'bytes_comprimidos': estatistica['bytes_comprimidos'],
+                'taxa_compressao': round(
+                    estatistica['bytes_originais'] / estatistica['bytes_comprimidos'], 2
+                ) if estatistica['bytes_comprimidos'] else None,
+                'cpu_ms_total': round(estatistica['cpu_segundos'] * 1000, 2),
+                'cpu_ms_por_resposta': round(estatistica['cpu_segundos'] * 1000 / estatistica['respostas'], 3),
+                'codificacoes': estatistica['codificacoes']
+            })
+
+        return sorted(resultado, key=lambda e: e['bytes_originais'], reverse=True)
+
+    @staticmethod
+    def limpar_estatisticas():
+        with CompressaoService._lock:
+            CompressaoService._estatisticas.clear()
@@ -3,11 +3,22 @@ Serviço para consultas cruzadas entre instituições
 """
 
 from src.models.sistema_models import db, Beneficiario, MovimentoStock, Instituicao
-from sqlalchemy import or_, and_
+from src.services.cache_service import CacheService
+from src.services.pesquisa_service import PesquisaService
+from sqlalchemy import and_, case, func
 
 class ConsultaService:
     """Serviço para consultas cruzadas de beneficiários"""
     
+    # Faixas etárias das estatísticas de beneficiários: (rótulo, condição sobre a idade)
+    FAIXAS_ETARIAS = (
+        ('0-17', lambda idade: idade.between(0, 17)),
+        ('18-35', lambda idade: idade.between(18, 35)),
+        ('36-60', lambda idade: idade.between(36, 60)),
+        ('60+', lambda idade: idade > 60),
+        ('Não informada', lambda idade: idade.is_(None)),
+    )
+    
     @staticmethod
     def consultar_beneficiario_por_nif(nif, instituicao_requisitante_id):
         """
@@ -32,7 +43,9 @@ class ConsultaService:
                 }
             
             # Buscar histórico completo (todas as instituições)
-            historico_completo = MovimentoStock.query.filter_by(
+            historico_completo = MovimentoStock.query.options(
+                *MovimentoStock.opcoes_carregamento()
+            ).filter_by(
                 beneficiario_nif=nif
             ).order_by(MovimentoStock.data.desc()).all()
             
@@ -52,11 +65,12 @@ class ConsultaService:
                         'data': movimento.data,
                         'item_nome': movimento.item.nome,
                         'quantidade': movimento.quantidade,
-                        'instituicao_nome': movimento.instituicao.nome,
-                        'tipo_instituicao': movimento.instituicao.tipo_instituicao
+                        'instituicao_nome': movimento.instituicao_movimento.nome if movimento.instituicao_movimento else None,
+                        'tipo_instituicao': movimento.instituicao_movimento.tipo_instituicao if movimento.instituicao_movimento else None
                     }
                     historico_outras_instituicoes.append(movimento_restrito)
-                    instituicoes_que_ajudaram.add(movimento.instituicao.nome)
+                    if movimento.instituicao_movimento:
+                        instituicoes_que_ajudaram.add(movimento.instituicao_movimento.nome)
             
             # Informações da instituição de registro
             instituicao_registro_info = None
@@ -91,8 +105,6 @@ class ConsultaService:
         """
         Gera alertas importantes sobre o beneficiário
         """
-        avisos = []
-        
         # Verificar se já recebeu ajuda recentemente
         from datetime import datetime, timedelta
         data_limite = datetime.utcnow() - timedelta(days=7)
@@ -100,23 +112,159 @@ class ConsultaService:
         ajudas_recentes = [m for m in historico_completo 
                           if m.data >= data_limite and m.tipo_movimento == 'saida']
         
-        if ajudas_recentes:
-            instituicoes_recentes = set(m.instituicao.nome for m in ajudas_recentes)
-            avisos.append(
-                f"⚠️ Recebeu {len(ajudas_recentes)} ajudas nos últimos 7 dias de: {', '.join(instituicoes_recentes)}"
-            )
+        instituicoes_recentes = set(m.instituicao_movimento.nome for m in ajudas_recentes
+                                    if m.instituicao_movimento)
         
         # Verificar se a instituição atual já ajudou recentemente
         ajudas_instituicao_atual = [m for m in ajudas_recentes 
                                    if m.instituicao_id == instituicao_requisitante_id]
         
-        if ajudas_instituicao_atual:
+        return ConsultaService.gerar_avisos(
+            len(ajudas_recentes), instituicoes_recentes, len(ajudas_instituicao_atual)
+        )
+    
+    @staticmethod
+    def gerar_avisos(total_ajudas_recentes, instituicoes_recentes, ajudas_recentes_instituicao_atual):
+        """
+        Gera os avisos de consulta a partir de contagens dos últimos 7 dias
+        """
+        avisos = []
+        
+        if total_ajudas_recentes:
             avisos.append(
-                f"📅 Sua instituição já ajudou este beneficiário {len(ajudas_instituicao_atual)} vez(es) na última semana"
+                f"⚠️ Recebeu {total_ajudas_recentes} ajudas nos últimos 7 dias de: {', '.join(instituicoes_recentes)}"
+            )
+        
+        if ajudas_recentes_instituicao_atual:
+            avisos.append(
+                f"📅 Sua instituição já ajudou este beneficiário {ajudas_recentes_instituicao_atual} vez(es) na última semana"
             )
         
         return avisos
     
+    @staticmethod
+    def contar_ajudas(nifs, instituicao_id, ttl=0):
+        """
+        Número de ajudas (saídas) da instituição a cada beneficiário, numa única consulta
+        
+        Os totais já em cache (CacheService.chave_ajudas) são reutilizados; os restantes são
+        obtidos com um GROUP BY beneficiario_nif sobre a lista IN e guardados em cache.
+        
+        Args:
+            nifs (iterable): NIFs dos beneficiários
+            instituicao_id (int): Instituição que prestou as ajudas
+            ttl (int): Segundos de validade da cache de contagens (0 desativa)
+            
+        Returns:
+            dict: {nif: total_ajudas} para todos os NIFs pedidos (0 se nunca foram ajudados)
+        """
+        totais = {}
+        em_falta = []
+        for nif in dict.fromkeys(nifs):
+            total = CacheService.contagens.obter(CacheService.chave_ajudas(instituicao_id, nif)) if ttl > 0 else None
+            if total is None:
+                em_falta.append(nif)
+            else:
+                totais[nif] = total
+        
+        if em_falta:
+            contagens = dict(db.session.query(
+                MovimentoStock.beneficiario_nif,
+                func.count(MovimentoStock.id)
+            ).filter(
+                MovimentoStock.instituicao_id == instituicao_id,
+                MovimentoStock.tipo_movimento == 'saida',
+                MovimentoStock.beneficiario_nif.in_(em_falta)
+            ).group_by(MovimentoStock.beneficiario_nif).all())
+            
+            for nif in em_falta:
+                totais[nif] = contagens.get(nif, 0)
+                if ttl > 0:
+                    CacheService.contagens.guardar(CacheService.chave_ajudas(instituicao_id, nif), totais[nif], ttl)
+        
+        return totais
+    
+    @staticmethod
+    def estatisticas_beneficiarios(instituicao_id, ttl=0):
+        """
+        Estatísticas dos beneficiários registados pela instituição, numa única consulta
+        
+        Uma consulta agrupada por zona de residência calcula, com agregação condicional,
+        as faixas etárias e quantos beneficiários já foram ajudados pela instituição; o
+        total de ajudas da instituição segue na mesma consulta como subconsulta escalar.
+        O resultado fica em cache até os beneficiários ou as saídas da instituição mudarem.
+        
+        Args:
+            instituicao_id (int): ID da instituição
+            ttl (int): Segundos de validade da cache (0 desativa)
+            
+        Returns:
+            dict: {'total_beneficiarios', 'beneficiarios_com_ajuda', 'beneficiarios_sem_ajuda',
+                   'total_ajudas_instituicao', 'zonas_residencia', 'faixas_etarias'}
+        """
+        chave = CacheService.chave_estatisticas_beneficiarios(instituicao_id)
+        if ttl > 0:
+            estatisticas = CacheService.contagens.obter(chave)
+            if estatisticas is not None:
+                return estatisticas
+        
+        saidas_instituicao = and_(
+            MovimentoStock.instituicao_id == instituicao_id,
+            MovimentoStock.tipo_movimento == 'saida'
+        )
+        
+        # NIFs ajudados pela instituição (index-only em ix_movimentos_instituicao_tipo)
+        ajudados = db.session.query(
+            MovimentoStock.beneficiario_nif.label('nif')
+        ).filter(saidas_instituicao).distinct().subquery()
+        
+        total_ajudas = db.session.query(
+            func.count(MovimentoStock.id)
+        ).filter(saidas_instituicao).scalar_subquery()
+        
+        linhas = db.session.query(
+            Beneficiario.zona_residencia,
+            func.count(Beneficiario.nif).label('total'),
+            func.count(ajudados.c.nif).label('com_ajuda'),
+            *[
+                func.count(case((condicao(Beneficiario.idade), 1))).label(f'faixa_{indice}')
+                for indice, (_, condicao) in enumerate(ConsultaService.FAIXAS_ETARIAS)
+            ],
+            total_ajudas.label('total_ajudas')
+        ).outerjoin(
+            ajudados, ajudados.c.nif == Beneficiario.nif
+        ).filter(
+            Beneficiario.instituicao_registro_id == instituicao_id
+        ).group_by(Beneficiario.zona_residencia).all()
+        
+        if linhas:
+            total_ajudas_instituicao = linhas[0].total_ajudas
+        else:
+            # Sem beneficiários não há linhas agrupadas onde ler o total de ajudas
+            total_ajudas_instituicao = db.session.query(total_ajudas).scalar()
+        
+        total_beneficiarios = sum(linha.total for linha in linhas)
+        com_ajuda = sum(linha.com_ajuda for linha in linhas)
+        
+        estatisticas = {
+            'total_beneficiarios': total_beneficiarios,
+            'beneficiarios_com_ajuda': com_ajuda,
+            'beneficiarios_sem_ajuda': total_beneficiarios - com_ajuda,
+            'total_ajudas_instituicao': total_ajudas_instituicao or 0,
+            'zonas_residencia': [
+                {'zona': linha.zona_residencia or 'Não especificada', 'count': linha.total}
+                for linha in linhas
+            ],
+            'faixas_etarias': [
+                {'faixa': faixa, 'count': sum(getattr(linha, f'faixa_{indice}') for linha in linhas)}
+                for indice, (faixa, _) in enumerate(ConsultaService.FAIXAS_ETARIAS)
+            ]
+        }
+        
+        if ttl > 0:
+            CacheService.contagens.guardar(chave, estatisticas, ttl)
+        return estatisticas
+    
     @staticmethod
     def buscar_beneficiarios_instituicao(instituicao_id, search=''):
         """
@@ -127,13 +275,8 @@ class ConsultaService:
         )
         
         if search:
-            query = query.filter(
-                or_(
-                    Beneficiario.nome.ilike(f'%{search}%'),
-                    Beneficiario.nif.ilike(f'%{search}%'),
-                    Beneficiario.zona_residencia.ilike(f'%{search}%')
-                )
-            )
+            # Pesquisa por trigramas, sem distinção de acentos (ver PesquisaService)
+            query = PesquisaService.filtrar(query, instituicao_id, search)
         
         return query.order_by(Beneficiario.nome).all()
     
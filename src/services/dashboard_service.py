@@ -0,0 +1,297 @@
+"""
+Serviço das fotografias (snapshots) das estatísticas do dashboard
+Os indicadores são recalculados em segundo plano e servidos a partir da memória do processo
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, func
+from src.models.sistema_models import db, Beneficiario, ItemStock, MovimentoStock
+from src.services.catalogo_service import CatalogoService
+from src.services.eventos_service import EventosService
+from src.services.stock_service import StockService
+
+class DashboardService:
+    """
+    Fotografias das estatísticas do dashboard por instituição
+
+    Uma thread do processo recalcula, a cada DASHBOARD_INTERVALO_ATUALIZACAO segundos,
+    as fotografias das instituições que consultaram o dashboard, e mais cedo as que
+    tiveram movimentos ou beneficiários alterados. Os pedidos devolvem a fotografia
+    guardada, com a data em que foi gerada.
+    """
+
+    # Segundos entre atualizações completas (0 desativa a thread: recálculo no pedido)
+    INTERVALO = 30
+
+    # Segundos de espera após uma alteração, para juntar várias numa só atualização
+    ATRASO_ALTERACAO = 2
+
+    # Instituições sem consultas ao dashboard há mais deste tempo deixam de ser atualizadas
+    INATIVIDADE = 3600
+
+    _sistema = None
+    _instituicoes = {}
+    _consultas = {}
+    _alteradas = set()
+    _sistema_alterado = False
+    _alteracao = threading.Event()
+    _pid = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def calcular_sistema():
+        """
+        Estatísticas gerais do sistema (iguais para todas as instituições) numa única consulta
+
+        Returns:
+            dict: {'gerado_em', 'dados'}
+        """
+        gerado_em = datetime.utcnow()
+        total_beneficiarios = db.session.query(func.count(Beneficiario.nif)).scalar_subquery()
+        com_ajuda = db.session.query(
+            func.count(func.distinct(Beneficiario.nif))
+        ).join(
+            MovimentoStock, Beneficiario.nif == MovimentoStock.beneficiario_nif
+        ).filter(
+            MovimentoStock.tipo_movimento == 'saida'
+        ).scalar_subquery()
+
+        linha = db.session.query(total_beneficiarios.label('total'), com_ajuda.label('com_ajuda')).one()
+        total = linha.total or 0
+        com_ajuda = linha.com_ajuda or 0
+
+        return {
+            'gerado_em': gerado_em,
+            'dados': {
+                'total_beneficiarios': total,
+                'beneficiarios_com_ajuda': com_ajuda,
+                'beneficiarios_sem_ajuda': total - com_ajuda,
+                'total_itens_stock': len(CatalogoService.obter().itens_ativos())
+            }
+        }
+
+    @staticmethod
+    def calcular_instituicao(instituicao_id):
+        """
+        Estatísticas dos movimentos de uma instituição (uma consulta)
+
+        Returns:
+            dict: {'gerado_em', 'dados'}
+        """
+        gerado_em = datetime.utcnow()
+        estatisticas = StockService.estatisticas_movimentos(instituicao_id)
+
+        return {
+            'gerado_em': gerado_em,
+            'dados': {
+                'total_movimentos': estatisticas['total_movimentos'],
+                'total_entradas': estatisticas['total_entradas'],
+                'total_saidas': estatisticas['total_saidas'],
+                'beneficiarios_atendidos': estatisticas['beneficiarios_unicos_atendidos'],
+                'movimentos_recentes': estatisticas['movimentos_recentes']
+            }
+        }
+
+    @staticmethod
+    def obter(instituicao, fresco=False):
+        """
+        Estatísticas do dashboard de uma instituição a partir da fotografia guardada
+
+        Só calcula no pedido quando ainda não há fotografia, quando fresco=True ou, sem
+        thread de atualização (intervalo 0), quando houve alterações desde o último cálculo.
+
+        Args:
+            instituicao (Instituicao): Instituição autenticada
+            fresco (bool): Recalcular agora, ignorando a fotografia
+
+        Returns:
+            dict: {'stats': {'sistema', 'instituicao'}, 'gerado_em'}
+        """
+        intervalo = DashboardService.iniciar_atualizador()
+
+        with DashboardService._lock:
+            DashboardService._consultas[instituicao.id] = time.monotonic()
+            sistema = DashboardService._sistema
+            proprias = DashboardService._instituicoes.get(instituicao.id)
+            if intervalo <= 0:
+                if DashboardService._sistema_alterado:
+                    sistema = None
+                if instituicao.id in DashboardService._alteradas:
+                    proprias = None
+
+        # As estatísticas gerais são recalculadas com as da instituição (uma consulta),
+        # para que gerado_em corresponda a toda a fotografia
+        if fresco or proprias is None:
+            proprias = DashboardService._recalcular_instituicao(instituicao.id)
+            sistema = None
+        if sistema is None:
+            sistema = DashboardService._recalcular_sistema()
+
+        return {
+            'stats': {
+                'sistema': sistema['dados'],
+                'instituicao': {'nome': instituicao.nome, **proprias['dados']}
+            },
+            'gerado_em': min(sistema['gerado_em'], proprias['gerado_em'])
+        }
+
+    # As marcas de alteração são retiradas antes de calcular: uma alteração confirmada
+    # durante o cálculo volta a marcar a fotografia para a atualização seguinte
+
+    @staticmethod
+    def _recalcular_sistema():
+        with DashboardService._lock:
+            DashboardService._sistema_alterado = False
+        fotografia = DashboardService.calcular_sistema()
+        with DashboardService._lock:
+            DashboardService._sistema = fotografia
+        return fotografia
+
+    @staticmethod
+    def _recalcular_instituicao(instituicao_id):
+        with DashboardService._lock:
+            DashboardService._alteradas.discard(instituicao_id)
+        fotografia = DashboardService.calcular_instituicao(instituicao_id)
+        with DashboardService._lock:
+            DashboardService._instituicoes[instituicao_id] = fotografia
+        return fotografia
+
+    @staticmethod
+    def marcar_alteradas(instituicoes_ids=(), sistema=True):
+        """
+        Regista alterações confirmadas (commit) que tornam fotografias desatualizadas
+
+        Chamado pelos listeners da sessão e, nos caminhos em lote que não passam pelo
+        flush do ORM, por quem faz o commit.
+
+        Args:
+            instituicoes_ids (iterable): Instituições cujos movimentos mudaram
+            sistema (bool): Se as estatísticas gerais também mudaram
+        """
+        with DashboardService._lock:
+            DashboardService._alteradas.update(i for i in instituicoes_ids if i is not None)
+            DashboardService._sistema_alterado = DashboardService._sistema_alterado or sistema
+        DashboardService._alteracao.set()
+
+    @staticmethod
+    def atualizar(todas=False):
+        """
+        Recalcula as fotografias desatualizadas (ou todas) das instituições ativas
+
+        Instituições ativas são as que consultaram o dashboard há menos de INATIVIDADE
+        segundos ou que têm clientes de eventos ligados; estes recebem um evento
+        'estatisticas' quando os valores da fotografia mudam.
+
+        Args:
+            todas (bool): Recalcular também as que não tiveram alterações
+                          (datas recentes e alterações feitas noutros processos)
+
+        Returns:
+            int: Número de fotografias de instituições recalculadas
+        """
+        limite = time.monotonic() - DashboardService.INATIVIDADE
+        with DashboardService._lock:
+            for instituicao_id, consulta in list(DashboardService._consultas.items()):
+                if consulta < limite:
+                    del DashboardService._consultas[instituicao_id]
+                    DashboardService._instituicoes.pop(instituicao_id, None)
+            ativas = set(DashboardService._consultas) | EventosService.instituicoes_subscritas()
+            recalcular = ativas if todas else ativas & DashboardService._alteradas
+            sistema = todas or bool(recalcular) or DashboardService._sistema_alterado
+            anteriores = {i: DashboardService._instituicoes.get(i) for i in ativas}
+            sistema_anterior = DashboardService._sistema
+
+        if sistema:
+            DashboardService._recalcular_sistema()
+        for instituicao_id in recalcular:
+            DashboardService._recalcular_instituicao(instituicao_id)
+
+        with DashboardService._lock:
+            sistema_atual = DashboardService._sistema
+            atuais = {i: DashboardService._instituicoes.get(i) for i in ativas}
+
+        sistema_mudou = sistema_anterior is None or sistema_atual['dados'] != sistema_anterior['dados']
+        for instituicao_id, proprias in atuais.items():
+            anterior = anteriores[instituicao_id]
+            if proprias is None or not (
+                sistema_mudou or anterior is None or proprias['dados'] != anterior['dados']
+            ):
+                continue
+            EventosService.publicar('estatisticas', {
+                'sistema': sistema_atual['dados'],
+                'instituicao': proprias['dados'],
+                'gerado_em': min(sistema_atual['gerado_em'], proprias['gerado_em'])
+            }, instituicao_id)
+        return len(recalcular)
+
+    @staticmethod
+    def iniciar_atualizador():
+        """
+        Arranca a thread de atualização uma vez por processo (também em workers criados por fork)
+
+        Returns:
+            int: DASHBOARD_INTERVALO_ATUALIZACAO (0: sem thread)
+        """
+        intervalo = current_app.config.get('DASHBOARD_INTERVALO_ATUALIZACAO', DashboardService.INTERVALO)
+        if intervalo <= 0:
+            return intervalo
+
+        with DashboardService._lock:
+            if DashboardService._pid == os.getpid():
+                return intervalo
+            DashboardService._pid = os.getpid()
+
+        threading.Thread(
+            target=DashboardService._atualizar_periodicamente,
+            args=(current_app._get_current_object(), intervalo),
+            name='dashboard-fotografias',
+            daemon=True
+        ).start()
+        return intervalo
+
+    @staticmethod
+    def _atualizar_periodicamente(app, intervalo):
+        while True:
+            alterado = DashboardService._alteracao.wait(intervalo)
+            if alterado:
+                time.sleep(DashboardService.ATRASO_ALTERACAO)
+            DashboardService._alteracao.clear()
+
+            with app.app_context():
+                try:
+                    DashboardService.atualizar(todas=not alterado)
+                except Exception as e:
+                    print(f"⚠️ Erro ao atualizar fotografias do dashboard: {e}")
+                finally:
+                    db.session.remove()
+
+@event.listens_for(db.session, 'after_flush')
+def _registar_dashboard_alterado(session, flush_context):
+    """Regista as instituições com movimentos alterados e se as estatísticas gerais mudaram"""
+    instituicoes = set()
+    sistema = False
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, MovimentoStock):
+            instituicoes.add(obj.instituicao_id)
+            sistema = sistema or obj.tipo_movimento == 'saida'
+        elif isinstance(obj, (Beneficiario, ItemStock)):
+            sistema = True
+
+    if instituicoes or sistema:
+        alteracoes = session.info.setdefault('dashboard_alterado', {'instituicoes': set(), 'sistema': False})
+        alteracoes['instituicoes'].update(instituicoes)
+        alteracoes['sistema'] = alteracoes['sistema'] or sistema
+
+@event.listens_for(db.session, 'after_commit')
+def _marcar_dashboard_apos_commit(session):
+    alteracoes = session.info.pop('dashboard_alterado', None)
+    if alteracoes:
+        DashboardService.marcar_alteradas(alteracoes['instituicoes'], alteracoes['sistema'])
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _descartar_dashboard_alterado(session, previous_transaction):
+    session.info.pop('dashboard_alterado', None)
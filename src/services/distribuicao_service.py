@@ -0,0 +1,342 @@
+"""
+Serviço de verificação de distribuições (saídas de stock)
+Reúne em consultas agregadas tudo o que é necessário para validar saídas
+"""
+
+from datetime import datetime, timedelta
+from src.models.sistema_models import db, Beneficiario, Instituicao, ItemStock, MovimentoStock, SaldoStock
+from src.models.alertas_sistema import AlertasSistema
+from src.services.consulta_service import ConsultaService
+from src.services.saldo_service import SaldoService
+from sqlalchemy import case, func, true
+
+class DistribuicaoService:
+    """Serviço para validação rápida de saídas para beneficiários"""
+
+    DIAS_RECENTES = 7
+
+    @staticmethod
+    def expressao_corte_periodo(categoria):
+        """
+        Expressão SQL com a data de início do período de limite da categoria
+
+        Args:
+            categoria: Expressão SQL com a categoria do item
+
+        Returns:
+            Expressão CASE (NULL quando a categoria não tem limites)
+        """
+        agora = datetime.utcnow()
+        cortes = {
+            nome: agora - timedelta(days=config['periodo_dias'])
+            for nome, config in AlertasSistema.LIMITES_CATEGORIA.items()
+        }
+        return case(cortes, value=func.lower(categoria), else_=None)
+
+    @staticmethod
+    def verificar_saida(beneficiario_nif, item_id, quantidade, instituicao_id):
+        """
+        Obtém item, beneficiário, stock disponível e histórico agregado numa única consulta
+        e gera os avisos e alertas da distribuição
+
+        Args:
+            beneficiario_nif (str): NIF do beneficiário
+            item_id (int): ID do item a distribuir
+            quantidade (float): Quantidade a distribuir
+            instituicao_id (int): ID da instituição que distribui
+
+        Returns:
+            dict: {'item', 'beneficiario', 'stock_total', 'total_ajudas_instituicao_atual',
+                   'total_ajudas_outras_instituicoes', 'instituicoes_que_ajudaram',
+                   'avisos', 'alertas', 'sugestoes'}
+        """
+        data_recente = datetime.utcnow() - timedelta(days=DistribuicaoService.DIAS_RECENTES)
+
+        corte_periodo = db.session.query(
+            DistribuicaoService.expressao_corte_periodo(ItemStock.categoria)
+        ).filter(ItemStock.id == item_id).scalar_subquery()
+
+        mesmo_item = MovimentoStock.item_id == item_id
+        recente = MovimentoStock.data >= data_recente
+
+        # Histórico de saídas do beneficiário agregado por instituição
+        historico = db.session.query(
+            MovimentoStock.instituicao_id.label('instituicao_id'),
+            func.count(MovimentoStock.id).label('total'),
+            func.count(case((recente, MovimentoStock.id))).label('recentes'),
+            func.count(case((mesmo_item & recente, MovimentoStock.id))).label('item_recentes'),
+            func.sum(case(
+                (mesmo_item & (MovimentoStock.data >= corte_periodo), MovimentoStock.quantidade),
+                else_=0
+            )).label('quantidade_periodo')
+        ).filter(
+            MovimentoStock.beneficiario_nif == beneficiario_nif,
+            MovimentoStock.tipo_movimento == 'saida'
+        ).group_by(MovimentoStock.instituicao_id).subquery()
+
+        stock_total = db.session.query(
+            func.coalesce(func.sum(SaldoStock.entradas - SaldoStock.saidas), 0)
+        ).filter(SaldoStock.item_id == item_id).scalar_subquery()
+
+        linhas = db.session.query(
+            ItemStock,
+            Beneficiario,
+            stock_total.label('stock_total'),
+            historico.c.instituicao_id,
+            Instituicao.nome.label('instituicao_nome'),
+            historico.c.total,
+            historico.c.recentes,
+            historico.c.item_recentes,
+            historico.c.quantidade_periodo
+        ).select_from(ItemStock).outerjoin(
+            Beneficiario, Beneficiario.nif == beneficiario_nif
+        ).outerjoin(
+            historico, true()
+        ).outerjoin(
+            Instituicao, Instituicao.id == historico.c.instituicao_id
+        ).filter(
+            ItemStock.id == item_id
+        ).all()
+
+        resultado = {
+            'item': None,
+            'beneficiario': None,
+            'stock_total': 0,
+            'total_ajudas_instituicao_atual': 0,
+            'total_ajudas_outras_instituicoes': 0,
+            'instituicoes_que_ajudaram': [],
+            'avisos': [],
+            'alertas': [],
+            'sugestoes': []
+        }
+
+        if not linhas:
+            return resultado
+
+        resultado['item'] = linhas[0].ItemStock
+        resultado['beneficiario'] = linhas[0].Beneficiario
+        resultado['stock_total'] = linhas[0].stock_total or 0
+
+        if resultado['beneficiario'] is None:
+            return resultado
+
+        instituicoes_recentes = []
+        ajudas_recentes = 0
+        ajudas_recentes_instituicao_atual = 0
+        item_recentes = 0
+        quantidade_periodo = 0
+
+        for linha in linhas:
+            if linha.total is None:
+                continue
+
+            ajudas_recentes += linha.recentes
+            item_recentes += linha.item_recentes
+            quantidade_periodo += linha.quantidade_periodo or 0
+
+            if linha.recentes and linha.instituicao_nome:
+                instituicoes_recentes.append(linha.instituicao_nome)
+
+            if linha.instituicao_id == instituicao_id:
+                resultado['total_ajudas_instituicao_atual'] += linha.total
+                ajudas_recentes_instituicao_atual += linha.recentes
+            else:
+                resultado['total_ajudas_outras_instituicoes'] += linha.total
+                if linha.instituicao_nome:
+                    resultado['instituicoes_que_ajudaram'].append(linha.instituicao_nome)
+
+        resultado['avisos'] = ConsultaService.gerar_avisos(
+            ajudas_recentes, instituicoes_recentes, ajudas_recentes_instituicao_atual
+        )
+
+        item = resultado['item']
+        limites = AlertasSistema.obter_limites_item(item.categoria, item.nome)
+        if limites:
+            resultado['alertas'], resultado['sugestoes'] = AlertasSistema.gerar_alertas(
+                resultado['beneficiario'].nome, item, limites, quantidade,
+                quantidade_periodo, item_recentes, ajudas_recentes
+            )
+
+        return resultado
+
+    @staticmethod
+    def normalizar_item_id(valor):
+        """
+        Converte o item_id recebido num inteiro, como aceite por /api/stock/saida (ex.: 3 ou "3")
+
+        Returns:
+            int ou None se o valor não for um ID numérico (incluindo booleanos)
+        """
+        if isinstance(valor, bool):
+            return None
+        if isinstance(valor, int):
+            return valor
+        if isinstance(valor, str) and valor.strip().isdigit():
+            return int(valor.strip())
+        return None
+
+    @staticmethod
+    def verificar_lote(distribuicoes, instituicao_id, forcar_distribuicao=False):
+        """
+        Valida um lote de saídas com consultas por conjunto (itens, beneficiários,
+        saldos e histórico) e avalia as linhas pela ordem recebida, acumulando o
+        stock consumido e as quantidades já aceites no próprio lote
+
+        Args:
+            distribuicoes (list): Dicionários com beneficiario_nif, item_id e quantidade
+            instituicao_id (int): ID da instituição que distribui
+            forcar_distribuicao (bool): Ignorar alertas em todas as linhas
+
+        Returns:
+            list: Um resultado por linha {'linha', 'estado', 'erro', 'alertas', 'movimento'}
+                  com estado 'valida', 'rejeitada' ou 'requer_confirmacao'
+        """
+        item_ids = {DistribuicaoService.normalizar_item_id(d.get('item_id')) for d in distribuicoes}
+        item_ids.discard(None)
+        nifs = {str(d.get('beneficiario_nif')) for d in distribuicoes if d.get('beneficiario_nif')}
+
+        itens = {item.id: item for item in ItemStock.query.filter(ItemStock.id.in_(item_ids)).all()} if item_ids else {}
+        beneficiarios = dict(
+            db.session.query(Beneficiario.nif, Beneficiario.nome).filter(Beneficiario.nif.in_(nifs)).all()
+        ) if nifs else {}
+        stock = {
+            item_id: saldo['stock_total']
+            for item_id, saldo in SaldoService.obter_saldos(itens.keys()).items()
+        }
+
+        # Histórico recente agregado por (beneficiário, item, instituição) numa única consulta
+        agora = datetime.utcnow()
+        data_recente = agora - timedelta(days=DistribuicaoService.DIAS_RECENTES)
+        maior_periodo = max(
+            [DistribuicaoService.DIAS_RECENTES] +
+            [config['periodo_dias'] for config in AlertasSistema.LIMITES_CATEGORIA.values()]
+        )
+        corte_periodo = DistribuicaoService.expressao_corte_periodo(ItemStock.categoria)
+        recente = MovimentoStock.data >= data_recente
+
+        historico = db.session.query(
+            MovimentoStock.beneficiario_nif,
+            MovimentoStock.item_id,
+            MovimentoStock.instituicao_id,
+            Instituicao.nome.label('instituicao_nome'),
+            func.count(case((recente, MovimentoStock.id))).label('recentes'),
+            func.sum(case(
+                (MovimentoStock.data >= corte_periodo, MovimentoStock.quantidade), else_=0
+            )).label('quantidade_periodo')
+        ).join(
+            ItemStock, ItemStock.id == MovimentoStock.item_id
+        ).outerjoin(
+            Instituicao, Instituicao.id == MovimentoStock.instituicao_id
+        ).filter(
+            MovimentoStock.beneficiario_nif.in_(beneficiarios.keys()),
+            MovimentoStock.tipo_movimento == 'saida',
+            MovimentoStock.data >= agora - timedelta(days=maior_periodo)
+        ).group_by(
+            MovimentoStock.beneficiario_nif,
+            MovimentoStock.item_id,
+            MovimentoStock.instituicao_id,
+            Instituicao.nome
+        ).all() if beneficiarios else []
+
+        quantidade_periodo = {}   # (nif, item_id) -> quantidade no período do limite
+        item_recentes = {}        # (nif, item_id) -> saídas nos últimos 7 dias
+        recentes = {}             # nif -> saídas nos últimos 7 dias
+        recentes_instituicao = {} # nif -> saídas da instituição atual nos últimos 7 dias
+        instituicoes_recentes = {}
+
+        for linha in historico:
+            chave = (linha.beneficiario_nif, linha.item_id)
+            quantidade_periodo[chave] = quantidade_periodo.get(chave, 0) + (linha.quantidade_periodo or 0)
+            item_recentes[chave] = item_recentes.get(chave, 0) + linha.recentes
+            recentes[linha.beneficiario_nif] = recentes.get(linha.beneficiario_nif, 0) + linha.recentes
+            if linha.recentes:
+                if linha.instituicao_id == instituicao_id:
+                    recentes_instituicao[linha.beneficiario_nif] = (
+                        recentes_instituicao.get(linha.beneficiario_nif, 0) + linha.recentes
+                    )
+                if linha.instituicao_nome:
+                    nomes = instituicoes_recentes.setdefault(linha.beneficiario_nif, [])
+                    if linha.instituicao_nome not in nomes:
+                        nomes.append(linha.instituicao_nome)
+
+        instituicao_atual = db.session.get(Instituicao, instituicao_id)
+
+        resultados = []
+        for indice, distribuicao in enumerate(distribuicoes):
+            resultado = {'linha': indice, 'estado': 'rejeitada', 'erro': None, 'alertas': [], 'movimento': None}
+            resultados.append(resultado)
+
+            item_id = distribuicao.get('item_id')
+            quantidade = distribuicao.get('quantidade')
+            nif = distribuicao.get('beneficiario_nif')
+            nif = str(nif) if nif else None
+
+            if item_id in (None, '') or not nif or quantidade is None:
+                resultado['erro'] = 'item_id, quantidade e beneficiario_nif são obrigatórios'
+                continue
+
+            item_id = DistribuicaoService.normalizar_item_id(item_id)
+            if item_id is None:
+                resultado['erro'] = 'item_id deve ser um número inteiro'
+                continue
+
+            if not isinstance(quantidade, (int, float)) or quantidade <= 0:
+                resultado['erro'] = 'Quantidade deve ser maior que zero'
+                continue
+
+            item = itens.get(item_id)
+            if not item:
+                resultado['erro'] = 'Item não encontrado'
+                continue
+
+            if nif not in beneficiarios:
+                resultado['erro'] = 'Beneficiário não encontrado no sistema. Registre-o primeiro.'
+                continue
+
+            disponivel = stock.get(item_id, 0)
+            if disponivel < quantidade:
+                resultado['erro'] = f'Stock insuficiente. Disponível: {disponivel} {item.unidade}'
+                continue
+
+            chave = (nif, item_id)
+            alertas = []
+            limites = AlertasSistema.obter_limites_item(item.categoria, item.nome)
+            if limites:
+                alertas, _ = AlertasSistema.gerar_alertas(
+                    beneficiarios[nif], item, limites, quantidade,
+                    quantidade_periodo.get(chave, 0), item_recentes.get(chave, 0), recentes.get(nif, 0)
+                )
+            alertas += ConsultaService.gerar_avisos(
+                recentes.get(nif, 0), instituicoes_recentes.get(nif, []), recentes_instituicao.get(nif, 0)
+            )
+            resultado['alertas'] = alertas
+
+            if alertas and not (forcar_distribuicao or distribuicao.get('forcar_distribuicao')):
+                resultado['estado'] = 'requer_confirmacao'
+                continue
+
+            resultado['estado'] = 'valida'
+            resultado['movimento'] = {
+                'item_id': item_id,
+                'instituicao_id': instituicao_id,
+                'beneficiario_nif': nif,
+                'tipo_movimento': 'saida',
+                'quantidade': quantidade,
+                'data': agora,
+                'motivo': distribuicao.get('motivo', ''),
+                'observacoes': distribuicao.get('observacoes', ''),
+                'local_entrega': distribuicao.get('local_entrega', '')
+            }
+
+            # As linhas seguintes do lote veem esta saída como já registada
+            stock[item_id] = disponivel - quantidade
+            quantidade_periodo[chave] = quantidade_periodo.get(chave, 0) + quantidade
+            item_recentes[chave] = item_recentes.get(chave, 0) + 1
+            recentes[nif] = recentes.get(nif, 0) + 1
+            recentes_instituicao[nif] = recentes_instituicao.get(nif, 0) + 1
+            if instituicao_atual:
+                nomes = instituicoes_recentes.setdefault(nif, [])
+                if instituicao_atual.nome not in nomes:
+                    nomes.append(instituicao_atual.nome)
+
+        return resultados
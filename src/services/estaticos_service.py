@@ -0,0 +1,225 @@
+"""
+Serviço de ficheiros estáticos da interface (SPA)
+Manifesto construído no arranque: nomes com hash, variantes comprimidas e ETags
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from flask import Response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só se servem as variantes gzip
+    brotli = None
+
+class EstaticosService:
+    """Serviço para servir a interface a partir de um manifesto em memória"""
+
+    # Subpasta (dentro de static) com variantes comprimidas, nomeadas pelo hash do conteúdo
+    PASTA_COMPRIMIDOS = '.comprimidos'
+
+    TIPOS_COMPRIMIVEIS = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/vnd.microsoft.icon', 'image/x-icon')
+    TAMANHO_MINIMO_COMPRESSAO = 1024
+
+    # Ficheiros maiores que isto não ficam em memória (servidos do disco)
+    TAMANHO_MAXIMO_MEMORIA = 5 * 1024 * 1024
+
+    CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+    CACHE_REVALIDAR = 'no-cache'
+
+    @staticmethod
+    def _listar_ficheiros(pasta):
+        for raiz, pastas, ficheiros in os.walk(pasta):
+            pastas[:] = [p for p in pastas if not p.startswith('.')]
+            for nome in ficheiros:
+                if not nome.startswith('.'):
+                    completo = os.path.join(raiz, nome)
+                    yield os.path.relpath(completo, pasta).replace(os.sep, '/'), completo
+
+    @staticmethod
+    def _nome_com_hash(caminho, digest):
+        base, extensao = os.path.splitext(caminho)
+        return f'{base}.{digest[:12]}{extensao}'
+
+    @staticmethod
+    def _reescrever_referencias(html, nomes_hash):
+        """Substitui src="app.js" / href="app.js" pelos nomes com hash"""
+        def substituir(correspondencia):
+            atributo, aspas, caminho = correspondencia.groups()
+            caminho_limpo = caminho.lstrip('/')
+            if caminho_limpo not in nomes_hash:
+                return correspondencia.group(0)
+            prefixo = '/' if caminho.startswith('/') else ''
+            return f'{atributo}={aspas}{prefixo}{nomes_hash[caminho_limpo]}{aspas}'
+
+        return re.sub(r'(src|href)=(["\'])([^"\'#?:]+)\2', substituir, html)
+
+    @staticmethod
+    def _variantes(pasta, conteudo, digest, comprimir_brotli):
+        """Obtém gzip/br do conteúdo: do disco (flask comprimir-estaticos) ou gzip em memória"""
+        variantes = {}
+        pasta_comprimidos = os.path.join(pasta, EstaticosService.PASTA_COMPRIMIDOS)
+
+        for codificacao, extensao in (('br', 'br'), ('gzip', 'gz')):
+            caminho = os.path.join(pasta_comprimidos, f'{digest}.{extensao}')
+            if os.path.exists(caminho):
+                with open(caminho, 'rb') as f:
+                    variantes[codificacao] = f.read()
+
+        if 'gzip' not in variantes:
+            variantes['gzip'] = gzip.compress(conteudo, compresslevel=9, mtime=0)
+        if 'br' not in variantes and comprimir_brotli and brotli is not None:
+            variantes['br'] = brotli.compress(conteudo, quality=11)
+
+        # Só vale a pena quando a variante é efetivamente menor
+        return {c: dados for c, dados in variantes.items() if len(dados) < len(conteudo)}
+
+    @staticmethod
+    def construir_manifesto(pasta, comprimir_brotli=False):
+        """
+        Lê a pasta de estáticos e prepara a resposta de cada ficheiro
+
+        Os ficheiros HTML são reescritos para referenciar os restantes pelos nomes com hash.
+
+        Args:
+            pasta (str): Pasta static da aplicação
+            comprimir_brotli (bool): Gerar variantes brotli em memória (lento; usado pelo CLI)
+
+        Returns:
+            dict: {'pasta', 'ficheiros': {caminho: entrada}, 'por_hash': {nome_hash: caminho}}
+        """
+        manifesto = {'pasta': pasta, 'ficheiros': {}, 'por_hash': {}}
+        if not pasta or not os.path.isdir(pasta):
+            return manifesto
+
+        ficheiros = sorted(EstaticosService._listar_ficheiros(pasta))
+        html = [(c, p) for c, p in ficheiros if c.endswith('.html')]
+        outros = [(c, p) for c, p in ficheiros if not c.endswith('.html')]
+
+        def registar(caminho, completo, conteudo=None):
+            if conteudo is None:
+                tamanho = os.path.getsize(completo)
+                if tamanho <= EstaticosService.TAMANHO_MAXIMO_MEMORIA:
+                    with open(completo, 'rb') as f:
+                        conteudo = f.read()
+                    digest = hashlib.sha256(conteudo).hexdigest()
+                else:
+                    digest = hashlib.sha256(str((tamanho, os.path.getmtime(completo))).encode()).hexdigest()
+            else:
+                digest = hashlib.sha256(conteudo).hexdigest()
+
+            mimetype = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+            comprimivel = (
+                conteudo is not None
+                and len(conteudo) >= EstaticosService.TAMANHO_MINIMO_COMPRESSAO
+                and mimetype.startswith(EstaticosService.TIPOS_COMPRIMIVEIS)
+            )
+            nome_hash = EstaticosService._nome_com_hash(caminho, digest)
+
+            manifesto['ficheiros'][caminho] = {
+                'caminho': caminho,
+                'nome_hash': nome_hash,
+                'digest': digest,
+                'mimetype': mimetype,
+                'conteudo': conteudo,
+                'variantes': (
+                    EstaticosService._variantes(pasta, conteudo, digest, comprimir_brotli)
+                    if comprimivel else {}
+                )
+            }
+            manifesto['por_hash'][nome_hash] = caminho
+
+        for caminho, completo in outros:
+            registar(caminho, completo)
+
+        nomes_hash = {c: e['nome_hash'] for c, e in manifesto['ficheiros'].items()}
+        for caminho, completo in html:
+            with open(completo, encoding='utf-8') as f:
+                conteudo = EstaticosService._reescrever_referencias(f.read(), nomes_hash)
+            registar(caminho, completo, conteudo.encode('utf-8'))
+
+        return manifesto
+
+    @staticmethod
+    def escrever_variantes(manifesto):
+        """
+        Grava no disco as variantes gzip/br de todos os ficheiros do manifesto
+
+        Returns:
+            int: Número de ficheiros comprimidos gravados
+        """
+        pasta_comprimidos = os.path.join(manifesto['pasta'], EstaticosService.PASTA_COMPRIMIDOS)
+        os.makedirs(pasta_comprimidos, exist_ok=True)
+
+        digests = set()
+        gravados = 0
+        for entrada in manifesto['ficheiros'].values():
+            digests.add(entrada['digest'])
+            for codificacao, dados in entrada['variantes'].items():
+                extensao = 'br' if codificacao == 'br' else 'gz'
+                with open(os.path.join(pasta_comprimidos, f"{entrada['digest']}.{extensao}"), 'wb') as f:
+                    f.write(dados)
+                gravados += 1
+
+        # Remover variantes de versões anteriores dos ficheiros
+        for nome in os.listdir(pasta_comprimidos):
+            if nome.split('.')[0] not in digests:
+                os.remove(os.path.join(pasta_comprimidos, nome))
+
+        return gravados
+
+    @staticmethod
+    def url(manifesto, caminho):
+        """URL com hash de um ficheiro estático (o próprio caminho se não existir no manifesto)"""
+        entrada = manifesto['ficheiros'].get(caminho)
+        return f"/{entrada['nome_hash']}" if entrada else f'/{caminho}'
+
+    @staticmethod
+    def servir(manifesto, caminho):
+        """
+        Resposta para um pedido à interface
+
+        - Nomes com hash: Cache-Control immutable (1 ano)
+        - Nomes originais e index.html (SPA): no-cache, revalidados com ETag → 304
+        - Content-Encoding br/gzip conforme Accept-Encoding
+        """
+        if caminho in manifesto['por_hash']:
+            entrada = manifesto['ficheiros'][manifesto['por_hash'][caminho]]
+            cache_control = EstaticosService.CACHE_IMUTAVEL
+        else:
+            entrada = manifesto['ficheiros'].get(caminho) or manifesto['ficheiros'].get('index.html')
+            cache_control = EstaticosService.CACHE_REVALIDAR
+            if entrada is None:
+                return "index.html not found", 404
+
+        if entrada['conteudo'] is None:
+            resposta = send_from_directory(manifesto['pasta'], entrada['caminho'], conditional=True)
+            resposta.headers['Cache-Control'] = cache_control
+            return resposta
+
+        codificacao = None
+        for candidata in ('br', 'gzip'):
+            if candidata in entrada['variantes'] and request.accept_encodings[candidata]:
+                codificacao = candidata
+                break
+
+        # ETag diferente por codificação (representações distintas do mesmo conteúdo)
+        etag = entrada['digest'][:32] + (f'-{codificacao}' if codificacao else '')
+        etags_validas = [entrada['digest'][:32]] + [f"{entrada['digest'][:32]}-{c}" for c in entrada['variantes']]
+
+        if request.if_none_match.star_tag or any(request.if_none_match.contains_weak(e) for e in etags_validas):
+            resposta = Response(status=304)
+        else:
+            dados = entrada['variantes'][codificacao] if codificacao else entrada['conteudo']
+            resposta = Response(dados, mimetype=entrada['mimetype'])
+            if codificacao:
+                resposta.headers['Content-Encoding'] = codificacao
+
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = cache_control
+        if entrada['variantes']:
+            resposta.vary.add('Accept-Encoding')
+        return resposta
@@ -0,0 +1,376 @@
+"""
+Serviço de eventos em tempo real (Server-Sent Events) do dashboard
+Os movimentos confirmados são processados uma vez por processo e distribuídos aos clientes ligados
+"""
+
+import os
+import queue
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
+from src.models.sistema_models import (
+    db, Beneficiario, MovimentoStock, CAMPOS_SALDO_MOVIMENTO, OBSERVADORES_INSERCAO_EM_LOTE
+)
+from src.services.catalogo_service import CatalogoService
+from src.services.saldo_service import SaldoService
+
+# Campos de um movimento incluídos nos eventos
+CAMPOS_EVENTO = CAMPOS_SALDO_MOVIMENTO + ('id', 'beneficiario_nif', 'data', 'motivo', 'origem_doacao')
+
+class AlteracoesMovimentos:
+    """Movimentos alterados numa ou mais transações, resumidos para publicação após o commit"""
+
+    def __init__(self):
+        # instituicao_id -> [(acao, valores)], no máximo MAX_EVENTOS_MOVIMENTO + 1 por instituição
+        self.movimentos = {}
+        # instituicao_id -> número de movimentos alterados
+        self.totais = {}
+        # item_id -> variação do stock total
+        self.deltas_stock = {}
+
+    def adicionar(self, acao, antes=None, depois=None):
+        """
+        Args:
+            acao (str): 'criado', 'alterado' ou 'removido'
+            antes (dict): Valores anteriores (alterações e remoções)
+            depois (dict): Valores atuais (inserções e alterações)
+        """
+        for valores, sinal in ((antes, -1), (depois, 1)):
+            if valores:
+                quantidade = valores['quantidade'] or 0
+                if valores['tipo_movimento'] != 'entrada':
+                    quantidade = -quantidade
+                item_id = valores['item_id']
+                self.deltas_stock[item_id] = self.deltas_stock.get(item_id, 0) + sinal * quantidade
+
+        valores = depois or antes
+        instituicao_id = valores['instituicao_id']
+        self.totais[instituicao_id] = self.totais.get(instituicao_id, 0) + 1
+        lista = self.movimentos.setdefault(instituicao_id, [])
+        if len(lista) <= EventosService.MAX_EVENTOS_MOVIMENTO:
+            lista.append((acao, valores))
+
+    def juntar(self, outras):
+        """Acrescenta as alterações de outra transação (publicação agrupada)"""
+        for instituicao_id, lista in outras.movimentos.items():
+            destino = self.movimentos.setdefault(instituicao_id, [])
+            destino.extend(lista[:EventosService.MAX_EVENTOS_MOVIMENTO + 1 - len(destino)])
+        for instituicao_id, total in outras.totais.items():
+            self.totais[instituicao_id] = self.totais.get(instituicao_id, 0) + total
+        for item_id, delta in outras.deltas_stock.items():
+            self.deltas_stock[item_id] = self.deltas_stock.get(item_id, 0) + delta
+
+class Subscricao:
+    """Cliente SSE ligado: fila própria de eventos já formatados"""
+
+    def __init__(self, instituicao_id):
+        self.instituicao_id = instituicao_id
+        self.fila = queue.Queue(maxsize=EventosService.TAMANHO_FILA)
+        # Eventos descartados por fila cheia: o cliente tem de recarregar os dados
+        self.perdeu_eventos = False
+
+class EventosService:
+    """
+    Publicação em processo dos movimentos de stock confirmados
+
+    Os listeners da sessão (e inserir_em_lote, através de OBSERVADORES_INSERCAO_EM_LOTE)
+    registam os movimentos de cada transação; após o commit, uma thread do processo
+    consulta uma única vez os saldos e nomes necessários e distribui os eventos pelas
+    filas dos clientes ligados. Sem clientes ligados nada é registado.
+
+    Eventos: 'movimento' (novo/alterado/removido, no formato de atividade-recente),
+    'movimentos' (resumo de lotes grandes), 'saldo', 'alerta', 'estatisticas' e
+    'ressincronizar' (eventos perdidos: recarregar).
+    """
+
+    # Eventos por cliente à espera de envio; acima disto o cliente é mandado ressincronizar
+    TAMANHO_FILA = 200
+
+    # Acima deste número de movimentos numa publicação, envia-se só o resumo ('movimentos')
+    MAX_EVENTOS_MOVIMENTO = 50
+
+    # Segundos entre comentários keepalive (também o tempo até detetar um cliente desligado)
+    INTERVALO_KEEPALIVE = 15
+
+    # Milissegundos de espera do navegador antes de voltar a ligar
+    RETRY_MS = 5000
+
+    # Limiar dos alertas de stock baixo (o mesmo de /api/dashboard/alertas)
+    LIMIAR_STOCK_BAIXO = 10
+
+    _subscricoes = {}
+    _confirmadas = queue.Queue()
+    _pid = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def tem_subscricoes():
+        return bool(EventosService._subscricoes)
+
+    @staticmethod
+    def instituicoes_subscritas():
+        with EventosService._lock:
+            return set(EventosService._subscricoes)
+
+    @staticmethod
+    def subscrever(instituicao_id):
+        """
+        Regista um cliente SSE da instituição e garante a thread de publicação do processo
+
+        Returns:
+            Subscricao
+        """
+        subscricao = Subscricao(instituicao_id)
+        with EventosService._lock:
+            EventosService._subscricoes.setdefault(instituicao_id, set()).add(subscricao)
+            iniciar = EventosService._pid != os.getpid()
+            EventosService._pid = os.getpid()
+
+        if iniciar:
+            threading.Thread(
+                target=EventosService._publicar_confirmadas,
+                args=(current_app._get_current_object(),),
+                name='eventos-movimentos',
+                daemon=True
+            ).start()
+        return subscricao
+
+    @staticmethod
+    def cancelar(subscricao):
+        with EventosService._lock:
+            subscricoes = EventosService._subscricoes.get(subscricao.instituicao_id)
+            if subscricoes is not None:
+                subscricoes.discard(subscricao)
+                if not subscricoes:
+                    del EventosService._subscricoes[subscricao.instituicao_id]
+
+    @staticmethod
+    def formatar(tipo, dados):
+        """Evento no formato text/event-stream (dados em JSON numa linha)"""
+        return f"event: {tipo}\ndata: {current_app.json.dumps(dados)}\n\n"
+
+    @staticmethod
+    def publicar(tipo, dados, instituicao_id=None):
+        """
+        Envia um evento aos clientes de uma instituição (ou a todos, sem instituicao_id)
+
+        O evento é serializado uma só vez, independentemente do número de clientes.
+        Requer contexto da aplicação (fornecedor JSON).
+        """
+        with EventosService._lock:
+            if instituicao_id is None:
+                subscricoes = [s for grupo in EventosService._subscricoes.values() for s in grupo]
+            else:
+                subscricoes = list(EventosService._subscricoes.get(instituicao_id, ()))
+        if not subscricoes:
+            return
+
+        texto = EventosService.formatar(tipo, dados)
+        for subscricao in subscricoes:
+            try:
+                subscricao.fila.put_nowait(texto)
+            except queue.Full:
+                subscricao.perdeu_eventos = True
+
+    @staticmethod
+    def transmitir(subscricao):
+        """
+        Gerador do corpo da resposta SSE de um cliente; cancela a subscrição ao terminar
+
+        Um cliente desligado é detetado na escrita seguinte (no máximo INTERVALO_KEEPALIVE).
+        """
+        try:
+            yield f"retry: {EventosService.RETRY_MS}\n\n"
+            while True:
+                try:
+                    texto = subscricao.fila.get(timeout=EventosService.INTERVALO_KEEPALIVE)
+                except queue.Empty:
+                    texto = ': keepalive\n\n'
+
+                if subscricao.perdeu_eventos:
+                    subscricao.perdeu_eventos = False
+                    # Descartar o que ficou na fila: o cliente vai recarregar tudo
+                    while not subscricao.fila.empty():
+                        subscricao.fila.get_nowait()
+                    texto = 'event: ressincronizar\ndata: {}\n\n'
+                yield texto
+        finally:
+            EventosService.cancelar(subscricao)
+
+    @staticmethod
+    def atividade(acao, valores, item, beneficiario_nome):
+        """Evento de um movimento com os campos de /api/dashboard/atividade-recente"""
+        atividade = {
+            'acao': acao,
+            'id': valores['id'],
+            'tipo': valores['tipo_movimento'],
+            'item_id': valores['item_id'],
+            'item_nome': item.get('nome'),
+            'quantidade': valores['quantidade'],
+            'unidade': item.get('unidade'),
+            'data': valores['data'],
+            'motivo': valores['motivo']
+        }
+
+        if valores['tipo_movimento'] == 'saida' and beneficiario_nome is not None:
+            atividade['beneficiario_nome'] = beneficiario_nome
+            atividade['beneficiario_nif'] = valores['beneficiario_nif']
+        elif valores['tipo_movimento'] == 'entrada':
+            atividade['origem_doacao'] = valores['origem_doacao']
+
+        return atividade
+
+    @staticmethod
+    def alerta_stock(item, anterior, atual):
+        """Alerta quando o stock total de um item passa a baixo ou esgotado (None caso contrário)"""
+        limiar = EventosService.LIMIAR_STOCK_BAIXO
+        nome = item.get('nome', f"Item {item.get('id')}")
+
+        if atual <= 0 < anterior:
+            return {
+                'tipo': 'danger',
+                'titulo': 'Item Esgotado',
+                'mensagem': f'{nome} sem stock',
+                'item_id': item.get('id')
+            }
+        if 0 < atual <= limiar < anterior:
+            return {
+                'tipo': 'warning',
+                'titulo': 'Stock Baixo',
+                'mensagem': f"{nome}: {atual} {item.get('unidade') or ''} em stock".strip(),
+                'item_id': item.get('id')
+            }
+        return None
+
+    @staticmethod
+    def _publicar_confirmadas(app):
+        while True:
+            alteracoes = EventosService._confirmadas.get()
+            # Juntar as transações entretanto confirmadas numa só publicação
+            while True:
+                try:
+                    alteracoes.juntar(EventosService._confirmadas.get_nowait())
+                except queue.Empty:
+                    break
+
+            with app.app_context():
+                try:
+                    EventosService.publicar_alteracoes(alteracoes)
+                except Exception as e:
+                    print(f"⚠️ Erro ao publicar eventos de movimentos: {e}")
+                finally:
+                    db.session.remove()
+
+    @staticmethod
+    def publicar_alteracoes(alteracoes):
+        """
+        Distribui os eventos de um conjunto de alterações confirmadas
+
+        No máximo duas consultas (nomes dos beneficiários e saldos), seja qual for o
+        número de clientes ligados.
+        """
+        catalogo = CatalogoService.obter()
+
+        nifs = {
+            valores['beneficiario_nif']
+            for lista in alteracoes.movimentos.values() for _, valores in lista
+            if valores['beneficiario_nif']
+        }
+        nomes = dict(
+            db.session.query(Beneficiario.nif, Beneficiario.nome).filter(Beneficiario.nif.in_(nifs)).all()
+        ) if nifs else {}
+
+        for instituicao_id, lista in alteracoes.movimentos.items():
+            total = alteracoes.totais[instituicao_id]
+            if total > EventosService.MAX_EVENTOS_MOVIMENTO:
+                EventosService.publicar('movimentos', {'total': total}, instituicao_id)
+                continue
+            for acao, valores in lista:
+                item = catalogo.item(valores['item_id']) or {}
+                EventosService.publicar(
+                    'movimento',
+                    EventosService.atividade(acao, valores, item, nomes.get(valores['beneficiario_nif'])),
+                    instituicao_id
+                )
+
+        # O stock total de um item é visível a todas as instituições
+        deltas = {item_id: delta for item_id, delta in alteracoes.deltas_stock.items() if delta}
+        saldos = SaldoService.obter_saldos(deltas)
+        vazio = SaldoService.saldo_vazio()
+        for item_id, delta in deltas.items():
+            item = catalogo.item(item_id) or {'id': item_id}
+            atual = saldos.get(item_id, vazio)['stock_total']
+            EventosService.publicar('saldo', {
+                'item_id': item_id,
+                'item_nome': item.get('nome'),
+                'unidade': item.get('unidade'),
+                'stock_total': atual
+            })
+
+            alerta = EventosService.alerta_stock(item, atual - delta, atual)
+            if alerta:
+                EventosService.publicar('alerta', alerta)
+
+def _valores_evento(movimento, anteriores=False):
+    valores = {}
+    for campo in CAMPOS_EVENTO:
+        valor = getattr(movimento, campo)
+        if anteriores:
+            historico = attributes.get_history(movimento, campo)
+            if historico.deleted:
+                valor = historico.deleted[0]
+        valores[campo] = valor
+    return valores
+
+def _alteracoes_da_sessao(session):
+    alteracoes = session.info.get('eventos_movimentos')
+    if alteracoes is None:
+        alteracoes = session.info['eventos_movimentos'] = AlteracoesMovimentos()
+    return alteracoes
+
+@event.listens_for(db.session, 'after_flush')
+def _registar_movimentos_para_eventos(session, flush_context):
+    """Regista os movimentos criados, alterados ou removidos, se houver clientes ligados"""
+    if not EventosService.tem_subscricoes():
+        return
+
+    for obj in session.new:
+        if isinstance(obj, MovimentoStock):
+            _alteracoes_da_sessao(session).adicionar('criado', depois=_valores_evento(obj))
+
+    for obj in session.dirty:
+        if isinstance(obj, MovimentoStock) and session.is_modified(obj):
+            _alteracoes_da_sessao(session).adicionar(
+                'alterado', antes=_valores_evento(obj, anteriores=True), depois=_valores_evento(obj)
+            )
+
+    for obj in session.deleted:
+        if isinstance(obj, MovimentoStock):
+            _alteracoes_da_sessao(session).adicionar('removido', antes=_valores_evento(obj, anteriores=True))
+
+def _registar_movimentos_em_lote(session, linhas, ids):
+    """Observador de MovimentoStock.inserir_em_lote (inserções que não passam pelo flush)"""
+    if not EventosService.tem_subscricoes():
+        return
+
+    alteracoes = _alteracoes_da_sessao(session)
+    agora = datetime.utcnow()
+    for linha, movimento_id in zip(linhas, ids):
+        valores = {campo: linha.get(campo) for campo in CAMPOS_EVENTO}
+        valores['id'] = movimento_id
+        valores['data'] = valores['data'] or agora
+        alteracoes.adicionar('criado', depois=valores)
+
+OBSERVADORES_INSERCAO_EM_LOTE.append(_registar_movimentos_em_lote)
+
+@event.listens_for(db.session, 'after_commit')
+def _publicar_movimentos_apos_commit(session):
+    alteracoes = session.info.pop('eventos_movimentos', None)
+    if alteracoes is not None and alteracoes.totais:
+        EventosService._confirmadas.put(alteracoes)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _descartar_movimentos_para_eventos(session, previous_transaction):
+    session.info.pop('eventos_movimentos', None)
@@ -0,0 +1,478 @@
+"""
+Serviço de importação em massa a partir de ficheiros CSV/XLSX
+Lê o ficheiro em blocos e insere entradas de stock e beneficiários em lote
+"""
+
+import os
+from src.models.sistema_models import db, Beneficiario, MovimentoStock
+from src.services.cache_service import CacheService
+from src.services.dashboard_service import DashboardService
+from src.services.pesquisa_service import PesquisaService
+from src.services.catalogo_service import CatalogoService
+from sqlalchemy import insert, update
+
+class ImportacaoService:
+    """Serviço para importação em massa de entradas de stock (doações) e beneficiários"""
+
+    FORMATOS = ('csv', 'xlsx')
+
+    # Colunas reconhecidas no cabeçalho (sem distinção de maiúsculas/minúsculas)
+    COLUNAS_OPCIONAIS = ('motivo', 'observacoes', 'origem_doacao')
+
+    TAMANHO_BLOCO = 1000
+
+    # Colunas de beneficiários aceites no ficheiro (para além de 'nif' e 'nome')
+    COLUNAS_BENEFICIARIO = (
+        'idade', 'endereco', 'contacto', 'num_agregado', 'necessidades',
+        'observacoes', 'zona_residencia', 'perdas_pedidos'
+    )
+    COLUNAS_BENEFICIARIO_INTEIRAS = ('idade', 'num_agregado')
+
+    # Número máximo de linhas no relatório por linha da importação de beneficiários
+    MAX_LINHAS_RELATORIO = 20000
+
+    # Número máximo de linhas rejeitadas devolvidas no relatório (todas são contadas)
+    MAX_ERROS_REPORTADOS = 500
+
+    @staticmethod
+    def detetar_formato(nome_ficheiro):
+        """Devolve 'csv' ou 'xlsx' a partir da extensão do ficheiro (None se não suportado)"""
+        extensao = os.path.splitext(nome_ficheiro or '')[1].lower().lstrip('.')
+        return extensao if extensao in ImportacaoService.FORMATOS else None
+
+    @staticmethod
+    def _normalizar_coluna(nome):
+        return str(nome or '').strip().lower().replace(' ', '_')
+
+    @staticmethod
+    def _ler_blocos_csv(ficheiro, tamanho_bloco):
+        import pandas as pd
+
+        leitor = pd.read_csv(
+            ficheiro, chunksize=tamanho_bloco, dtype=str, keep_default_na=False,
+            sep=None, engine='python', encoding='utf-8-sig', skip_blank_lines=False
+        )
+        numero_linha = 1  # Linha 1 é o cabeçalho
+        for bloco in leitor:
+            bloco.columns = [ImportacaoService._normalizar_coluna(c) for c in bloco.columns]
+            linhas = []
+            for registo in bloco.fillna('').to_dict('records'):
+                numero_linha += 1
+                if any(registo.values()):
+                    linhas.append((numero_linha, registo))
+            yield linhas
+
+    @staticmethod
+    def _ler_blocos_xlsx(ficheiro, tamanho_bloco):
+        from openpyxl import load_workbook
+
+        livro = load_workbook(ficheiro, read_only=True, data_only=True)
+        try:
+            folha = livro.active
+            registos = folha.iter_rows(values_only=True)
+            cabecalho = [ImportacaoService._normalizar_coluna(c) for c in next(registos, ())]
+
+            linhas = []
+            for numero_linha, valores in enumerate(registos, start=2):
+                if not any(v not in (None, '') for v in valores):
+                    continue
+                linhas.append((numero_linha, dict(zip(cabecalho, valores))))
+                if len(linhas) >= tamanho_bloco:
+                    yield linhas
+                    linhas = []
+            if linhas:
+                yield linhas
+        finally:
+            livro.close()
+
+    @staticmethod
+    def ler_blocos(ficheiro, formato, tamanho_bloco=None):
+        """
+        Lê o ficheiro em blocos de linhas, sem o carregar todo em memória
+
+        Args:
+            ficheiro: Caminho ou objeto de ficheiro binário
+            formato (str): 'csv' ou 'xlsx'
+            tamanho_bloco (int): Linhas por bloco
+
+        Yields:
+            list: Tuplos (numero_linha, {coluna: valor}) com colunas normalizadas
+        """
+        tamanho_bloco = tamanho_bloco or ImportacaoService.TAMANHO_BLOCO
+        if formato == 'csv':
+            return ImportacaoService._ler_blocos_csv(ficheiro, tamanho_bloco)
+        if formato == 'xlsx':
+            return ImportacaoService._ler_blocos_xlsx(ficheiro, tamanho_bloco)
+        raise ValueError(f'Formato não suportado: {formato}')
+
+    @staticmethod
+    def mapa_itens():
+        """Mapa nome do item (minúsculas) → ID dos itens ativos, a partir do catálogo em memória"""
+        return CatalogoService.obter().ids_por_nome
+
+    @staticmethod
+    def _texto(valor):
+        if valor is None:
+            return ''
+        return str(valor).strip()
+
+    @staticmethod
+    def validar_linha(registo, itens, itens_ids, instituicao_id):
+        """
+        Converte uma linha do ficheiro numa linha de movimentos_stock
+
+        Returns:
+            tuple: (movimento, erro) - movimento é None quando a linha é rejeitada
+        """
+        texto = ImportacaoService._texto
+
+        item_id = None
+        if texto(registo.get('item_id')):
+            try:
+                item_id = int(float(texto(registo['item_id'])))
+            except ValueError:
+                return None, 'item_id inválido'
+            if item_id not in itens_ids:
+                return None, f'Item {item_id} não encontrado'
+        else:
+            nome = texto(registo.get('item')).lower()
+            if not nome:
+                return None, 'Item é obrigatório'
+            item_id = itens.get(nome)
+            if item_id is None:
+                return None, f"Item '{texto(registo.get('item'))}' não encontrado"
+
+        quantidade = texto(registo.get('quantidade')).replace(',', '.')
+        if not quantidade:
+            return None, 'Quantidade é obrigatória'
+        try:
+            quantidade = float(quantidade)
+        except ValueError:
+            return None, 'Quantidade inválida'
+        if quantidade <= 0:
+            return None, 'Quantidade deve ser maior que zero'
+
+        movimento = {
+            'item_id': item_id,
+            'instituicao_id': instituicao_id,
+            'tipo_movimento': 'entrada',
+            'quantidade': quantidade
+        }
+        for coluna in ImportacaoService.COLUNAS_OPCIONAIS:
+            movimento[coluna] = texto(registo.get(coluna))
+        movimento['origem_doacao'] = movimento['origem_doacao'][:100]
+
+        return movimento, None
+
+    @staticmethod
+    def importar_entradas(ficheiro, formato, instituicao_id, modo='atomico', tamanho_bloco=None):
+        """
+        Importa entradas de stock de um ficheiro CSV/XLSX
+
+        Colunas: 'item' (nome) ou 'item_id', 'quantidade' e, opcionalmente,
+        'motivo', 'observacoes' e 'origem_doacao'.
+
+        Args:
+            ficheiro: Caminho ou objeto de ficheiro binário
+            formato (str): 'csv' ou 'xlsx'
+            instituicao_id (int): Instituição que recebe as doações
+            modo (str): 'atomico' (nada é registado se houver linhas rejeitadas)
+                        ou 'parcial' (regista as linhas válidas, commit por bloco)
+            tamanho_bloco (int): Linhas lidas e inseridas de cada vez
+
+        Returns:
+            dict: {'sucesso', 'modo', 'linhas_lidas', 'registadas', 'rejeitadas',
+                   'erros': [{'linha', 'erro'}], 'erros_truncados'}
+        """
+        itens = ImportacaoService.mapa_itens()
+        itens_ids = set(itens.values())
+
+        linhas_lidas = 0
+        registadas = 0      # Linhas já confirmadas (commit)
+        por_confirmar = 0   # Linhas inseridas no modo atómico, à espera do commit final
+        rejeitadas = 0
+        erros = []
+
+        try:
+            for bloco in ImportacaoService.ler_blocos(ficheiro, formato, tamanho_bloco):
+                movimentos = []
+                for numero_linha, registo in bloco:
+                    linhas_lidas += 1
+                    movimento, erro = ImportacaoService.validar_linha(
+                        registo, itens, itens_ids, instituicao_id
+                    )
+                    if erro:
+                        rejeitadas += 1
+                        if len(erros) < ImportacaoService.MAX_ERROS_REPORTADOS:
+                            erros.append({'linha': numero_linha, 'erro': erro})
+                    else:
+                        movimentos.append(movimento)
+
+                # No modo atómico, após a primeira rejeição deixa de valer a pena inserir
+                if modo == 'atomico' and rejeitadas:
+                    continue
+
+                MovimentoStock.inserir_em_lote(movimentos)
+
+                if modo == 'parcial':
+                    db.session.commit()
+                    registadas += len(movimentos)
+                else:
+                    por_confirmar += len(movimentos)
+
+            if modo == 'atomico':
+                if rejeitadas:
+                    db.session.rollback()
+                else:
+                    db.session.commit()
+                    registadas = por_confirmar
+
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'sucesso': False,
+                'erro': f'Erro ao importar ficheiro: {str(e)}',
+                'modo': modo,
+                'linhas_lidas': linhas_lidas,
+                'registadas': registadas,
+                'rejeitadas': rejeitadas,
+                'erros': erros,
+                'erros_truncados': rejeitadas > len(erros)
+            }
+
+        finally:
+            # inserir_em_lote não passa pelo flush do ORM; também os blocos confirmados
+            # antes de um erro no modo parcial
+            if registadas:
+                DashboardService.marcar_alteradas([instituicao_id], sistema=False)
+
+        if not linhas_lidas:
+            return {'sucesso': False, 'erro': 'Ficheiro sem linhas de dados'}
+
+        return {
+            'sucesso': registadas > 0,
+            'modo': modo,
+            'linhas_lidas': linhas_lidas,
+            'registadas': registadas,
+            'rejeitadas': rejeitadas,
+            'erros': erros,
+            'erros_truncados': rejeitadas > len(erros)
+        }
+
+    @staticmethod
+    def _normalizar_nif(valor):
+        # Células numéricas do Excel chegam como float (123456789.0)
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)
+        return ImportacaoService._texto(valor).upper()
+
+    @staticmethod
+    def validar_beneficiario(registo, instituicao_id):
+        """
+        Converte uma linha do ficheiro numa linha de beneficiarios
+
+        Returns:
+            tuple: (beneficiario, erro) - beneficiario é None quando a linha é rejeitada
+        """
+        texto = ImportacaoService._texto
+        colunas = Beneficiario.__table__.c
+
+        beneficiario = {
+            'nif': ImportacaoService._normalizar_nif(registo.get('nif')),
+            'nome': texto(registo.get('nome'))
+        }
+        if not beneficiario['nif'] or not beneficiario['nome']:
+            return None, 'NIF e nome são obrigatórios'
+
+        for coluna in ImportacaoService.COLUNAS_BENEFICIARIO:
+            beneficiario[coluna] = texto(registo.get(coluna)) or None
+
+        for coluna in ImportacaoService.COLUNAS_BENEFICIARIO_INTEIRAS:
+            if beneficiario[coluna] is not None:
+                try:
+                    beneficiario[coluna] = int(float(beneficiario[coluna].replace(',', '.')))
+                except ValueError:
+                    return None, f'{coluna} inválido'
+
+        for coluna, valor in beneficiario.items():
+            limite = getattr(colunas[coluna].type, 'length', None)
+            if limite and isinstance(valor, str) and len(valor) > limite:
+                return None, f'{coluna} excede {limite} caracteres'
+
+        beneficiario['instituicao_registro_id'] = instituicao_id
+        return beneficiario, None
+
+    @staticmethod
+    def _instrucao_upsert(atualizar):
+        """
+        INSERT ... ON CONFLICT (nif) para PostgreSQL/SQLite, com RETURNING do NIF
+
+        Com atualizar=True, os beneficiários já existentes só são atualizados quando
+        pertencem à mesma instituição; caso contrário o conflito é ignorado.
+        """
+        dialeto = db.engine.dialect.name
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        elif dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        else:
+            return None
+
+        tabela = Beneficiario.__table__
+        instrucao = insert_dialeto(tabela)
+        if atualizar:
+            instrucao = instrucao.on_conflict_do_update(
+                index_elements=[tabela.c.nif],
+                set_={
+                    coluna: instrucao.excluded[coluna]
+                    for coluna in ('nome',) + ImportacaoService.COLUNAS_BENEFICIARIO
+                },
+                where=tabela.c.instituicao_registro_id == instrucao.excluded.instituicao_registro_id
+            )
+        else:
+            instrucao = instrucao.on_conflict_do_nothing(index_elements=[tabela.c.nif])
+
+        return instrucao.returning(tabela.c.nif)
+
+    @staticmethod
+    def _gravar_beneficiarios(linhas, atualizar):
+        """Grava um bloco de beneficiários e devolve o conjunto de NIFs inseridos ou atualizados"""
+        if not linhas:
+            return set()
+
+        marcas = [linha.pop('_existente') for linha in linhas]
+
+        instrucao = ImportacaoService._instrucao_upsert(atualizar)
+        if instrucao is not None:
+            return set(db.session.execute(instrucao, linhas).scalars().all())
+
+        # Outras bases de dados: sem ON CONFLICT, grava apenas o que a verificação prévia permitiu
+        novas = [linha for linha, existente in zip(linhas, marcas) if not existente]
+        existentes = [linha for linha, existente in zip(linhas, marcas) if existente]
+        if novas:
+            db.session.execute(insert(Beneficiario.__table__), novas)
+        if existentes:
+            db.session.execute(update(Beneficiario), existentes)
+        return {linha['nif'] for linha in novas + existentes}
+
+    @staticmethod
+    def importar_beneficiarios_blocos(blocos, instituicao_id, atualizar=False):
+        """
+        Importa beneficiários bloco a bloco, com commit por bloco
+
+        Os NIFs repetidos no ficheiro são detetados com um conjunto em memória; os já
+        existentes na base de dados com uma única consulta IN por bloco. A gravação é
+        um INSERT ... ON CONFLICT em lote (executemany), seguro face a registos concorrentes.
+
+        Args:
+            blocos: Iterável de listas de tuplos (numero_linha, {coluna: valor})
+            instituicao_id (int): Instituição que regista os beneficiários
+            atualizar (bool): Atualizar beneficiários já registados pela mesma instituição
+
+        Returns:
+            dict: {'sucesso', 'linhas_lidas', 'totais': {resultado: n},
+                   'linhas': [{'linha', 'nif', 'resultado', 'erro'}], 'relatorio_truncado'}
+
+            resultado: 'criado', 'atualizado', 'existente', 'existente_outra_instituicao',
+                       'duplicado_ficheiro' ou 'rejeitado'
+        """
+        nifs_vistos = set()
+        totais = dict.fromkeys((
+            'criado', 'atualizado', 'existente', 'existente_outra_instituicao',
+            'duplicado_ficheiro', 'rejeitado'
+        ), 0)
+        relatorio = []
+        linhas_lidas = 0
+
+        def registar(numero_linha, nif, resultado, erro=None):
+            totais[resultado] += 1
+            if len(relatorio) < ImportacaoService.MAX_LINHAS_RELATORIO:
+                relatorio.append({'linha': numero_linha, 'nif': nif, 'resultado': resultado, 'erro': erro})
+
+        try:
+            for bloco in blocos:
+                candidatos = []
+                for numero_linha, registo in bloco:
+                    linhas_lidas += 1
+                    beneficiario, erro = ImportacaoService.validar_beneficiario(registo, instituicao_id)
+                    if erro:
+                        registar(numero_linha, ImportacaoService._normalizar_nif(registo.get('nif')) or None,
+                                 'rejeitado', erro)
+                    elif beneficiario['nif'] in nifs_vistos:
+                        registar(numero_linha, beneficiario['nif'], 'duplicado_ficheiro',
+                                 'NIF repetido no ficheiro')
+                    else:
+                        nifs_vistos.add(beneficiario['nif'])
+                        candidatos.append((numero_linha, beneficiario))
+
+                if not candidatos:
+                    continue
+
+                # Donos dos NIFs já registados, numa única consulta por bloco
+                existentes = dict(db.session.query(
+                    Beneficiario.nif, Beneficiario.instituicao_registro_id
+                ).filter(
+                    Beneficiario.nif.in_([b['nif'] for _, b in candidatos])
+                ).all())
+
+                linhas = []
+                for numero_linha, beneficiario in candidatos:
+                    nif = beneficiario['nif']
+                    if nif not in existentes:
+                        linhas.append(dict(beneficiario, _existente=False))
+                    elif not atualizar:
+                        registar(numero_linha, nif, 'existente', 'Já existe um beneficiário com este NIF no sistema')
+                    elif existentes[nif] != instituicao_id:
+                        registar(numero_linha, nif, 'existente_outra_instituicao',
+                                 'Beneficiário registado por outra instituição')
+                    else:
+                        linhas.append(dict(beneficiario, _existente=True))
+
+                marcados = [(b['nif'], b['_existente']) for b in linhas]
+                gravados = ImportacaoService._gravar_beneficiarios(linhas, atualizar)
+                db.session.commit()
+
+                # A gravação em lote não passa pelo flush do ORM
+                if gravados:
+                    CacheService.invalidar_contagem(CacheService.chave_beneficiarios(instituicao_id))
+                    CacheService.invalidar_contagem(CacheService.chave_estatisticas_beneficiarios(instituicao_id))
+                    PesquisaService.invalidar(instituicao_id)
+                    DashboardService.marcar_alteradas()
+
+                numeros = {b['nif']: n for n, b in candidatos}
+                for nif, existente in marcados:
+                    if nif not in gravados:
+                        # Registado por outro pedido entre a verificação e a gravação
+                        registar(numeros[nif], nif, 'existente', 'Já existe um beneficiário com este NIF no sistema')
+                    else:
+                        registar(numeros[nif], nif, 'atualizado' if existente else 'criado')
+
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'sucesso': False,
+                'erro': f'Erro ao importar beneficiários: {str(e)}',
+                'linhas_lidas': linhas_lidas,
+                'totais': totais,
+                'linhas': relatorio,
+                'relatorio_truncado': linhas_lidas > len(relatorio)
+            }
+
+        if not linhas_lidas:
+            return {'sucesso': False, 'erro': 'Ficheiro sem linhas de dados'}
+
+        relatorio.sort(key=lambda r: r['linha'])
+        return {
+            'sucesso': totais['criado'] + totais['atualizado'] > 0,
+            'linhas_lidas': linhas_lidas,
+            'totais': totais,
+            'linhas': relatorio,
+            'relatorio_truncado': linhas_lidas > len(relatorio)
+        }
+
+    @staticmethod
+    def importar_beneficiarios(ficheiro, formato, instituicao_id, atualizar=False, tamanho_bloco=None):
+        """Importa beneficiários de um ficheiro CSV/XLSX (colunas 'nif', 'nome' e opcionais)"""
+        return ImportacaoService.importar_beneficiarios_blocos(
+            ImportacaoService.ler_blocos(ficheiro, formato, tamanho_bloco), instituicao_id, atualizar
+        )
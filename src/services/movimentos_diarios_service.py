@@ -0,0 +1,222 @@
+"""
+Serviço dos agregados diários de movimentos (tabela movimentos_diarios)
+Leituras de totais por período e reconstrução a partir do registo de movimentos
+"""
+
+from datetime import date, datetime
+from src.models.sistema_models import db, MovimentoStock, MovimentoDiario
+from src.models.esboco_distintos import EsbocoDistintos
+from sqlalchemy import func
+
+class MovimentosDiariosService:
+    """
+    Totais de movimentos por período a partir de movimentos_diarios
+
+    Os períodos são em dias (dia_inicio incluído, dia_fim excluído): limites a meio
+    de um dia contam o dia inteiro.
+    """
+
+    # Linhas lidas de cada vez na reconstrução (cursor do servidor no PostgreSQL)
+    LINHAS_POR_LOTE = 5000
+
+    @staticmethod
+    def _filtros(instituicao_id, dia_inicio=None, dia_fim=None, tipo_movimento=None):
+        filtros = [MovimentoDiario.instituicao_id == instituicao_id]
+        if dia_inicio is not None:
+            filtros.append(MovimentoDiario.dia >= dia_inicio)
+        if dia_fim is not None:
+            filtros.append(MovimentoDiario.dia < dia_fim)
+        if tipo_movimento is not None:
+            filtros.append(MovimentoDiario.tipo_movimento == tipo_movimento)
+        return filtros
+
+    @staticmethod
+    def totais_por_item(instituicao_id, dia_inicio=None, dia_fim=None, tipo_movimento=None):
+        """
+        Contagens e quantidades do período por tipo e item
+
+        Returns:
+            dict: {(tipo_movimento, item_id): {'movimentos': int, 'quantidade': float}}
+        """
+        linhas = db.session.query(
+            MovimentoDiario.tipo_movimento,
+            MovimentoDiario.item_id,
+            func.sum(MovimentoDiario.movimentos).label('movimentos'),
+            func.sum(MovimentoDiario.quantidade).label('quantidade')
+        ).filter(
+            *MovimentosDiariosService._filtros(instituicao_id, dia_inicio, dia_fim, tipo_movimento)
+        ).group_by(
+            MovimentoDiario.tipo_movimento,
+            MovimentoDiario.item_id
+        ).all()
+
+        # Linhas a zero ficam depois de todos os movimentos de um dia serem removidos
+        return {
+            (linha.tipo_movimento, linha.item_id): {
+                'movimentos': int(linha.movimentos),
+                'quantidade': float(linha.quantidade or 0)
+            }
+            for linha in linhas
+            if linha.movimentos
+        }
+
+    @staticmethod
+    def totais_por_dia(instituicao_id, dia_inicio=None, dia_fim=None):
+        """
+        Contagens e quantidades do período por dia e tipo
+
+        Returns:
+            list: [{'dia': date, 'tipo_movimento', 'movimentos', 'quantidade'}] por ordem de dia
+        """
+        linhas = db.session.query(
+            MovimentoDiario.dia,
+            MovimentoDiario.tipo_movimento,
+            func.sum(MovimentoDiario.movimentos).label('movimentos'),
+            func.sum(MovimentoDiario.quantidade).label('quantidade')
+        ).filter(
+            *MovimentosDiariosService._filtros(instituicao_id, dia_inicio, dia_fim)
+        ).group_by(
+            MovimentoDiario.dia,
+            MovimentoDiario.tipo_movimento
+        ).order_by(MovimentoDiario.dia).all()
+
+        return [
+            {
+                'dia': linha.dia,
+                'tipo_movimento': linha.tipo_movimento,
+                'movimentos': int(linha.movimentos),
+                'quantidade': float(linha.quantidade or 0)
+            }
+            for linha in linhas
+            if linha.movimentos
+        ]
+
+    @staticmethod
+    def beneficiarios_distintos(instituicao_id, dia_inicio=None, dia_fim=None):
+        """
+        Beneficiários distintos com saídas no período, pela união dos esboços diários
+
+        Exato até EsbocoDistintos.K beneficiários e estimado acima disso. Beneficiários
+        cujas saídas foram todas removidas continuam contados até à reconstrução.
+        """
+        esbocos = db.session.query(MovimentoDiario.beneficiarios).filter(
+            *MovimentosDiariosService._filtros(instituicao_id, dia_inicio, dia_fim, 'saida'),
+            MovimentoDiario.beneficiarios.isnot(None)
+        ).all()
+        return EsbocoDistintos.unir(linha.beneficiarios for linha in esbocos).contar()
+
+    @staticmethod
+    def _dia(valor):
+        """func.date devolve texto em SQLite e date em PostgreSQL"""
+        if isinstance(valor, str):
+            return date.fromisoformat(valor)
+        return valor
+
+    @staticmethod
+    def calcular_agregados_movimentos():
+        """
+        Recalcula os agregados diários a partir do registo de movimentos
+        (ignora movimentos sem data; os sem instituição ficam nas linhas sem instituição)
+
+        Returns:
+            dict: {(instituicao_id, item_id, dia, tipo_movimento):
+                   {'quantidade', 'movimentos', 'beneficiarios': set de hashes}}
+        """
+        dia = func.date(MovimentoStock.data)
+        agregados = {}
+
+        linhas = db.session.query(
+            MovimentoStock.instituicao_id,
+            MovimentoStock.item_id,
+            dia.label('dia'),
+            MovimentoStock.tipo_movimento,
+            func.sum(MovimentoStock.quantidade).label('quantidade'),
+            func.count(MovimentoStock.id).label('movimentos')
+        ).filter(
+            MovimentoStock.data.isnot(None)
+        ).group_by(
+            MovimentoStock.instituicao_id,
+            MovimentoStock.item_id,
+            dia,
+            MovimentoStock.tipo_movimento
+        ).yield_per(MovimentosDiariosService.LINHAS_POR_LOTE)
+
+        for linha in linhas:
+            chave = (linha.instituicao_id, linha.item_id, MovimentosDiariosService._dia(linha.dia), linha.tipo_movimento)
+            agregados[chave] = {
+                'quantidade': float(linha.quantidade or 0),
+                'movimentos': linha.movimentos,
+                'beneficiarios': set()
+            }
+
+        nifs = db.session.query(
+            MovimentoStock.instituicao_id,
+            MovimentoStock.item_id,
+            dia.label('dia'),
+            MovimentoStock.beneficiario_nif
+        ).filter(
+            MovimentoStock.data.isnot(None),
+            MovimentoStock.tipo_movimento == 'saida',
+            MovimentoStock.beneficiario_nif.isnot(None)
+        ).distinct().yield_per(MovimentosDiariosService.LINHAS_POR_LOTE)
+
+        for linha in nifs:
+            chave = (linha.instituicao_id, linha.item_id, MovimentosDiariosService._dia(linha.dia), 'saida')
+            agregados[chave]['beneficiarios'].add(EsbocoDistintos.hash_valor(linha.beneficiario_nif))
+
+        return agregados
+
+    @staticmethod
+    def reconstruir():
+        """
+        Reconstrói movimentos_diarios a partir do registo de movimentos
+
+        Necessário na primeira utilização (movimentos anteriores à tabela) e para
+        retirar dos esboços os beneficiários de saídas removidas.
+
+        Returns:
+            dict: {'sucesso': bool, 'linhas': int}
+        """
+        try:
+            # Bloquear escritas nos agregados enquanto se lê o registo de movimentos:
+            # transações concorrentes aplicam o seu delta depois da reconstrução
+            if db.session.get_bind().dialect.name == 'postgresql':
+                db.session.execute(db.text('LOCK TABLE movimentos_diarios IN EXCLUSIVE MODE'))
+
+            agregados = MovimentosDiariosService.calcular_agregados_movimentos()
+
+            MovimentoDiario.query.delete()
+            agora = datetime.utcnow()
+            if agregados:
+                db.session.execute(
+                    MovimentoDiario.__table__.insert(),
+                    [
+                        {
+                            'instituicao_id': instituicao_id,
+                            'item_id': item_id,
+                            'dia': dia,
+                            'tipo_movimento': tipo,
+                            'quantidade': valores['quantidade'],
+                            'movimentos': valores['movimentos'],
+                            'beneficiarios': (
+                                EsbocoDistintos(valores['beneficiarios']).serializar()
+                                if valores['beneficiarios'] else None
+                            ),
+                            'data_atualizacao': agora
+                        }
+                        for (instituicao_id, item_id, dia, tipo), valores in agregados.items()
+                    ]
+                )
+            db.session.commit()
+
+            return {
+                'sucesso': True,
+                'linhas': len(agregados)
+            }
+
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'sucesso': False,
+                'erro': f'Erro ao reconstruir movimentos diários: {str(e)}'
+            }
@@ -0,0 +1,154 @@
+"""
+Serviço de paginação por cursor (keyset)
+Páginas obtidas por comparação com a chave da última linha, sem OFFSET nem COUNT(*)
+"""
+
+import base64
+import json
+from datetime import datetime
+from src.models.sistema_models import db
+from sqlalchemy import tuple_
+
+class PaginacaoService:
+    """Serviço para paginação keyset com cursores opacos"""
+
+    POR_PAGINA = 20
+    MAX_POR_PAGINA = 200
+
+    # Modos do parâmetro 'contar': sem total (tempo constante), exato ou estimado pelo planeador
+    MODOS_CONTAGEM = ('', 'exato', 'estimado')
+
+    @staticmethod
+    def _valor_para_json(valor):
+        if isinstance(valor, datetime):
+            return {'dt': valor.isoformat()}
+        return valor
+
+    @staticmethod
+    def _valor_de_json(valor):
+        if isinstance(valor, dict) and 'dt' in valor:
+            return datetime.fromisoformat(valor['dt'])
+        return valor
+
+    @staticmethod
+    def codificar_cursor(valores):
+        """Codifica os valores da chave de ordenação num cursor opaco (base64 url-safe)"""
+        dados = json.dumps([PaginacaoService._valor_para_json(v) for v in valores], separators=(',', ':'))
+        return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decodificar_cursor(cursor, numero_valores):
+        """
+        Descodifica um cursor criado por codificar_cursor
+
+        Raises:
+            ValueError: Se o cursor for inválido
+        """
+        try:
+            dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            valores = [PaginacaoService._valor_de_json(v) for v in json.loads(dados)]
+        except (ValueError, TypeError) as e:
+            raise ValueError('Cursor inválido') from e
+
+        if len(valores) != numero_valores:
+            raise ValueError('Cursor inválido')
+        return valores
+
+    @staticmethod
+    def paginar(query, colunas, chave, cursor=None, por_pagina=None, descendente=True):
+        """
+        Obtém uma página ordenada pelas colunas, a seguir ao cursor
+
+        Args:
+            query: Consulta já filtrada (sem ORDER BY)
+            colunas (tuple): Colunas da chave de ordenação, a última única (ex.: data, id)
+            chave (callable): Função linha -> valores das colunas, para o próximo cursor
+            cursor (str): Cursor devolvido pela página anterior (None para a primeira)
+            por_pagina (int): Linhas por página (limitado a MAX_POR_PAGINA)
+            descendente (bool): Ordem decrescente (ex.: mais recentes primeiro) ou crescente
+
+        Returns:
+            dict: {'linhas', 'next_cursor', 'has_next', 'per_page'}
+
+        Raises:
+            ValueError: Se o cursor for inválido
+        """
+        por_pagina = max(1, min(por_pagina or PaginacaoService.POR_PAGINA, PaginacaoService.MAX_POR_PAGINA))
+
+        if cursor:
+            valores = PaginacaoService.decodificar_cursor(cursor, len(colunas))
+            if descendente:
+                query = query.filter(tuple_(*colunas) < tuple_(*valores))
+            else:
+                query = query.filter(tuple_(*colunas) > tuple_(*valores))
+
+        ordem = [coluna.desc() if descendente else coluna.asc() for coluna in colunas]
+        linhas = query.order_by(*ordem).limit(por_pagina + 1).all()
+
+        has_next = len(linhas) > por_pagina
+        linhas = linhas[:por_pagina]
+
+        return {
+            'linhas': linhas,
+            'next_cursor': PaginacaoService.codificar_cursor(chave(linhas[-1])) if has_next else None,
+            'has_next': has_next,
+            'per_page': por_pagina
+        }
+
+    @staticmethod
+    def paginar_offset(query, pagina, por_pagina, total):
+        """
+        Paginação por número de página (compatibilidade), com o total já conhecido
+
+        Ao contrário de paginate(), não executa COUNT(*): o total vem de quem chama
+        (normalmente um contador em cache).
+
+        Args:
+            query: Consulta já filtrada e ordenada
+            pagina (int): Número da página (a partir de 1)
+            por_pagina (int): Linhas por página (limitado a MAX_POR_PAGINA)
+            total (int): Total de linhas da consulta
+
+        Returns:
+            dict: {'linhas', 'page', 'per_page', 'total', 'pages', 'has_next', 'has_prev'}
+        """
+        pagina = max(1, pagina)
+        por_pagina = max(1, min(por_pagina or PaginacaoService.POR_PAGINA, PaginacaoService.MAX_POR_PAGINA))
+        paginas = -(-total // por_pagina)
+
+        return {
+            'linhas': query.offset((pagina - 1) * por_pagina).limit(por_pagina).all(),
+            'page': pagina,
+            'per_page': por_pagina,
+            'total': total,
+            'pages': paginas,
+            'has_next': pagina < paginas,
+            'has_prev': pagina > 1
+        }
+
+    @staticmethod
+    def contar(query, modo):
+        """
+        Total de linhas da consulta filtrada
+
+        Args:
+            query: Consulta já filtrada (sem ORDER BY nem LIMIT)
+            modo (str): 'exato' (COUNT) ou 'estimado' (estimativa do planeador no PostgreSQL;
+                        nas outras bases de dados é exato)
+
+        Returns:
+            dict: {'total', 'total_estimado'} ou {} quando modo é vazio
+        """
+        if not modo:
+            return {}
+
+        if modo == 'estimado' and db.engine.dialect.name == 'postgresql':
+            compilada = query.statement.compile(dialect=db.engine.dialect)
+            plano = db.session.connection().exec_driver_sql(
+                f'EXPLAIN (FORMAT JSON) {compilada}', compilada.params
+            ).scalar()
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            return {'total': int(plano[0]['Plan']['Plan Rows']), 'total_estimado': True}
+
+        return {'total': query.order_by(None).count(), 'total_estimado': False}
@@ -0,0 +1,265 @@
+"""
+Serviço de pesquisa de beneficiários por nome, NIF, zona de residência ou contacto
+Pesquisa por trigramas, sem distinção de acentos e com resultados ordenados por relevância
+"""
+
+import re
+import threading
+import unicodedata
+from collections import Counter
+from sqlalchemy import case, event, false, func, or_, text
+from src.models.sistema_models import db, Beneficiario
+from src.services.cache_service import CacheTTL
+
+class IndiceTrigramas:
+    """
+    Índice de trigramas em memória dos beneficiários de uma instituição
+
+    Equivalente ao pg_trgm para bases de dados sem a extensão: cada trigrama aponta
+    para as posições dos beneficiários cujo texto o contém.
+    """
+
+    def __init__(self, registos):
+        """
+        Args:
+            registos (list): Tuplos (nif, nome, zona_residencia, contacto)
+        """
+        self.nifs = []
+        self.nomes = []
+        self.textos = []
+        self.trigramas = {}
+
+        for posicao, (nif, nome, zona, contacto) in enumerate(registos):
+            texto = PesquisaService.normalizar(' '.join(v for v in (nome, nif, zona, contacto) if v))
+            self.nifs.append(nif)
+            self.nomes.append(PesquisaService.normalizar(nome))
+            self.textos.append(texto)
+            for trigrama in PesquisaService.trigramas(texto):
+                self.trigramas.setdefault(trigrama, []).append(posicao)
+
+    def pesquisar(self, termo, limite=None):
+        """
+        Pesquisa um termo já normalizado
+
+        Returns:
+            list: NIFs por relevância (texto contém o termo primeiro, depois proporção
+                  de trigramas do termo presentes, depois nome)
+        """
+        trigramas = PesquisaService.trigramas(termo)
+        if not trigramas:
+            return []
+
+        contagens = Counter()
+        for trigrama in trigramas:
+            contagens.update(self.trigramas.get(trigrama, ()))
+
+        # Termos com menos de 3 caracteres só partilham trigramas com inícios de palavras:
+        # como o ILIKE '%termo%', procurá-los também a meio das palavras em todos os textos
+        posicoes = set(contagens)
+        if len(termo) < 3:
+            posicoes.update(posicao for posicao, texto in enumerate(self.textos) if termo in texto)
+
+        resultados = []
+        for posicao in posicoes:
+            semelhanca = contagens[posicao] / len(trigramas)
+            contem = termo in self.textos[posicao]
+            if contem or semelhanca >= PesquisaService.LIMIAR_SEMELHANCA:
+                resultados.append((not contem, -semelhanca, self.nomes[posicao], self.nifs[posicao]))
+
+        resultados.sort()
+        return [nif for *_, nif in resultados[:limite]]
+
+class PesquisaService:
+    """
+    Serviço de pesquisa de beneficiários
+
+    Em PostgreSQL com as extensões pg_trgm e unaccent (criadas com 'flask criar-indices')
+    a pesquisa usa um índice GIN de trigramas; caso contrário usa um IndiceTrigramas
+    em memória por instituição, reconstruído quando os beneficiários mudam.
+    """
+
+    # Proporção mínima de trigramas do termo presentes no texto (como pg_trgm.word_similarity_threshold)
+    LIMIAR_SEMELHANCA = 0.6
+
+    # Segundos de validade de um índice em memória (alterações feitas noutros processos)
+    TTL_INDICE = 60
+
+    NOME_INDICE = 'ix_beneficiarios_pesquisa_trgm'
+
+    # Estrutura de pesquisa no PostgreSQL: unaccent() não é IMMUTABLE, por isso é envolvida
+    # numa função que o seja para poder ser usada na expressão do índice
+    DDL_POSTGRESQL = (
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE EXTENSION IF NOT EXISTS unaccent',
+        """
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION texto_pesquisa_beneficiario(text, text, text, text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT f_unaccent(lower(
+            coalesce($1, '') || ' ' || coalesce($2, '') || ' ' || coalesce($3, '') || ' ' || coalesce($4, '')
+        )) $$
+        """,
+        f"""
+        CREATE INDEX IF NOT EXISTS {NOME_INDICE} ON beneficiarios
+        USING gin (texto_pesquisa_beneficiario(nome, nif, zona_residencia, contacto) gin_trgm_ops)
+        """,
+    )
+
+    indices = CacheTTL(ttl=TTL_INDICE)
+    _motores = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def normalizar(texto):
+        """Minúsculas, sem acentos e com espaços simples ('José  Conceição' -> 'jose conceicao')"""
+        if not texto:
+            return ''
+        decomposto = unicodedata.normalize('NFKD', str(texto))
+        sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+        return ' '.join(sem_acentos.lower().split())
+
+    @staticmethod
+    def trigramas(texto):
+        """Trigramas de cada palavra, com o mesmo preenchimento do pg_trgm ('  a', ' ab', 'abc', 'bc ')"""
+        resultado = set()
+        for palavra in re.findall(r'\w+', texto):
+            palavra = f'  {palavra} '
+            resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+        return resultado
+
+    @staticmethod
+    def motor():
+        """'postgresql' se a estrutura de pesquisa existir na base de dados, senão 'memoria'"""
+        engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            return 'memoria'
+
+        with PesquisaService._lock:
+            motor = PesquisaService._motores.get(engine.url)
+        if motor is None:
+            existe = db.session.execute(
+                text('SELECT 1 FROM pg_indexes WHERE indexname = :nome'),
+                {'nome': PesquisaService.NOME_INDICE}
+            ).scalar()
+            motor = 'postgresql' if existe else 'memoria'
+            with PesquisaService._lock:
+                PesquisaService._motores[engine.url] = motor
+        return motor
+
+    @staticmethod
+    def criar_estrutura_postgresql():
+        """Cria as extensões, funções e o índice GIN de trigramas (idempotente)"""
+        with db.engine.begin() as connection:
+            for instrucao in PesquisaService.DDL_POSTGRESQL:
+                connection.execute(text(instrucao))
+        with PesquisaService._lock:
+            PesquisaService._motores.clear()
+
+    @staticmethod
+    def _indice(instituicao_id):
+        indice = PesquisaService.indices.obter(instituicao_id)
+        if indice is None:
+            registos = db.session.query(
+                Beneficiario.nif, Beneficiario.nome, Beneficiario.zona_residencia, Beneficiario.contacto
+            ).filter(
+                Beneficiario.instituicao_registro_id == instituicao_id
+            ).all()
+            indice = IndiceTrigramas(registos)
+            PesquisaService.indices.guardar(instituicao_id, indice)
+        return indice
+
+    @staticmethod
+    def invalidar(instituicao_id=None):
+        """Descarta o índice em memória de uma instituição (ou de todas)"""
+        PesquisaService.indices.invalidar(instituicao_id)
+
+    @staticmethod
+    def _condicoes_postgresql(termo):
+        texto_pesquisa = func.texto_pesquisa_beneficiario(
+            Beneficiario.nome, Beneficiario.nif, Beneficiario.zona_residencia, Beneficiario.contacto
+        )
+        escapado = termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        contem = texto_pesquisa.like(f'%{escapado}%', escape='\\')
+        # termo <% texto: semelhança por palavra acima de pg_trgm.word_similarity_threshold
+        semelhante = texto_pesquisa.op('%>')(termo)
+        return contem, semelhante
+
+    @staticmethod
+    def filtrar(query, instituicao_id, termo):
+        """
+        Restringe uma consulta de Beneficiario aos que correspondem ao termo
+
+        Não altera a ordenação (usado pela listagem paginada).
+        """
+        termo = PesquisaService.normalizar(termo)
+        if not termo:
+            return query
+
+        if PesquisaService.motor() == 'postgresql':
+            return query.filter(or_(*PesquisaService._condicoes_postgresql(termo)))
+
+        nifs = PesquisaService._indice(instituicao_id).pesquisar(termo)
+        return query.filter(Beneficiario.nif.in_(nifs) if nifs else false())
+
+    @staticmethod
+    def pesquisar(instituicao_id, termo, limite=None):
+        """
+        Pesquisa os beneficiários de uma instituição, ordenados por relevância
+
+        Sem distinção de maiúsculas nem de acentos ('jose' encontra 'José') e tolerante a
+        erros de escrita ('goncalvez' encontra 'Gonçalves').
+
+        Args:
+            instituicao_id (int): Instituição que registou os beneficiários
+            termo (str): Texto a pesquisar em nome, NIF, zona de residência e contacto
+            limite (int): Número máximo de resultados (None para todos)
+
+        Returns:
+            list: Objetos Beneficiario, os mais relevantes primeiro
+        """
+        termo = PesquisaService.normalizar(termo)
+        if not termo:
+            return []
+
+        if PesquisaService.motor() == 'postgresql':
+            contem, semelhante = PesquisaService._condicoes_postgresql(termo)
+            nome = func.f_unaccent(func.lower(Beneficiario.nome))
+            query = Beneficiario.query.filter(
+                Beneficiario.instituicao_registro_id == instituicao_id,
+                or_(contem, semelhante)
+            ).order_by(
+                case((contem, 0), else_=1),
+                func.word_similarity(termo, nome).desc(),
+                Beneficiario.nome,
+                Beneficiario.nif
+            )
+            return query.limit(limite).all() if limite else query.all()
+
+        nifs = PesquisaService._indice(instituicao_id).pesquisar(termo, limite)
+        if not nifs:
+            return []
+        por_nif = {b.nif: b for b in Beneficiario.query.filter(Beneficiario.nif.in_(nifs)).all()}
+        return [por_nif[nif] for nif in nifs if nif in por_nif]
+
+@event.listens_for(db.session, 'after_flush')
+def _registar_beneficiarios_alterados(session, flush_context):
+    """Regista as instituições cujos beneficiários mudaram, para descartar o índice em memória"""
+    instituicoes = {
+        obj.instituicao_registro_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Beneficiario)
+    }
+    if instituicoes:
+        session.info.setdefault('pesquisa_alterada', set()).update(instituicoes)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_indices_apos_commit(session):
+    for instituicao_id in session.info.pop('pesquisa_alterada', ()):
+        PesquisaService.invalidar(instituicao_id)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _descartar_beneficiarios_alterados(session, previous_transaction):
+    session.info.pop('pesquisa_alterada', None)
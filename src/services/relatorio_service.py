@@ -3,18 +3,52 @@ Serviço para geração e gestão de relatórios mensais
 """
 
 from datetime import datetime, timedelta
-from src.models.sistema_models import db, MovimentoStock, ItemStock, Beneficiario, Instituicao, RelatorioMensal
-from sqlalchemy import func, and_
+from src.models.sistema_models import db, MovimentoStock, MovimentoDiario, ItemStock, Beneficiario, Instituicao, RelatorioMensal
+from src.services.catalogo_service import CatalogoService
+from src.services.movimentos_diarios_service import MovimentosDiariosService
+from sqlalchemy import and_, extract
 import json
 
 class RelatorioService: 
     """Serviço para geração de relatórios mensais"""
     
+    # Linhas do detalhe lidas de cada vez da base de dados (cursor do servidor no PostgreSQL)
+    LINHAS_POR_LOTE = 2000
+    
+    @staticmethod
+    def agregados_mes(instituicao_id, data_inicio, data_fim):
+        """
+        Contagens e quantidades dos movimentos do período por tipo e item
+        
+        Soma as linhas de movimentos_diarios do mês (uma por item, dia e tipo).
+        
+        Returns:
+            dict: {(tipo_movimento, item_id): {'movimentos': int, 'quantidade': float}}
+        """
+        return MovimentosDiariosService.totais_por_item(instituicao_id, data_inicio.date(), data_fim.date())
+    
+    @staticmethod
+    def beneficiarios_atendidos_mes(instituicao_id, data_inicio, data_fim):
+        """Nomes distintos dos beneficiários com saídas no período, por ordem alfabética"""
+        linhas = db.session.query(Beneficiario.nome).join(
+            MovimentoStock, MovimentoStock.beneficiario_nif == Beneficiario.nif
+        ).filter(
+            MovimentoStock.instituicao_id == instituicao_id,
+            MovimentoStock.tipo_movimento == 'saida',
+            MovimentoStock.data >= data_inicio,
+            MovimentoStock.data < data_fim
+        ).distinct().order_by(Beneficiario.nome).all()
+        return [linha.nome for linha in linhas]
+    
     @staticmethod
     def gerar_relatorio_mensal(instituicao_id, ano, mes):
         """
         Gera ou atualiza o relatório mensal para uma instituição
         
+        Os totais vêm de agregações feitas na base de dados (por tipo e item, e
+        beneficiários distintos); as listas de entradas e saídas vêm de uma única
+        consulta com os nomes já juntos, lida em lotes de LINHAS_POR_LOTE.
+        
         Args:
             instituicao_id (int): ID da instituição
             ano (int): Ano do relatório
@@ -31,21 +65,11 @@ class RelatorioService:
             else:
                 data_fim = datetime(ano, mes + 1, 1)
             
-            print(f"🔍 Gerando relatório para {mes}/{ano}")
-            print(f"   Data início: {data_inicio}")
-            print(f"   Data fim: {data_fim}")
-            print(f"   Instituição ID: {instituicao_id}")
-            
-            # Buscar movimentos do mês usando a coluna correta 'data'
-            movimentos = MovimentoStock.query.filter(
-                MovimentoStock.instituicao_id == instituicao_id,
-                MovimentoStock.data >= data_inicio,
-                MovimentoStock.data < data_fim
-            ).order_by(MovimentoStock.data.asc()).all()
+            print(f"🔍 Gerando relatório para {mes}/{ano} (instituição {instituicao_id})")
             
-            print(f"📊 Total de movimentos encontrados: {len(movimentos)}")
+            agregados = RelatorioService.agregados_mes(instituicao_id, data_inicio, data_fim)
             
-            if len(movimentos) == 0:
+            if not agregados:
                 print("ℹ️ Nenhum movimento encontrado para este período")
                 return {
                     'sucesso': True,
@@ -58,55 +82,77 @@ class RelatorioService:
                     }
                 }
             
-            # Separar entradas e saídas (usando tipo_movimento)
-            entradas = [m for m in movimentos if m.tipo_movimento == 'entrada']
-            saidas = [m for m in movimentos if m.tipo_movimento == 'saida']
+            # Totais e quantidades por item (nomes do catálogo em memória)
+            catalogo = CatalogoService.obter()
+            contagens = {'entrada': 0, 'saida': 0}
+            quantidades = {'entrada': 0.0, 'saida': 0.0}
+            por_item = {'entrada': {}, 'saida': {}}
             
-            print(f"📥 Entradas: {len(entradas)}")
-            print(f"📤 Saídas: {len(saidas)}")
+            for (tipo, item_id), agregado in agregados.items():
+                if tipo not in contagens:
+                    continue
+                contagens[tipo] += agregado['movimentos']
+                quantidades[tipo] += agregado['quantidade']
+                
+                item = catalogo.item(item_id)
+                item_nome = item['nome'] if item else 'Item não especificado'
+                unidade = item['unidade'] if item else 'unidade'
+                
+                if item_nome not in por_item[tipo]:
+                    por_item[tipo][item_nome] = {'quantidade': 0, 'unidade': unidade}
+                por_item[tipo][item_nome]['quantidade'] += agregado['quantidade']
             
-            # Calcular totais
-            total_entradas = sum(e.quantidade for e in entradas)
-            total_saidas = sum(s.quantidade for s in saidas)
+            total_movimentos = sum(agregado['movimentos'] for agregado in agregados.values())
+            total_entradas = quantidades['entrada']
+            total_saidas = quantidades['saida']
             saldo_mensal = total_entradas - total_saidas
+            entradas_por_item = por_item['entrada']
+            saidas_por_item = por_item['saida']
             
-            # Agrupar por item
-            entradas_por_item = {}
-            saidas_por_item = {}
+            beneficiarios_atendidos = RelatorioService.beneficiarios_atendidos_mes(
+                instituicao_id, data_inicio, data_fim
+            )
             
-            for entrada in entradas:
-                try:
-                    item_nome = entrada.item.nome if entrada.item else "Item não especificado"
-                    unidade = entrada.item.unidade if entrada.item else "unidade"
-                    
-                    if item_nome not in entradas_por_item:
-                        entradas_por_item[item_nome] = {'quantidade': 0, 'unidade': unidade}
-                    entradas_por_item[item_nome]['quantidade'] += entrada.quantidade
-                except Exception as e:
-                    print(f"⚠️ Erro ao processar entrada {entrada.id}: {e}")
-                    continue
-            
-            for saida in saidas:
-                try:
-                    item_nome = saida.item.nome if saida.item else "Item não especificado"
-                    unidade = saida.item.unidade if saida.item else "unidade"
-                    
-                    if item_nome not in saidas_por_item:
-                        saidas_por_item[item_nome] = {'quantidade': 0, 'unidade': unidade}
-                    saidas_por_item[item_nome]['quantidade'] += saida.quantidade
-                except Exception as e:
-                    print(f"⚠️ Erro ao processar saída {saida.id}: {e}")
-                    continue
+            # Detalhe: uma consulta com item e beneficiário juntos, sem objetos ORM
+            lista_entradas = []
+            lista_saidas = []
+            linhas = MovimentoStock.consulta_linhas().filter(
+                MovimentoStock.instituicao_id == instituicao_id,
+                MovimentoStock.data >= data_inicio,
+                MovimentoStock.data < data_fim
+            ).order_by(
+                MovimentoStock.data.asc(), MovimentoStock.id.asc()
+            ).yield_per(RelatorioService.LINHAS_POR_LOTE)
             
-            # Beneficiários atendidos
-            beneficiarios_atendidos = set()
-            for saida in saidas:
-                try:
-                    if saida.beneficiario:
-                        beneficiarios_atendidos.add(saida.beneficiario.nome)
-                except Exception as e:
-                    print(f"⚠️ Erro ao processar beneficiário da saída {saida.id}: {e}")
-                    continue
+            for linha in linhas:
+                data = linha.data.strftime('%d/%m/%Y %H:%M') if linha.data else 'Data não disponível'
+                item_nome = linha.item_nome or 'Item não especificado'
+                unidade = linha.item_unidade or 'unidade'
+                
+                if linha.tipo_movimento == 'entrada':
+                    lista_entradas.append({
+                        'id': linha.id,
+                        'data': data,
+                        'item': item_nome,
+                        'quantidade': float(linha.quantidade),
+                        'unidade': unidade,
+                        'origem': linha.origem_doacao or linha.motivo or 'Não especificado',
+                        'observacoes': linha.observacoes
+                    })
+                elif linha.tipo_movimento == 'saida':
+                    tem_beneficiario = linha.beneficiario_nome is not None
+                    lista_saidas.append({
+                        'id': linha.id,
+                        'data': data,
+                        'item': item_nome,
+                        'quantidade': float(linha.quantidade),
+                        'unidade': unidade,
+                        'beneficiario': linha.beneficiario_nome if tem_beneficiario else 'Não especificado',
+                        'beneficiario_nif': linha.beneficiario_nif if tem_beneficiario else '',
+                        'motivo': linha.motivo,
+                        'local_entrega': linha.local_entrega,
+                        'observacoes': linha.observacoes
+                    })
             
             # Construir relatório
             relatorio = {
@@ -121,9 +167,9 @@ class RelatorioService:
                 },
                 
                 'resumo': {
-                    'total_movimentos': len(movimentos),
-                    'total_entradas': len(entradas),
-                    'total_saidas': len(saidas),
+                    'total_movimentos': total_movimentos,
+                    'total_entradas': contagens['entrada'],
+                    'total_saidas': contagens['saida'],
                     'quantidade_total_entradas': float(total_entradas),
                     'quantidade_total_saidas': float(total_saidas),
                     'saldo_mensal': float(saldo_mensal),
@@ -131,42 +177,17 @@ class RelatorioService:
                 },
                 
                 'entradas': {
-                    'lista': [
-                        {
-                            'id': e.id,
-                            'data': e.data.strftime('%d/%m/%Y %H:%M') if e.data else 'Data não disponível',
-                            'item': e.item.nome if e.item else 'Item não especificado',
-                            'quantidade': float(e.quantidade),
-                            'unidade': e.item.unidade if e.item else 'unidade',
-                            'origem': e.origem_doacao or e.motivo or 'Não especificado',
-                            'observacoes': e.observacoes
-                        }
-                        for e in entradas
-                    ],
+                    'lista': lista_entradas,
                     'por_item': entradas_por_item
                 },
                 
                 'saidas': {
-                    'lista': [
-                        {
-                            'id': s.id,
-                            'data': s.data.strftime('%d/%m/%Y %H:%M') if s.data else 'Data não disponível',
-                            'item': s.item.nome if s.item else 'Item não especificado',
-                            'quantidade': float(s.quantidade),
-                            'unidade': s.item.unidade if s.item else 'unidade',
-                            'beneficiario': s.beneficiario.nome if s.beneficiario else 'Não especificado',
-                            'beneficiario_nif': s.beneficiario.nif if s.beneficiario else '',
-                            'motivo': s.motivo,
-                            'local_entrega': s.local_entrega,
-                            'observacoes': s.observacoes
-                        }
-                        for s in saidas
-                    ],
+                    'lista': lista_saidas,
                     'por_item': saidas_por_item
                 },
                 
                 'estatisticas': {
-                    'itens_movimentados': list(set(list(entradas_por_item.keys()) + list(saidas_por_item.keys()))),
+                    'itens_movimentados': sorted(set(entradas_por_item) | set(saidas_por_item)),
                     'top_5_itens_entrada': sorted(
                         [(k, v) for k, v in entradas_por_item.items()], 
                         key=lambda x: x[1]['quantidade'], 
@@ -177,16 +198,16 @@ class RelatorioService:
                         key=lambda x: x[1]['quantidade'], 
                         reverse=True
                     )[:5],
-                    'beneficiarios_atendidos_lista': list(beneficiarios_atendidos),
+                    'beneficiarios_atendidos_lista': beneficiarios_atendidos,
                     'media_mensal': {
-                        'entradas_por_dia': round(len(entradas) / 30, 1) if len(entradas) > 0 else 0,
-                        'saidas_por_dia': round(len(saidas) / 30, 1) if len(saidas) > 0 else 0
+                        'entradas_por_dia': round(contagens['entrada'] / 30, 1) if contagens['entrada'] > 0 else 0,
+                        'saidas_por_dia': round(contagens['saida'] / 30, 1) if contagens['saida'] > 0 else 0
                     }
                 }
             }
             
             print(f"✅ Relatório gerado com sucesso!")
-            print(f"   Movimentos: {len(movimentos)}")
+            print(f"   Movimentos: {total_movimentos}")
             print(f"   Itens diferentes: {len(relatorio['estatisticas']['itens_movimentados'])}")
             print(f"   Beneficiários atendidos: {len(beneficiarios_atendidos)}")
             
@@ -197,7 +218,7 @@ class RelatorioService:
                     'total_entradas': float(total_entradas),
                     'total_saidas': float(total_saidas),
                     'saldo_mensal': float(saldo_mensal),
-                    'movimentos_count': len(movimentos)
+                    'movimentos_count': total_movimentos
                 }
             }
             
@@ -346,21 +367,24 @@ class RelatorioService:
         baseado nos movimentos existentes
         """
         try:
-            # Buscar datas dos movimentos usando a coluna 'data'
+            # Meses com movimentos, a partir dos dias de movimentos_diarios
+            ano = extract('year', MovimentoDiario.dia)
+            mes = extract('month', MovimentoDiario.dia)
             datas = db.session.query(
-                func.strftime('%Y', MovimentoStock.data).label('ano'),
-                func.strftime('%m', MovimentoStock.data).label('mes')
+                ano.label('ano'),
+                mes.label('mes')
             ).filter(
-                MovimentoStock.instituicao_id == instituicao_id
-            ).distinct().order_by('ano', 'mes').all()
+                MovimentoDiario.instituicao_id == instituicao_id,
+                MovimentoDiario.movimentos > 0
+            ).distinct().order_by(ano, mes).all()
             
             periodos = []
-            for ano_str, mes_str in datas:
-                if ano_str and mes_str:
+            for ano_valor, mes_valor in datas:
+                if ano_valor and mes_valor:
                     periodos.append({
-                        'ano': int(ano_str),
-                        'mes': int(mes_str),
-                        'mes_nome': RelatorioService.get_mes_nome(int(mes_str))
+                        'ano': int(ano_valor),
+                        'mes': int(mes_valor),
+                        'mes_nome': RelatorioService.get_mes_nome(int(mes_valor))
                     })
             
             return periodos
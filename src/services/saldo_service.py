@@ -0,0 +1,175 @@
+"""
+Serviço para gestão dos saldos materializados de stock
+"""
+
+from datetime import datetime
+from src.models.sistema_models import db, MovimentoStock, SaldoStock
+from sqlalchemy import case, func
+
+class SaldoService:
+    """Serviço para leitura e reconciliação da tabela saldos_stock"""
+
+    # Diferença máxima aceite entre saldo materializado e movimentos (arredondamentos de float)
+    TOLERANCIA = 1e-6
+
+    @staticmethod
+    def obter_saldos(item_ids=None, instituicao_id=None):
+        """
+        Obtém os saldos de um conjunto de itens numa única consulta agrupada
+
+        Args:
+            item_ids (iterable): IDs dos itens (None para todos os itens com saldo)
+            instituicao_id (int): Instituição para os valores por instituição (opcional)
+
+        Returns:
+            dict: {item_id: {'stock_total', 'stock_instituicao',
+                             'entradas_instituicao', 'saidas_instituicao'}}
+        """
+        if item_ids is not None:
+            item_ids = list(item_ids)
+            if not item_ids:
+                return {}
+
+        da_instituicao = SaldoStock.instituicao_id == instituicao_id
+        query = db.session.query(
+            SaldoStock.item_id,
+            func.sum(SaldoStock.entradas - SaldoStock.saidas).label('stock_total'),
+            func.sum(case((da_instituicao, SaldoStock.entradas), else_=0)).label('entradas_instituicao'),
+            func.sum(case((da_instituicao, SaldoStock.saidas), else_=0)).label('saidas_instituicao')
+        )
+
+        if item_ids is not None:
+            query = query.filter(SaldoStock.item_id.in_(item_ids))
+
+        saldos = {}
+        for linha in query.group_by(SaldoStock.item_id).all():
+            entradas = linha.entradas_instituicao or 0
+            saidas = linha.saidas_instituicao or 0
+            saldos[linha.item_id] = {
+                'stock_total': linha.stock_total or 0,
+                'stock_instituicao': entradas - saidas,
+                'entradas_instituicao': entradas,
+                'saidas_instituicao': saidas
+            }
+
+        return saldos
+
+    @staticmethod
+    def saldo_vazio():
+        """Saldo de um item sem movimentos"""
+        return {
+            'stock_total': 0,
+            'stock_instituicao': 0,
+            'entradas_instituicao': 0,
+            'saidas_instituicao': 0
+        }
+
+    @staticmethod
+    def calcular_saldos_movimentos():
+        """
+        Recalcula os saldos a partir do registo de movimentos (incluindo os sem instituição,
+        de instituições eliminadas)
+
+        Returns:
+            dict: {(item_id, instituicao_id): {'entradas': float, 'saidas': float}}
+        """
+        linhas = db.session.query(
+            MovimentoStock.item_id,
+            MovimentoStock.instituicao_id,
+            func.sum(case(
+                (MovimentoStock.tipo_movimento == 'entrada', MovimentoStock.quantidade),
+                else_=0
+            )).label('entradas'),
+            func.sum(case(
+                (MovimentoStock.tipo_movimento == 'saida', MovimentoStock.quantidade),
+                else_=0
+            )).label('saidas')
+        ).group_by(
+            MovimentoStock.item_id,
+            MovimentoStock.instituicao_id
+        ).all()
+
+        return {
+            (linha.item_id, linha.instituicao_id): {
+                'entradas': float(linha.entradas or 0),
+                'saidas': float(linha.saidas or 0)
+            }
+            for linha in linhas
+        }
+
+    @staticmethod
+    def reconciliar(corrigir=True):
+        """
+        Compara saldos_stock com o registo de movimentos e reconstrói a tabela
+
+        Args:
+            corrigir (bool): Se True, reconstrói saldos_stock a partir dos movimentos
+
+        Returns:
+            dict: {'sucesso': bool, 'divergencias': list, 'corrigido': bool}
+        """
+        try:
+            # Bloquear escritas nos saldos enquanto se lê o registo de movimentos:
+            # transações concorrentes aplicam o seu delta depois da reconstrução
+            if corrigir and db.session.get_bind().dialect.name == 'postgresql':
+                db.session.execute(db.text('LOCK TABLE saldos_stock IN EXCLUSIVE MODE'))
+
+            esperados = SaldoService.calcular_saldos_movimentos()
+            atuais = {
+                (saldo.item_id, saldo.instituicao_id): {
+                    'entradas': float(saldo.entradas or 0),
+                    'saidas': float(saldo.saidas or 0)
+                }
+                for saldo in SaldoStock.query.all()
+            }
+
+            vazio = {'entradas': 0.0, 'saidas': 0.0}
+            divergencias = []
+            for chave in sorted(set(esperados) | set(atuais), key=lambda c: (c[0], c[1] or 0)):
+                esperado = esperados.get(chave, vazio)
+                atual = atuais.get(chave, vazio)
+
+                if (abs(esperado['entradas'] - atual['entradas']) > SaldoService.TOLERANCIA or
+                        abs(esperado['saidas'] - atual['saidas']) > SaldoService.TOLERANCIA):
+                    divergencias.append({
+                        'item_id': chave[0],
+                        'instituicao_id': chave[1],
+                        'entradas_registadas': atual['entradas'],
+                        'entradas_movimentos': esperado['entradas'],
+                        'saidas_registadas': atual['saidas'],
+                        'saidas_movimentos': esperado['saidas']
+                    })
+
+            if corrigir:
+                SaldoStock.query.delete()
+                agora = datetime.utcnow()
+                if esperados:
+                    db.session.execute(
+                        SaldoStock.__table__.insert(),
+                        [
+                            {
+                                'item_id': item_id,
+                                'instituicao_id': instituicao_id,
+                                'entradas': valores['entradas'],
+                                'saidas': valores['saidas'],
+                                'data_atualizacao': agora
+                            }
+                            for (item_id, instituicao_id), valores in esperados.items()
+                        ]
+                    )
+                db.session.commit()
+            else:
+                db.session.rollback()
+
+            return {
+                'sucesso': True,
+                'divergencias': divergencias,
+                'corrigido': corrigir
+            }
+
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'sucesso': False,
+                'erro': f'Erro ao reconciliar saldos: {str(e)}'
+            }
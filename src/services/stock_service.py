@@ -0,0 +1,83 @@
+"""
+Serviço para resumos agregados do stock de uma instituição
+"""
+
+from datetime import datetime, timedelta
+from src.models.sistema_models import db, MovimentoDiario, MovimentoStock
+from src.services.catalogo_service import CatalogoService
+from src.services.saldo_service import SaldoService
+from sqlalchemy import case, func
+
+class StockService:
+    """Serviço para resumos de stock calculados com agregação condicional"""
+
+    @staticmethod
+    def resumo_itens(instituicao_id):
+        """
+        Obtém itens ativos (do catálogo em memória) e respetivos saldos numa única consulta agrupada
+
+        Args:
+            instituicao_id (int): ID da instituição
+
+        Returns:
+            list: Tuplos (item (dict), stock_total, entradas_instituicao, saidas_instituicao)
+        """
+        itens = CatalogoService.obter().itens_ativos()
+        saldos = SaldoService.obter_saldos(instituicao_id=instituicao_id)
+        vazio = SaldoService.saldo_vazio()
+
+        resumo = []
+        for item in itens:
+            saldo = saldos.get(item['id'], vazio)
+            resumo.append((
+                item, saldo['stock_total'], saldo['entradas_instituicao'], saldo['saidas_instituicao']
+            ))
+        return resumo
+
+    @staticmethod
+    def estatisticas_movimentos(instituicao_id, dias_recentes=7):
+        """
+        Calcula contagens de movimentos da instituição numa única consulta
+
+        Os totais somam as linhas de movimentos_diarios; os movimentos recentes (últimas
+        dias_recentes x 24 horas) e os beneficiários distintos são contados com exatidão
+        no registo de movimentos, pelos índices por instituição e data / tipo.
+
+        Returns:
+            dict: {'total_movimentos', 'movimentos_recentes', 'beneficiarios_unicos_atendidos',
+                   'total_entradas', 'total_saidas'}
+        """
+        data_limite = datetime.utcnow() - timedelta(days=dias_recentes)
+
+        recentes = db.session.query(func.count(MovimentoStock.id)).filter(
+            MovimentoStock.instituicao_id == instituicao_id,
+            MovimentoStock.data >= data_limite
+        ).scalar_subquery()
+        beneficiarios_unicos = db.session.query(
+            func.count(func.distinct(MovimentoStock.beneficiario_nif))
+        ).filter(
+            MovimentoStock.instituicao_id == instituicao_id,
+            MovimentoStock.tipo_movimento == 'saida'
+        ).scalar_subquery()
+
+        linha = db.session.query(
+            func.sum(MovimentoDiario.movimentos).label('total_movimentos'),
+            recentes.label('recentes'),
+            beneficiarios_unicos.label('beneficiarios_unicos'),
+            func.sum(case(
+                (MovimentoDiario.tipo_movimento == 'entrada', MovimentoDiario.quantidade), else_=0
+            )).label('entradas'),
+            func.sum(case(
+                (MovimentoDiario.tipo_movimento == 'saida', MovimentoDiario.quantidade), else_=0
+            )).label('saidas')
+        ).filter(
+            MovimentoDiario.instituicao_id == instituicao_id
+        ).one()
+
+        return {
+            'total_movimentos': linha.total_movimentos or 0,
+            'movimentos_recentes': linha.recentes or 0,
+            'beneficiarios_unicos_atendidos': linha.beneficiarios_unicos or 0,
+            'total_entradas': linha.entradas or 0,
+            'total_saidas': linha.saidas or 0
+        }
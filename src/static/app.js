@@ -1,6 +1,8 @@
 // Estado global da aplicação
 let currentUser = null;
 let currentSection = 'dashboard';
+let eventosDashboard = null;
+let atividadesRecentes = [];
 
 // Inicialização da aplicação
 document.addEventListener('DOMContentLoaded', function() {
@@ -109,6 +111,7 @@ async function logout() {
 
 // Funções de interface
 function showLoginSection() {
+    desligarEventos();
     document.getElementById('loginSection').style.display = 'block';
     document.getElementById('mainApp').style.display = 'none';
 }
@@ -123,6 +126,7 @@ function showMainApp() {
     
     // Mostrar apenas o dashboard inicialmente
     hideAllSections();
+    ligarEventos();
 }
 
 function hideAllSections() {
@@ -164,24 +168,74 @@ function hideAlert(alertId) {
 }
 
 // Funções do dashboard
-async function loadDashboardStats() {
+// fresco: recalcular no servidor (após um registo do próprio utilizador) em vez de usar a fotografia
+async function loadDashboardStats(fresco = false) {
     try {
-        const response = await fetch('/api/dashboard/stats');
+        const response = await fetch(fresco ? '/api/dashboard/stats?fresh=1' : '/api/dashboard/stats');
         const data = await response.json();
         
         if (data.success) {
-            const stats = data.stats;
-            
-            document.getElementById('statBeneficiarios').textContent = stats.sistema.total_beneficiarios;
-            document.getElementById('statMovimentos').textContent = stats.instituicao.total_movimentos;
-            document.getElementById('statEntradas').textContent = stats.instituicao.total_entradas;
-            document.getElementById('statSaidas').textContent = stats.instituicao.total_saidas;
+            displayDashboardStats(data.stats);
         }
     } catch (error) {
         console.error('Erro ao carregar estatísticas:', error);
     }
 }
 
+function displayDashboardStats(stats) {
+    document.getElementById('statBeneficiarios').textContent = stats.sistema.total_beneficiarios;
+    document.getElementById('statMovimentos').textContent = stats.instituicao.total_movimentos;
+    document.getElementById('statEntradas').textContent = stats.instituicao.total_entradas;
+    document.getElementById('statSaidas').textContent = stats.instituicao.total_saidas;
+}
+
+// Eventos em tempo real (SSE): o servidor envia as alterações em vez de repetirmos os pedidos
+function ligarEventos() {
+    if (eventosDashboard || !window.EventSource) {
+        return;
+    }
+    
+    eventosDashboard = new EventSource('/api/dashboard/eventos');
+    
+    eventosDashboard.addEventListener('estatisticas', event => {
+        displayDashboardStats(JSON.parse(event.data));
+    });
+    
+    eventosDashboard.addEventListener('movimento', event => {
+        const atividade = JSON.parse(event.data);
+        if (currentSection !== 'relatorios') {
+            return;
+        }
+        atividadesRecentes = atividadesRecentes.filter(a => a.id !== atividade.id);
+        if (atividade.acao !== 'removido') {
+            atividadesRecentes.unshift(atividade);
+        }
+        displayRelatorios(atividadesRecentes.slice(0, 20));
+    });
+    
+    // Lotes grandes chegam resumidos; perda de eventos obriga a recarregar
+    ['movimentos', 'ressincronizar'].forEach(tipo => {
+        eventosDashboard.addEventListener(tipo, () => {
+            loadDashboardStats();
+            if (currentSection === 'relatorios') {
+                loadRelatorios();
+            }
+        });
+    });
+    
+    eventosDashboard.addEventListener('alerta', event => {
+        const alerta = JSON.parse(event.data);
+        showAlert(`${alerta.titulo}: ${alerta.mensagem}`, alerta.tipo);
+    });
+}
+
+function desligarEventos() {
+    if (eventosDashboard) {
+        eventosDashboard.close();
+        eventosDashboard = null;
+    }
+}
+
 // Funções de navegação
 function showBeneficiarios() {
     hideAllSections();
@@ -707,7 +761,7 @@ async function registarEntrada() {
             showAlert('Entrada registada com sucesso!', 'success');
             closeModal();
             loadMovimentosStock();
-            loadDashboardStats();
+            loadDashboardStats(true);
         } else {
             showAlert(data.error || 'Erro ao registar entrada', 'danger');
         }
@@ -878,7 +932,7 @@ async function registarSaida() {
             showAlert('Saída registada com sucesso!', 'success');
             closeModal();
             loadMovimentosStock();
-            loadDashboardStats();
+            loadDashboardStats(true);
         } else {
             showAlert(data.error || 'Erro ao registar saída', 'danger');
         }
@@ -974,6 +1028,7 @@ async function loadRelatorios() {
         const data = await response.json();
         
         if (data.success) {
+            atividadesRecentes = data.atividades;
             displayRelatorios(data.atividades);
         } else {
             document.getElementById('relatoriosContent').innerHTML = 
@@ -1141,7 +1196,7 @@ async function criarBeneficiario() {
             showAlert('Beneficiário criado com sucesso!', 'success');
             closeModal();
             loadBeneficiarios();
-            loadDashboardStats();
+            loadDashboardStats(true);
         } else {
             showAlert(data.error || 'Erro ao criar beneficiário', 'danger');
         }